@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Next / previous auction lookups per tenor.
+
+AuctionIndex keeps one sorted int64 array of auction times per tenor, so "when is the next
+10Y auction after this bar?" or "how many bars since the last 2Y/5Y double auction?" is a
+single np.searchsorted of all the bars against that tenor's array:
+
+    >>> index = build_auction_index(loadJPMFullAuctionTable(sFileName),
+    ...                             calendar="auctiondates/history_calendars.xlsx")
+    >>> index.next(df.index, "10Y")                  # next 10Y auction time of every bar
+    >>> index.bars_since(df.index, "double")         # bars since the last double auction day
+    >>> index.features(df.index, ["2Y", "10Y"])      # days to next / since last, per tenor
+
+Besides the tenors of schema.TENORS there are two derived keys: "any" (every auction) and
+"double" (days with more than one auction, the days calc_n_prior splits at 11:30).
+
+Auctions are stamped at 13:00, the split calc_n_prior uses, and on double auction days the
+shortest tenor at 11:30.
+"""
+
+import datetime as dt
+from typing import Iterable, Mapping, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.schema import TENORS, tenors_from_mask
+
+DERIVED = ("any", "double")
+
+# history_calendars.xlsx column of each tenor.
+CALENDAR_COLUMNS = {tenor: "ust" + tenor[:-1] for tenor in TENORS}
+
+_NAT = np.iinfo(np.int64).min
+_NS_PER_DAY = pd.Timedelta(days=1).value
+
+
+def _ns(times: Union[pd.DatetimeIndex, Iterable]) -> np.ndarray:
+    return np.asarray(pd.DatetimeIndex(times), dtype="datetime64[ns]").astype(np.int64)
+
+
+def _offset(time: Union[str, dt.time]) -> int:
+    return pd.Timedelta(str(time) + ":00" if str(time).count(":") == 1 else str(time)).value
+
+
+class AuctionIndex:
+    """
+    Sorted auction times per tenor, with vectorized next / previous / window queries.
+    """
+
+    def __init__(self, times: Mapping[str, Iterable], projected: Mapping[str, Iterable] = None):
+        """
+        :param times: Tenor -> auction timestamps. "any" and "double" are derived from them.
+        :param projected: Tenor -> timestamps that were projected rather than observed (see
+                          extend). They are included in times as well.
+        """
+        self.times = {key: np.unique(_ns(values)) for key, values in times.items() if key not in DERIVED}
+        self.projected = {key: np.unique(_ns(values)) for key, values in (projected or {}).items()}
+
+        every = np.concatenate([np.empty(0, dtype=np.int64)] + list(self.times.values()))
+        self.times["any"] = np.unique(every)
+        # Days with more than one auction, at the time of the first one.
+        order = np.argsort(every, kind="stable")
+        _, first, counts = np.unique(every[order] // _NS_PER_DAY, return_index=True, return_counts=True)
+        self.times["double"] = every[order][first[counts > 1]]
+
+    def __repr__(self) -> str:
+        counts = ", ".join(f"{key}: {len(values)}" for key, values in self.times.items())
+        return f"AuctionIndex({counts})"
+
+    @property
+    def keys(self) -> list:
+        return list(self.times)
+
+    def _get(self, tenor: str) -> np.ndarray:
+        if tenor not in self.times:
+            raise KeyError(f"No auctions for {tenor!r}, index has {self.keys}.")
+        return self.times[tenor]
+
+    # -- Construction ----------------------------------------------------------------------
+
+    @classmethod
+    def from_table(
+        cls, table: pd.DataFrame, auction_time: str = "13:00", double_time: str = "11:30"
+    ) -> "AuctionIndex":
+        """
+        :param table: Auction table indexed by date, with a bond_series column (or the
+                      tenor_mask of schema.compact_auction_table).
+        :param auction_time: Time of day of the auctions.
+        :param double_time: Time of the shortest tenor on days with more than one auction.
+        """
+        if "bond_series" in table.columns:
+            series = list(table["bond_series"])
+        else:
+            series = [tenors_from_mask(m) for m in table["tenor_mask"]]
+        days = _ns(pd.DatetimeIndex(table.index).normalize())
+        lengths = np.fromiter((len(s) for s in series), dtype=np.int64, count=len(series))
+
+        rank = {tenor: i for i, tenor in enumerate(TENORS)}
+        first = np.array([min(s, key=rank.get) if s else "" for s in series])
+        flat = np.repeat(np.arange(len(series)), lengths)
+        tenors = np.array([t for s in series for t in s])
+
+        at = days[flat] + _offset(auction_time)
+        early = (lengths[flat] > 1) & (tenors == first[flat])
+        at[early] = days[flat][early] + _offset(double_time)
+
+        return cls({tenor: at[tenors == tenor] for tenor in TENORS})
+
+    @classmethod
+    def from_calendar(
+        cls, filename: str, sheet_name: str = "Export", auction_time: str = "13:00"
+    ) -> "AuctionIndex":
+        """
+        :param filename: history_calendars.xlsx, one column of auction dates per tenor
+                         (ust2, ust3, ...).
+        :param sheet_name: Sheet with the calendar.
+        :param auction_time: Time of day of the auctions.
+        """
+        cal = pd.read_excel(filename, sheet_name=sheet_name)
+        times = {}
+        for tenor, col in CALENDAR_COLUMNS.items():
+            if col in cal.columns:
+                times[tenor] = _ns(cal[col].dropna().dt.normalize()) + _offset(auction_time)
+        return cls(times)
+
+    def combine(self, other: "AuctionIndex") -> "AuctionIndex":
+        """
+        Add the auctions of other outside the span of this index, per tenor. Inside the span
+        this index (eg. the JPM table) wins.
+        """
+        times = dict(self.times)
+        for key, values in other.times.items():
+            if key in DERIVED:
+                continue
+            mine = self.times.get(key)
+            if mine is None or len(mine) == 0:
+                times[key] = values
+                continue
+            outside = (values < mine[0] - _NS_PER_DAY) | (values > mine[-1] + _NS_PER_DAY)
+            times[key] = np.concatenate([mine, values[outside]])
+        projected = {**other.projected, **self.projected}
+        return AuctionIndex(times, projected)
+
+    def extend(self, until: Union[str, pd.Timestamp], sCalendar: str = "UST", tenors: Sequence[str] = None):
+        """
+        Project monthly auctions forward to until: each month repeats the business-day offset
+        within the month of the tenor's last auction, on the lib.qlibdate calendar. Projected
+        times are recorded in self.projected.
+        :param until: Last date to project to.
+        :param sCalendar: Calendar name understood by lib.qlibdate, eg. "UST".
+        :param tenors: Tenors to project, defaults to all tenors in the index.
+        :return: New AuctionIndex.
+        """
+        from lib.qlibdate import qlAddBusDays, qlAdjToBusDay, qlNumOfBusDays
+
+        until = pd.Timestamp(until)
+        times, projected = dict(self.times), dict(self.projected)
+        for tenor in tenors or [t for t in TENORS if t in self.times]:
+            values = self.times[tenor]
+            if not len(values):
+                continue
+            last = pd.Timestamp(values[-1])
+            time_of_day = values[-1] % _NS_PER_DAY
+            month_start = qlAdjToBusDay(last.date().replace(day=1), sCalendar)
+            offset = qlNumOfBusDays(month_start, last.date(), sCalendar)
+
+            new = []
+            month = (last + pd.offsets.MonthBegin(1)).date()
+            while pd.Timestamp(month) <= until:
+                day = qlAddBusDays(qlAdjToBusDay(month, sCalendar), offset, sCalendar)
+                if pd.Timestamp(day) <= until:
+                    new.append(pd.Timestamp(day).value + time_of_day)
+                month = (pd.Timestamp(month) + pd.offsets.MonthBegin(1)).date()
+            new = np.asarray(new, dtype=np.int64)
+            times[tenor] = np.concatenate([values, new])
+            projected[tenor] = np.concatenate([projected.get(tenor, new[:0]), new])
+        return AuctionIndex(times, projected)
+
+    # -- Queries ---------------------------------------------------------------------------
+
+    def next(self, bars, tenor: str, strict: bool = False) -> pd.DatetimeIndex:
+        """
+        :param bars: Bar timestamps.
+        :param tenor: Tenor, "any" or "double".
+        :param strict: Exclude an auction at exactly the bar time.
+        :return: Time of the next auction of each bar, NaT after the last one.
+        """
+        values = self._get(tenor)
+        pos = np.searchsorted(values, _ns(bars), side="right" if strict else "left")
+        return _take(values, pos)
+
+    def previous(self, bars, tenor: str, strict: bool = False) -> pd.DatetimeIndex:
+        """
+        :param strict: Exclude an auction at exactly the bar time.
+        :return: Time of the last auction at or before each bar, NaT before the first one.
+        """
+        values = self._get(tenor)
+        pos = np.searchsorted(values, _ns(bars), side="left" if strict else "right") - 1
+        return _take(values, pos)
+
+    def time_to_next(self, bars, tenor: str) -> pd.TimedeltaIndex:
+        return self.next(bars, tenor) - pd.DatetimeIndex(bars)
+
+    def time_since_previous(self, bars, tenor: str) -> pd.TimedeltaIndex:
+        return pd.DatetimeIndex(bars) - self.previous(bars, tenor)
+
+    def bars_since(self, bars, tenor: str) -> np.ndarray:
+        """
+        Bars since the last auction: 0 for the first bar at or after it. -1 before the first
+        auction.
+        :param bars: Sorted bar timestamps.
+        """
+        ns = _ns(bars)
+        prev = _ns(self.previous(bars, tenor))
+        # Position of the first bar at or after the previous auction.
+        since = np.arange(len(ns)) - np.searchsorted(ns, prev, side="left")
+        return np.where(prev == _NAT, -1, since)
+
+    def bars_until(self, bars, tenor: str) -> np.ndarray:
+        """
+        Bars until the next auction: 0 for the last bar before it (or at it). -1 after the
+        last auction or when the auction is after the last bar.
+        :param bars: Sorted bar timestamps.
+        """
+        ns = _ns(bars)
+        nxt = _ns(self.next(bars, tenor))
+        until = np.searchsorted(ns, nxt, side="left") - 1 - np.arange(len(ns))
+        # The next auction must be covered by the bars to count them.
+        covered = (nxt != _NAT) & (nxt <= ns.max(initial=_NAT))
+        return np.where(covered, np.maximum(until, 0), -1)
+
+    def within(
+        self, bars, tenor: str, before: Union[str, pd.Timedelta], after: Union[str, pd.Timedelta]
+    ) -> np.ndarray:
+        """
+        :param before: Window before each auction, eg. "2D".
+        :param after: Window after each auction.
+        :return: Boolean array, True for bars within [auction - before, auction + after] of
+                 any auction of the tenor.
+        """
+        ns = _ns(bars)
+        nxt = _ns(self.next(bars, tenor))
+        prev = _ns(self.previous(bars, tenor))
+        before, after = pd.Timedelta(before).value, pd.Timedelta(after).value
+        return ((nxt != _NAT) & (nxt - ns <= before)) | ((prev != _NAT) & (ns - prev <= after))
+
+    def is_projected(self, times, tenor: str) -> np.ndarray:
+        """
+        :return: True for auction times (eg. from next) that were projected by extend.
+        """
+        return np.isin(_ns(times), self.projected.get(tenor, np.empty(0, dtype=np.int64)))
+
+    def features(self, bars, tenors: Sequence[str] = TENORS) -> pd.DataFrame:
+        """
+        Days to the next and since the previous auction of each tenor, as model features.
+        :return: DataFrame indexed by bars with days_to_<tenor> and days_since_<tenor>.
+        """
+        out = {}
+        for tenor in tenors:
+            out[f"days_to_{tenor}"] = self.time_to_next(bars, tenor) / pd.Timedelta(days=1)
+            out[f"days_since_{tenor}"] = self.time_since_previous(bars, tenor) / pd.Timedelta(days=1)
+        return pd.DataFrame(out, index=pd.DatetimeIndex(bars))
+
+
+def _take(values: np.ndarray, pos: np.ndarray) -> pd.DatetimeIndex:
+    # values[pos], NaT where pos is out of range.
+    ok = (pos >= 0) & (pos < len(values))
+    out = np.full(len(pos), _NAT)
+    out[ok] = values[pos[ok]]
+    return pd.DatetimeIndex(out.astype("datetime64[ns]"))
+
+
+def build_auction_index(
+    table: pd.DataFrame = None,
+    calendar: str = None,
+    until: Union[str, pd.Timestamp] = None,
+    sCalendar: str = "UST",
+    sheet_name: str = "Export",
+) -> AuctionIndex:
+    """
+    AuctionIndex from the auction table, filled in outside the table's span from the
+    history calendar, and optionally projected forward.
+    :param table: Auction table, eg. loadJPMFullAuctionTable or auctionIngest.loadAuctionStore.
+    :param calendar: history_calendars.xlsx.
+    :param until: Project monthly auctions forward to this date (see AuctionIndex.extend).
+    :param sCalendar: Calendar for the projection.
+    :param sheet_name: Sheet of the history calendar.
+    """
+    index = None
+    if table is not None:
+        index = AuctionIndex.from_table(table)
+    if calendar is not None:
+        history = AuctionIndex.from_calendar(calendar, sheet_name)
+        index = history if index is None else index.combine(history)
+    if index is None:
+        raise ValueError("Need an auction table or a calendar.")
+    if until is not None:
+        index = index.extend(until, sCalendar)
+    return index
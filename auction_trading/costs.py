@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Transaction costs for the auction trades and the model backtest.
+
+Every time a spread position changes, each leg crosses the bid/ask and pays a commission:
+
+    cost = contracts traded * legs * (ticks * tick value * slippage(time) + commission)
+
+slippage(time) is 1 away from auctions and widens around the 13:00 auction results on
+auction days. Costs are computed on whole arrays of trade times, so they can be applied to
+calc_all_trades (cost_model=...) and encoder_trading.backtest.backtest without a loop.
+
+Costs are in dollars and are subtracted from the PnL as is, so by default the PnL must be in
+dollars too, eg. a spreads.build_spreads series traded with multiplier=1. calc_all_trades'
+default multiplier=10_000 on a price or yield spread does not give dollars; pass pnl_unit,
+the dollar value of one unit of that PnL, to convert the costs:
+
+    >>> calc_all_trades(dollar_spread, twos, n=2, multiplier=1, cost_model=CostModel())
+    >>> calc_all_trades(df["close"], twos, n=2, cost_model=CostModel(pnl_unit=dollars_per_unit))
+"""
+
+from typing import Callable, Iterable, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# 13:00, when auction results are released.
+AUCTION_MINUTE = 13 * 60
+
+
+def auction_slippage(
+    minutes: np.ndarray,
+    auction_day: np.ndarray,
+    widening: float = 2.0,
+    width: float = 45.0,
+    peak: int = AUCTION_MINUTE,
+) -> np.ndarray:
+    """
+    Default time-of-day slippage curve: 1 everywhere, plus a bump of height widening centred
+    on the auction on auction days.
+    :param minutes: Minutes since midnight of each trade.
+    :param auction_day: Whether each trade is on an auction day.
+    :param widening: Extra multiple of the tick cost at the peak.
+    :param width: Width (standard deviation) of the bump in minutes.
+    :param peak: Minute of the day of the peak.
+    :return: Multiplier of the tick cost for each trade.
+    """
+    bump = widening * np.exp(-0.5 * ((np.asarray(minutes, dtype=float) - peak) / width) ** 2)
+    return 1.0 + np.where(auction_day, bump, 0.0)
+
+
+class CostModel:
+    """
+    Tick, commission and slippage costs of trading a spread.
+    """
+
+    def __init__(
+        self,
+        tick_value: float = 15.625,
+        ticks: float = 0.5,
+        commission: float = 2.0,
+        n_legs: int = 2,
+        contracts: float = 1,
+        slippage: Callable[[np.ndarray, np.ndarray], np.ndarray] = auction_slippage,
+        pnl_unit: float = 1.0,
+    ):
+        """
+        :param tick_value: Dollars per tick per contract, eg. 15.625 for a 1/64 TY tick.
+        :param ticks: Ticks paid per leg per trade, ie. half the bid/ask in ticks.
+        :param commission: Dollars per contract per leg per trade.
+        :param n_legs: Number of legs in the spread.
+        :param contracts: Contracts per leg of one unit of the spread.
+        :param slippage: f(minutes, auction_day) -> tick cost multiplier, or None for a flat
+                         tick cost.
+        :param pnl_unit: Dollars per unit of the PnL the costs are subtracted from. 1 for
+                         dollar PnL; for calc_all_trades with multiplier=10_000 on a spread
+                         that is not in dollars, the dollar value of one unit of that PnL.
+        """
+        self.tick_value = tick_value
+        self.ticks = ticks
+        self.commission = commission
+        self.n_legs = n_legs
+        self.contracts = contracts
+        self.slippage = slippage
+        if pnl_unit <= 0:
+            raise ValueError("pnl_unit must be positive.")
+        self.pnl_unit = pnl_unit
+
+    def unit_cost(
+        self, times: Union[pd.DatetimeIndex, Sequence], auction_days: Iterable = None
+    ) -> np.ndarray:
+        """
+        Cost of trading one unit of the spread at each time.
+        :param times: Trade timestamps.
+        :param auction_days: Auction dates, the slippage curve only widens on these days.
+        :return: Array of costs in PnL units (dollars / pnl_unit), NaN where the time is
+                 missing.
+        """
+        times = pd.DatetimeIndex(times)
+        multiplier = 1.0
+        if self.slippage is not None:
+            minutes = times.hour * 60 + times.minute
+            if auction_days is None:
+                auction_day = np.zeros(len(times), dtype=bool)
+            else:
+                days = pd.DatetimeIndex(auction_days).normalize().values
+                auction_day = np.isin(times.normalize().values, days)
+            multiplier = self.slippage(np.asarray(minutes), auction_day)
+        cost = self.contracts * self.n_legs * (self.ticks * self.tick_value * multiplier + self.commission)
+        cost = cost / self.pnl_unit
+        cost = np.broadcast_to(cost, (len(times),)).astype(float)
+        return np.where(times.isna(), np.nan, cost)
+
+    def position_costs(
+        self, positions: np.ndarray, times: Union[pd.DatetimeIndex, Sequence], auction_days: Iterable = None
+    ) -> np.ndarray:
+        """
+        Cost of moving into each position from the previous one, starting flat.
+        :param positions: Units of the spread held after each time, eg. sign(pred).
+        :param times: Timestamps of the positions.
+        :param auction_days: Auction dates, see unit_cost.
+        :return: Cost paid at each time.
+        """
+        traded = np.abs(np.diff(np.asarray(positions, dtype=float), prepend=0.0))
+        return traded * self.unit_cost(times, auction_days)
+
+    def auction_costs(
+        self, trades: pd.DataFrame, pre_sides: Sequence[str], post_sides: Sequence[str]
+    ) -> pd.DataFrame:
+        """
+        Costs of the trades from calc_all_trades: entering the pre-auction leg, the flip at
+        the split and exiting the post-auction leg. The flip costs two trades, unless the
+        pre- and post-auction legs are the same trade at the same time, in which case the
+        position is simply held.
+        :param trades: Output of calc_all_trades.
+        :param pre_sides: "steepener"/"flattener" of the pre-auction leg of each trade.
+        :param post_sides: Same for the post-auction leg.
+        :return: DataFrame with "Pre-Auction Cost" and "Post-Auction Cost".
+        """
+        days = trades.index
+        enter_pre = self.unit_cost(trades["Enter at Pre-Auction Time"], days)
+        exit_pre = self.unit_cost(trades["Exit at Pre-Auction Time"], days)
+        enter_post = self.unit_cost(trades["Enter at Post-Auction Time"], days)
+        exit_post = self.unit_cost(trades["Exit at Post-Auction Time"], days)
+
+        held = (np.asarray(pre_sides) == np.asarray(post_sides)) & (
+            pd.DatetimeIndex(trades["Exit at Pre-Auction Time"]).values
+            == pd.DatetimeIndex(trades["Enter at Post-Auction Time"]).values
+        )
+        return pd.DataFrame(
+            {
+                "Pre-Auction Cost": enter_pre + np.where(held, 0.0, exit_pre),
+                "Post-Auction Cost": np.where(held, 0.0, enter_post) + exit_post,
+            },
+            index=trades.index,
+        )
+
+    def apply_to_trades(
+        self, trades: pd.DataFrame, pre_sides: Sequence[str], post_sides: Sequence[str]
+    ) -> pd.DataFrame:
+        """
+        Subtract auction_costs from the PnL columns of calc_all_trades, keeping the costs as
+        extra columns.
+        """
+        costs = self.auction_costs(trades, pre_sides, post_sides)
+        out = trades.copy()
+        out["Pre-Auction PnL"] = out["Pre-Auction PnL"] - costs["Pre-Auction Cost"]
+        out["Post-Auction PnL"] = out["Post-Auction PnL"] - costs["Post-Auction Cost"]
+        return pd.concat([out, costs], axis=1)
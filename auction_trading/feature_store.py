@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Append-only feature store, partitioned by contract and month.
+
+The flat CSVs (GetTechnicals/*.csv, data/qm_data_*.csv, transformers/*.csv) are rewritten
+whole on every refresh and read whole on every load. FeatureStore keeps each contract as
+column chunks instead:
+
+    root/<contract>/_schema.json              column names, index name
+    root/<contract>/_parts.json               one entry per part: month, rows, first/last bar
+    root/<contract>/<YYYY-MM>/<part>.time.npy int64 nanosecond timestamps, sorted
+    root/<contract>/<YYYY-MM>/<part>.c<k>.npy column k of the schema
+
+- append writes new bars as new parts, one per month touched, and never rewrites existing
+  files. Bars at or before the last stored bar are skipped, so re-appending a refreshed CSV
+  only adds the new bars. The manifest is replaced atomically after the part files are
+  written, so a failed append leaves the store as it was.
+- read prunes parts by their first/last bar (time range) and only opens the requested
+  columns (projection). Parts are memory-mapped, so only the selected rows are read.
+- auction_windows reads just the calc_n_prior windows of a set of auctions, which can be
+  passed straight to calc_all_trades. read(..., lookback=seq_size) adds the bars needed for
+  the first window of to_sequences.
+
+There is no pyarrow / parquet dependency, everything is numpy .npy files and JSON.
+
+    >>> store = FeatureStore("feature_store")
+    >>> store.append_csv("TY", "data/qm_data_TY.csv", na_values=["-1"])
+    >>> store.append("TY", new_bars)                      # live refresh
+    >>> df = store.read("TY", "2022-01-01", "2022-06-30", columns=["target", "rsi"])
+    >>> spread = store.auction_windows("tufv", twos, n=2, columns=["close"])["close"]
+    >>> calc_all_trades(spread, twos, 2)
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.instrumentation import count, timed
+from auction_trading.integrity import window_bounds
+from auction_trading.schema import compact_frame, signal_na_values
+from auction_trading.utils import Number
+
+_SCHEMA_FILE = "_schema.json"
+_PARTS_FILE = "_parts.json"
+
+TimeLike = Union[str, pd.Timestamp, np.datetime64, None]
+
+
+def _to_ns(t: TimeLike, default: int) -> int:
+    return default if t is None else pd.Timestamp(t).value
+
+
+def _ns_array(values: Sequence) -> np.ndarray:
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64)
+    return pd.DatetimeIndex(values).asi8
+
+
+def _write_json(path: str, obj) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _save_npy(path: str, values: np.ndarray) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp, path)
+
+
+def _column_array(values: pd.Series) -> np.ndarray:
+    # Nullable signal columns (Int8 with gaps) have no .npy form: store them as float32 + NaN.
+    if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.hasnans:
+        return values.to_numpy(np.float32, na_value=np.nan)
+    return values.to_numpy(values.dtype.numpy_dtype if hasattr(values.dtype, "numpy_dtype") else None)
+
+
+def _merge_ranges(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Union of inclusive [start, end] ranges, sorted and non-overlapping.
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > np.maximum.accumulate(ends)[:-1]
+    return starts[new], np.maximum.reduceat(ends, np.flatnonzero(new))
+
+
+class FeatureStore:
+    """
+    Local store of bar data and features, one directory per contract.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: Store directory, created if missing.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    # ------------------------------------------------------------------ metadata
+
+    def contracts(self) -> List[str]:
+        return sorted(
+            d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, _PARTS_FILE))
+        )
+
+    def _dir(self, contract: str) -> str:
+        return os.path.join(self.root, contract)
+
+    def _schema(self, contract: str) -> Dict:
+        path = os.path.join(self._dir(contract), _SCHEMA_FILE)
+        if not os.path.exists(path):
+            return {"index": None, "columns": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _parts(self, contract: str) -> List[Dict]:
+        path = os.path.join(self._dir(contract), _PARTS_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def columns(self, contract: str) -> List[str]:
+        return list(self._schema(contract)["columns"])
+
+    def info(self, contract: str) -> pd.DataFrame:
+        """
+        :return: One row per month: number of parts, bars, first and last bar.
+        """
+        parts = pd.DataFrame(
+            self._parts(contract), columns=["month", "part", "rows", "min", "max", "columns"]
+        )
+        out = parts.groupby("month").agg(
+            parts=("part", "size"), rows=("rows", "sum"), first=("min", "min"), last=("max", "max")
+        )
+        out["first"] = pd.to_datetime(out["first"])
+        out["last"] = pd.to_datetime(out["last"])
+        return out
+
+    def last_bar(self, contract: str) -> pd.Timestamp:
+        """
+        :return: Time of the last stored bar, NaT for an empty contract.
+        """
+        parts = self._parts(contract)
+        return pd.Timestamp(max(p["max"] for p in parts)) if parts else pd.NaT
+
+    # ------------------------------------------------------------------ writes
+
+    @timed()
+    def append(self, contract: str, frame: Union[pd.DataFrame, pd.Series], overlap: str = "skip") -> int:
+        """
+        Append new bars. Existing parts are never modified.
+        :param contract: Contract name, eg. "TY" or "tufv".
+        :param frame: Bars with a DatetimeIndex. Columns not seen before are added to the
+                      schema; older bars read them as NaN.
+        :param overlap: What to do with bars at or before the last stored bar: "skip" them
+                        (already stored) or raise an "error".
+        :return: Number of bars written.
+        """
+        if overlap not in ("skip", "error"):
+            raise ValueError(f"Unknown overlap {overlap!r}, expected 'skip' or 'error'.")
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame()
+        frame = frame[pd.DatetimeIndex(frame.index).notna()]
+        frame = frame.sort_index(kind="stable")
+        times = pd.DatetimeIndex(frame.index).asi8
+
+        parts = self._parts(contract)
+        if parts:
+            last = max(p["max"] for p in parts)
+            old = times <= last
+            if old.any() and overlap == "error":
+                raise ValueError(f"{old.sum()} bars of {contract} are at or before the last stored bar.")
+            frame, times = frame[~old], times[~old]
+        if len(frame) == 0:
+            return 0
+
+        directory = self._dir(contract)
+        os.makedirs(directory, exist_ok=True)
+        schema = self._schema(contract)
+        schema["index"] = schema["index"] or frame.index.name
+        for col in map(str, frame.columns):
+            if col not in schema["columns"]:
+                schema["columns"].append(col)
+        position = {col: k for k, col in enumerate(schema["columns"])}
+
+        # One part per month, at the month boundaries of the sorted times.
+        months = times.astype("datetime64[ns]").astype("datetime64[M]")
+        starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        ends = np.r_[starts[1:], len(times)]
+        next_id = max((int(p["part"].split("-")[1]) for p in parts), default=-1) + 1
+
+        new_parts = []
+        for i, (lo, hi) in enumerate(zip(starts, ends)):
+            month = str(months[lo])
+            part = f"part-{next_id + i:06d}"
+            os.makedirs(os.path.join(directory, month), exist_ok=True)
+            base = os.path.join(directory, month, part)
+            _save_npy(base + ".time.npy", times[lo:hi])
+            for col, values in frame.items():
+                _save_npy(f"{base}.c{position[str(col)]}.npy", _column_array(values)[lo:hi])
+            new_parts.append(
+                {
+                    "month": month,
+                    "part": part,
+                    "rows": int(hi - lo),
+                    "min": int(times[lo]),
+                    "max": int(times[hi - 1]),
+                    "columns": sorted(position[str(col)] for col in frame.columns),
+                }
+            )
+            count("feature_store_parts")
+
+        # Schema first: it only ever grows, so it is valid for the old manifest too.
+        _write_json(os.path.join(directory, _SCHEMA_FILE), schema)
+        _write_json(os.path.join(directory, _PARTS_FILE), parts + new_parts)
+        return int(len(frame))
+
+    @timed()
+    def append_csv(
+        self,
+        contract: str,
+        filename: str,
+        date_col: str = "Date",
+        chunksize: int = 500_000,
+        float_dtype: str = "float32",
+        **read_kwargs,
+    ) -> int:
+        """
+        Append a CSV export (qm_data, transformer_data, GetTechnicals) in chunks, without
+        loading the whole file. Dtypes as in auction_trading.schema.
+        :param date_col: Timestamp column, "Date" for qm_data, "date" for transformer_data.
+        :param chunksize: Rows read at a time.
+        :param read_kwargs: Passed to pd.read_csv, eg. na_values=["-1"] (not applied to the
+                            signal columns).
+        :return: Number of bars written.
+        """
+        header = pd.read_csv(filename, nrows=0, index_col=False).columns
+        columns = [c for c in header if c != date_col and not str(c).startswith("Unnamed")]
+        if "na_values" in read_kwargs:
+            read_kwargs["na_values"] = signal_na_values(columns, read_kwargs["na_values"])
+        reader = pd.read_csv(
+            filename,
+            usecols=[date_col] + columns,
+            dtype={c: float_dtype for c in columns},
+            index_col=False,
+            chunksize=chunksize,
+            **read_kwargs,
+        )
+        written = 0
+        for chunk in reader:
+            chunk.index = pd.DatetimeIndex(pd.to_datetime(chunk.pop(date_col)), name=date_col)
+            written += self.append(contract, compact_frame(chunk[chunk.index.notna()], float_dtype))
+        return written
+
+    def compact(self, contract: str, months: Iterable[str] = None) -> int:
+        """
+        Merge the parts of each month into one, eg. after many small live appends. This is
+        the only operation that rewrites data. The manifest is switched to the merged parts
+        before the old files are deleted, so run it when no read is in progress.
+        :param months: Months to compact ("YYYY-MM"), defaults to all with several parts.
+        :return: Number of months compacted.
+        """
+        parts = self._parts(contract)
+        by_month = {}
+        for p in parts:
+            by_month.setdefault(p["month"], []).append(p)
+        months = [m for m in (months or by_month) if len(by_month.get(m, [])) > 1]
+        if not months:
+            return 0
+
+        directory = self._dir(contract)
+        columns = self.columns(contract)
+        next_id = max(int(p["part"].split("-")[1]) for p in parts) + 1
+        replaced = []
+        for i, month in enumerate(months):
+            old = by_month[month]
+            frame = self._read_parts(contract, old, None, None, columns, mmap=False)
+            frame = frame.dropna(axis=1, how="all")
+            part = f"part-{next_id + i:06d}"
+            base = os.path.join(directory, month, part)
+            _save_npy(base + ".time.npy", frame.index.asi8)
+            for col, values in frame.items():
+                _save_npy(f"{base}.c{columns.index(col)}.npy", _column_array(values))
+            merged = {
+                "month": month,
+                "part": part,
+                "rows": int(len(frame)),
+                "min": int(frame.index.asi8[0]),
+                "max": int(frame.index.asi8[-1]),
+                "columns": sorted(columns.index(col) for col in frame.columns),
+            }
+            parts = [p for p in parts if p not in old]
+            parts.append(merged)
+            replaced.extend(old)
+
+        parts.sort(key=lambda p: (p["min"], p["part"]))
+        _write_json(os.path.join(directory, _PARTS_FILE), parts)
+        for p in replaced:
+            for name in os.listdir(os.path.join(directory, p["month"])):
+                if name.startswith(p["part"] + "."):
+                    os.remove(os.path.join(directory, p["month"], name))
+        return len(months)
+
+    # ------------------------------------------------------------------ reads
+
+    def _load(self, contract: str, part: Dict, suffix: str, mmap: bool) -> np.ndarray:
+        path = os.path.join(self._dir(contract), part["month"], f"{part['part']}.{suffix}.npy")
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    def _read_parts(
+        self,
+        contract: str,
+        parts: Sequence[Dict],
+        starts: Union[np.ndarray, None],
+        ends: Union[np.ndarray, None],
+        columns: Sequence[str],
+        mmap: bool = True,
+    ) -> pd.DataFrame:
+        # Rows of the parts within any of the inclusive [starts, ends] ranges (all rows if
+        # starts is None).
+        schema = self._schema(contract)
+        position = {col: k for k, col in enumerate(schema["columns"])}
+        times, values = [], {col: [] for col in columns}
+        for part in parts:
+            t = self._load(contract, part, "time", mmap)
+            if starts is None:
+                rows = slice(None)
+            else:
+                lo = np.searchsorted(t, starts, "left")
+                hi = np.searchsorted(t, ends, "right")
+                keep = hi > lo
+                if not keep.any():
+                    continue
+                lo, hi = lo[keep], hi[keep]
+                # One contiguous slice per range, concatenated.
+                rows = (
+                    np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+                    if len(lo) > 1
+                    else slice(lo[0], hi[0])
+                )
+            times.append(np.asarray(t[rows]))
+            n = len(times[-1])
+            for col in columns:
+                k = position[col]
+                if k in part["columns"]:
+                    values[col].append(np.asarray(self._load(contract, part, f"c{k}", mmap)[rows]))
+                else:
+                    values[col].append(np.full(n, np.nan, dtype=np.float32))
+        count("feature_store_parts_read", len(times))
+
+        index = pd.DatetimeIndex(
+            np.concatenate(times).astype("datetime64[ns]") if times else np.array([], dtype="datetime64[ns]"),
+            name=schema["index"],
+        )
+        data = {col: np.concatenate(v) if v else np.array([], dtype=np.float32) for col, v in values.items()}
+        return pd.DataFrame(data, index=index, columns=list(columns))
+
+    def _select(self, contract: str, columns: Sequence[str]) -> List[str]:
+        available = self.columns(contract)
+        if columns is None:
+            return available
+        if isinstance(columns, str):
+            columns = [columns]
+        missing = [c for c in columns if c not in available]
+        if missing:
+            raise KeyError(f"Columns {missing} not in the {contract} store.")
+        return list(columns)
+
+    def _lookback_start(self, contract: str, parts: List[Dict], start: int, lookback: int) -> int:
+        # Time of the lookback-th bar before start, scanning parts backwards.
+        remaining = lookback
+        for part in sorted((p for p in parts if p["min"] < start), key=lambda p: p["min"], reverse=True):
+            t = self._load(contract, part, "time", True)
+            before = int(np.searchsorted(t, start, "left"))
+            if remaining <= before:
+                return int(t[before - remaining])
+            remaining -= before
+        return np.iinfo(np.int64).min
+
+    @timed()
+    def read(
+        self,
+        contract: str,
+        start: TimeLike = None,
+        end: TimeLike = None,
+        columns: Sequence[str] = None,
+        lookback: int = 0,
+        mmap: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Bars of one contract in [start, end], both inclusive.
+        :param start: First bar time, defaults to the first bar.
+        :param end: Last bar time, defaults to the last bar.
+        :param columns: Columns to read, defaults to all.
+        :param lookback: Extra bars before start, eg. seq_size so that the first
+                         to_sequences window ends at start.
+        :param mmap: Memory-map the part files instead of reading them.
+        :return: DataFrame indexed by bar time.
+        """
+        columns = self._select(contract, columns)
+        parts = self._parts(contract)
+        lo = _to_ns(start, np.iinfo(np.int64).min)
+        hi = _to_ns(end, np.iinfo(np.int64).max)
+        if lookback and start is not None:
+            lo = self._lookback_start(contract, parts, lo, lookback)
+
+        selected = [p for p in parts if p["max"] >= lo and p["min"] <= hi]
+        return self._read_parts(contract, selected, np.array([lo]), np.array([hi]), columns, mmap)
+
+    @timed()
+    def read_ranges(
+        self,
+        contract: str,
+        starts: Sequence,
+        ends: Sequence,
+        columns: Sequence[str] = None,
+        mmap: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Bars within any of the inclusive [starts[i], ends[i]] ranges, each bar once.
+        :param starts: Range starts, timestamps or int64 nanoseconds.
+        :param ends: Range ends.
+        """
+        columns = self._select(contract, columns)
+        starts, ends = _merge_ranges(_ns_array(starts), _ns_array(ends))
+
+        parts = []
+        for p in self._parts(contract):
+            # Ranges are sorted and disjoint: the last one starting before the part ends is
+            # the only one that can reach into it.
+            k = np.searchsorted(starts, p["max"], "right")
+            if k and ends[k - 1] >= p["min"]:
+                parts.append(p)
+        return self._read_parts(contract, parts, starts, ends, columns, mmap)
+
+    def auction_windows(
+        self,
+        contract: str,
+        auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+        n: Union[Tuple[Number, Number], Number],
+        columns: Sequence[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Only the bars in the calc_n_prior windows of the given auctions. calc_all_trades on
+        the result gives the same trades as on the full history.
+        :param auction_dates: Auction dates or auction table, as for calc_all_trades.
+        :param n: Days before/after, as for calc_all_trades.
+        """
+        pre_start, pre_end, post_start, post_end = window_bounds(auction_dates, n)
+        starts = np.minimum(pre_start, post_start)
+        ends = np.maximum(pre_end, post_end)
+        return self.read_ranges(contract, starts, ends, columns)
+
+    def read_many(
+        self,
+        contracts: Sequence[str],
+        start: TimeLike = None,
+        end: TimeLike = None,
+        columns: Sequence[str] = None,
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        read for several contracts, as a dict like schema.load_all_qm_data.
+        """
+        return {contract: self.read(contract, start, end, columns) for contract in contracts}
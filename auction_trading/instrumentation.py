@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Lightweight timers and counters for the backtest stack.
+
+Instrumentation is off by default and costs a single flag check per call. Switch it on with
+the environment variable AUCTION_TRADING_PROFILE=1 (or enable() from a notebook), run the
+sweep, then look at report():
+
+    >>> from auction_trading import instrumentation
+    >>> instrumentation.enable()
+    >>> calc_all_trades(spread, fives, (2, 2))
+    >>> instrumentation.report()
+
+Setting AUCTION_TRADING_PROFILE_DIR additionally captures a cProfile (or pyinstrument, with
+AUCTION_TRADING_PROFILER=pyinstrument) profile of every sweep job wrapped in profile_job().
+"""
+
+import cProfile
+import functools
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+ENV_VAR = "AUCTION_TRADING_PROFILE"
+PROFILE_DIR_ENV_VAR = "AUCTION_TRADING_PROFILE_DIR"
+PROFILER_ENV_VAR = "AUCTION_TRADING_PROFILER"
+
+_enabled = os.environ.get(ENV_VAR, "").lower() not in ("", "0", "false", "no")
+
+# Stage name -> [call count, total wall time in seconds].
+_timings: Dict[str, List] = {}
+# Counter name -> count.
+_counters: Dict[str, int] = {}
+
+
+def is_enabled() -> bool:
+    """
+    :return: True if timers and counters are recording.
+    """
+    return _enabled
+
+
+def enable(flag: bool = True) -> None:
+    """
+    Switch instrumentation on (or off with flag=False) at runtime.
+    """
+    global _enabled
+    _enabled = flag
+
+
+def reset() -> None:
+    """
+    Clear all recorded timings and counters.
+    """
+    _timings.clear()
+    _counters.clear()
+
+
+def _record(stage: str, elapsed: float) -> None:
+    entry = _timings.get(stage)
+    if entry is None:
+        _timings[stage] = [1, elapsed]
+    else:
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage: str):
+    """
+    Context manager timing the enclosed block under the given stage name. Returns a shared
+    no-op context manager when instrumentation is disabled.
+    :param stage: Stage name, eg. "calc_n_prior" or "model.fit".
+    """
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+
+def timed(stage: str = None) -> Callable:
+    """
+    Decorator timing every call of the wrapped function.
+    :param stage: Stage name. Defaults to the function name.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Increment a counter, eg. the number of auctions or rows processed.
+    """
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report() -> pd.DataFrame:
+    """
+    Per-stage wall time and call counts, sorted by total time. Counters are reported with
+    their count in the "calls" column and no timings.
+    :return: DataFrame indexed by stage name.
+    """
+    rows = {
+        stage: {"calls": calls, "total_s": total, "mean_s": total / calls}
+        for stage, (calls, total) in _timings.items()
+    }
+    df = pd.DataFrame.from_dict(rows, orient="index", columns=["calls", "total_s", "mean_s"])
+    df = df.sort_values("total_s", ascending=False)
+    counters = pd.DataFrame.from_dict(
+        {name: {"calls": n} for name, n in _counters.items()},
+        orient="index",
+        columns=["calls", "total_s", "mean_s"],
+    )
+    return pd.concat([df, counters]) if len(counters) else df
+
+
+@contextmanager
+def profile_job(name: str, output_dir: str = None, profiler: str = None):
+    """
+    Capture a profile of a single sweep job. Does nothing unless an output directory is given
+    or AUCTION_TRADING_PROFILE_DIR is set.
+    :param name: Job name, used for the output filename.
+    :param output_dir: Directory to write the profile to.
+    :param profiler: "cprofile" (default, writes .prof) or "pyinstrument" (writes .html).
+    """
+    output_dir = output_dir or os.environ.get(PROFILE_DIR_ENV_VAR)
+    if not output_dir:
+        yield
+        return
+
+    profiler = (profiler or os.environ.get(PROFILER_ENV_VAR, "cprofile")).lower()
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(
+        output_dir, f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}_{os.getpid()}_{time.time_ns()}"
+    )
+
+    if profiler == "pyinstrument":
+        # Optional dependency, only needed when asked for.
+        from pyinstrument import Profiler
+
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            with open(stem + ".html", "w") as f:
+                f.write(prof.output_html())
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(stem + ".prof")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Load-time integrity checks for the intraday files.
+
+calc_n_prior slices whatever bars exist in an auction window, so a gap silently shortens
+(or empties) the window and calc_single_trade then prices the trade off the wrong bars.
+This module indexes the data once, with array operations only:
+
+- missing_bitmap: which bars of the expected session grid are missing from a file.
+- duplicated_bars / alignment_report: duplicate timestamps and bars that one file has and
+  another does not (eg. qm_data_tufv.csv starts two days late).
+- lag_report: leading (and interior) empty cells of the d11..d110 lag columns.
+- auction_coverage: bars present vs expected in each auction's pre- and post-auction
+  window, with the same windows as calc_n_prior, so sweeps can skip or flag bad windows:
+
+    >>> cov = auction_coverage(df.index, fives, (2, 2), grid=expected_grid(df.index))
+    >>> calc_all_trades(df["Spread"], fives[cov["ok"].values], (2, 2))
+"""
+
+import re
+from typing import Dict, Iterable, Mapping, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.sessions import grid_minutes, session_days
+from auction_trading.utils import Number
+
+_NS_PER_MINUTE = 60 * 10**9
+_NS_PER_DAY = 24 * 60 * _NS_PER_MINUTE
+
+# Lag columns of the GetTechnicals notebooks, d1<lag>.
+LAG_COLUMNS = re.compile(r"^d1(\d+)$")
+
+
+def _ns(index: Union[pd.DatetimeIndex, Iterable]) -> np.ndarray:
+    return np.asarray(pd.DatetimeIndex(index), dtype="datetime64[ns]").astype(np.int64)
+
+
+def infer_times(index: pd.DatetimeIndex, min_share: float = 0.5) -> np.ndarray:
+    """
+    Session grid of a file: the times of day present on at least min_share of its days.
+    :return: Sorted minutes since midnight, as sessions.grid_minutes.
+    """
+    ns = _ns(index)
+    day = ns // _NS_PER_DAY
+    minute = (ns - day * _NS_PER_DAY) // _NS_PER_MINUTE
+    n_days = len(np.unique(day))
+    minutes, counts = np.unique(minute, return_counts=True)
+    return minutes[counts >= min_share * n_days]
+
+
+def expected_grid(
+    index: pd.DatetimeIndex, times: Iterable = None, sCalendar: str = None, start=None, end=None
+) -> pd.DatetimeIndex:
+    """
+    Every bar a file should have: each time of the grid on each session day.
+    :param index: Bars of the file (used for the date range and to infer the times).
+    :param times: Grid times, see sessions.grid_minutes. Inferred from the file if None.
+    :param sCalendar: Calendar for the session days, eg. "UST". Weekdays if None.
+    :param start: First day, defaults to the first bar.
+    :param end: Last day, defaults to the last bar.
+    :return: Expected bar timestamps between the first and last bar of the file.
+    """
+    minutes = infer_times(index) if times is None else grid_minutes(times)
+    start = pd.Timestamp(start if start is not None else index.min()).normalize()
+    end = pd.Timestamp(end if end is not None else index.max()).normalize()
+    if sCalendar is not None:
+        days = session_days(start, end, sCalendar).astype("datetime64[ns]").astype(np.int64)
+    else:
+        days = pd.bdate_range(start, end).values.astype(np.int64)
+    grid = (days[:, None] + minutes[None, :] * _NS_PER_MINUTE).ravel()
+    # Trim to the span of the file, the first and last days may be partial.
+    grid = grid[(grid >= _ns([index.min()])[0]) & (grid <= _ns([index.max()])[0])]
+    return pd.DatetimeIndex(grid)
+
+
+def missing_bitmap(index: pd.DatetimeIndex, grid: pd.DatetimeIndex) -> np.ndarray:
+    """
+    :return: Boolean array over the grid, True where the bar is missing from index.
+    """
+    return ~np.isin(_ns(grid), _ns(index))
+
+
+def off_grid(index: pd.DatetimeIndex, grid: pd.DatetimeIndex) -> np.ndarray:
+    """
+    :return: Boolean array over index, True for bars that are not on the grid.
+    """
+    return ~np.isin(_ns(index), _ns(grid))
+
+
+def duplicated_bars(index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    :return: Boolean array over index, True for every bar whose timestamp appears more than
+             once (all copies, not only the later ones).
+    """
+    return pd.DatetimeIndex(index).duplicated(keep=False)
+
+
+def lag_report(df: pd.DataFrame, pattern: re.Pattern = LAG_COLUMNS) -> pd.DataFrame:
+    """
+    Leading and interior empty cells of the lag columns. Lag k should start with exactly k
+    empty cells (or none, if the file was trimmed) and have none after that.
+    :param df: Feature frame, in time order.
+    :return: DataFrame per lag column with lag, leading_nan, interior_nan and ok.
+    """
+    cols = [c for c in df.columns if pattern.match(str(c))]
+    if not cols:
+        return pd.DataFrame(columns=["lag", "leading_nan", "interior_nan", "ok"])
+    isna = df[cols].isna().values
+    # Leading run length: position of the first non-missing cell.
+    any_valid = (~isna).any(axis=0)
+    leading = np.where(any_valid, np.argmax(~isna, axis=0), len(df))
+    interior = isna.sum(axis=0) - leading
+    lags = np.array([int(pattern.match(str(c)).group(1)) for c in cols])
+    report = pd.DataFrame(
+        {"lag": lags, "leading_nan": leading, "interior_nan": interior},
+        index=cols,
+    )
+    report["ok"] = ((report["leading_nan"] == report["lag"]) | (report["leading_nan"] == 0)) & (
+        report["interior_nan"] == 0
+    )
+    return report
+
+
+def alignment_report(
+    frames: Mapping[str, Union[pd.DataFrame, pd.Series]]
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compare the bars of several files, eg. all qm_data files.
+    :param frames: Name -> frame with a DatetimeIndex.
+    :return: Tuple of (summary per file, boolean presence matrix on the union of all bars).
+    """
+    indexes = {name: pd.DatetimeIndex(f.index) for name, f in frames.items()}
+    union = np.unique(np.concatenate([_ns(idx) for idx in indexes.values()]))
+    present = pd.DataFrame(
+        {name: np.isin(union, _ns(idx)) for name, idx in indexes.items()}, index=pd.DatetimeIndex(union)
+    )
+    in_all = present.all(axis=1).values
+    summary = pd.DataFrame(
+        {
+            "bars": [len(idx) for idx in indexes.values()],
+            "unique_bars": [idx.nunique() for idx in indexes.values()],
+            "duplicates": [int(idx.duplicated().sum()) for idx in indexes.values()],
+            "first": [idx.min() for idx in indexes.values()],
+            "last": [idx.max() for idx in indexes.values()],
+            "missing_vs_union": [int((~present[name].values).sum()) for name in indexes],
+            "not_in_all": [int((present[name].values & ~in_all).sum()) for name in indexes],
+        },
+        index=list(indexes),
+    )
+    return summary, present
+
+
+def window_bounds(
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame], n: Union[Tuple[Number, Number], Number]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pre- and post-auction windows of calc_n_prior for all auctions at once, including the
+    11:29:59 / 12:59:59 split of double (2Y and 5Y) auctions.
+    :return: int64 nanosecond arrays (pre_start, pre_end, post_start, post_end), inclusive.
+    """
+    if isinstance(auction_dates, pd.DataFrame):
+        days = _ns(pd.DatetimeIndex(auction_dates.index).normalize())
+        double = np.fromiter((len(b) == 2 for b in auction_dates["bond_series"]), dtype=bool, count=len(days))
+    else:
+        days = _ns(pd.DatetimeIndex(list(auction_dates)).normalize())
+        double = np.zeros(len(days), dtype=bool)
+
+    split = days + pd.Timedelta(hours=12, minutes=59, seconds=59).value
+    morning = days + pd.Timedelta(hours=11, minutes=29, seconds=59).value
+    if isinstance(n, tuple):
+        n_prev, n_post = (pd.Timedelta(days=x).value for x in n)
+        symmetric = False
+    else:
+        n_prev = n_post = pd.Timedelta(days=n).value
+        symmetric = True
+
+    pre_end = np.where(double, morning, split)
+    pre_start = pre_end - n_prev
+    post_start = np.where(double & symmetric, split - n_post, split)
+    post_end = np.where(double & symmetric, split, split + n_post)
+    return pre_start, pre_end, post_start, post_end
+
+
+def _count_in(sorted_ns: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    return np.searchsorted(sorted_ns, end, side="right") - np.searchsorted(sorted_ns, start, side="left")
+
+
+def auction_coverage(
+    index: pd.DatetimeIndex,
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+    n: Union[Tuple[Number, Number], Number],
+    grid: pd.DatetimeIndex = None,
+    min_coverage: float = 0.8,
+    min_bars: int = 2,
+) -> pd.DataFrame:
+    """
+    Data coverage of every auction window.
+    :param index: Bars of the spread.
+    :param auction_dates: Auction dates or table, as passed to calc_all_trades.
+    :param n: Days before/after the auction, as passed to calc_all_trades.
+    :param grid: Expected bars (see expected_grid). If None, only bar counts are reported.
+    :param min_coverage: Share of expected bars each window needs to be ok.
+    :param min_bars: Bars each window needs to be ok (calc_single_trade needs 1, a
+                     meaningful trade 2).
+    :return: DataFrame indexed by auction date with bar counts, coverage, duplicate flags and
+             an overall ok flag.
+    """
+    bars = np.sort(_ns(index))
+    pre_start, pre_end, post_start, post_end = window_bounds(auction_dates, n)
+    pre_bars = _count_in(bars, pre_start, pre_end)
+    post_bars = _count_in(bars, post_start, post_end)
+
+    # Duplicated timestamps inside a window.
+    dup_ns = np.unique(bars[np.r_[bars[1:] == bars[:-1], False]])
+    dup_pre = _count_in(dup_ns, pre_start, pre_end) > 0
+    dup_post = _count_in(dup_ns, post_start, post_end) > 0
+
+    dates = auction_dates.index if isinstance(auction_dates, pd.DataFrame) else list(auction_dates)
+    out = pd.DataFrame(
+        {
+            "pre_bars": pre_bars,
+            "post_bars": post_bars,
+            "pre_duplicates": dup_pre,
+            "post_duplicates": dup_post,
+        },
+        index=dates,
+    )
+    ok = (pre_bars >= min_bars) & (post_bars >= min_bars)
+    if grid is not None:
+        expected = np.sort(_ns(grid))
+        pre_expected = _count_in(expected, pre_start, pre_end)
+        post_expected = _count_in(expected, post_start, post_end)
+        unique = np.unique(bars)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["pre_coverage"] = _count_in(unique, pre_start, pre_end) / pre_expected
+            out["post_coverage"] = _count_in(unique, post_start, post_end) / post_expected
+        ok &= (out["pre_coverage"].fillna(0).values >= min_coverage) & (
+            out["post_coverage"].fillna(0).values >= min_coverage
+        )
+    out["ok"] = ok
+    return out
+
+
+def validate_frames(
+    frames: Mapping[str, pd.DataFrame], times: Iterable = None, sCalendar: str = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Run all file-level checks on a set of files.
+    :param frames: Name -> frame with a DatetimeIndex, eg. schema.load_qm_data of each file
+                   (load_all_qm_data aligns the files first, which hides the gaps).
+    :param times: Grid times, inferred per file if None.
+    :param sCalendar: Session calendar, eg. "UST".
+    :return: Dict with "files" (per-file summary including missing and off-grid bars),
+             "presence" (bars by file on the union index) and "lags" (lag columns of every
+             file).
+    """
+    summary, presence = alignment_report(frames)
+    missing, extra = [], []
+    lags = {}
+    for name, df in frames.items():
+        grid = expected_grid(df.index, times, sCalendar)
+        missing.append(int(missing_bitmap(df.index, grid).sum()))
+        extra.append(int(off_grid(df.index, grid).sum()))
+        lags[name] = lag_report(df)
+    summary["missing_vs_grid"] = missing
+    summary["off_grid"] = extra
+    summary["lag_columns_ok"] = [bool(lags[name]["ok"].all()) for name in frames]
+    return {"files": summary, "presence": presence, "lags": pd.concat(lags, names=["file", "column"])}
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+In-sample / out-of-sample evaluation of many trade rules over many folds.
+
+run_is_oos in Auction_Analysis.ipynb calls optimize_entry_time and calc_all_trades again for
+every rule and split. But a trade rule only picks steepener or flattener for each leg, and
+a flattener is minus the steepener, so the PnL of any rule is
+
+    pnl[rule, n, auction] = sign_pre[rule, auction] * steepener_pre[n, auction]
+                          + sign_post[rule, auction] * steepener_post[n, auction]
+
+AuctionGrid computes the steepener PnL of both legs once per n on a grid (in parallel over
+n), and evaluate_rules scores any number of rules on any number of folds with einsum: the
+in-sample PnL picks the best n_prev and n_post for each rule and fold (as
+optimize_entry_time(symmetric=False) does, but on the grid), and the out-of-sample PnL is
+read at that n:
+
+    >>> grid = AuctionGrid(df["C2"], twos)
+    >>> folds = make_folds(twos.index, scheme="anchored", n_folds=4)
+    >>> evaluate_rules(grid, {"fun_1": fun_1, "fun_2": fun_2}, folds)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.pnl_calcs import calc_all_trades
+from auction_trading.utils import Number
+
+STEEPENER, FLATTENER = "steepener", "flattener"
+
+
+def _steepener_pnl(args: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+    # Default rule is ("steepener", "flattener"), so the post-auction leg is negated.
+    spread, auction_dates, n, multiplier = args
+    trades = calc_all_trades(spread, auction_dates, n, multiplier)
+    return trades["Pre-Auction PnL"].values.astype(float), -trades["Post-Auction PnL"].values.astype(float)
+
+
+class AuctionGrid:
+    """
+    Steepener PnL of the pre- and post-auction legs of every auction, for every n on a grid.
+    """
+
+    def __init__(
+        self,
+        spread: Union[pd.DataFrame, pd.Series],
+        auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+        n_grid: Sequence[Number] = tuple(np.arange(1, 5.01, 0.25)),
+        multiplier: int = 10_000,
+        n_jobs: int = 1,
+    ):
+        """
+        :param spread: Spread to trade.
+        :param auction_dates: Auction dates, or the auction table (needed for rules).
+        :param n_grid: Days before/after the auction to evaluate. Each leg picks its own n, as
+                       with calc_all_trades(..., (n_prev, n_post)).
+        :param multiplier: Multiplier to use for PnL calculation.
+        :param n_jobs: Processes used to compute the grid.
+        """
+        self.auction_dates = auction_dates
+        if isinstance(auction_dates, pd.DataFrame):
+            self.dates = pd.DatetimeIndex(auction_dates.index)
+        else:
+            self.dates = pd.DatetimeIndex(list(auction_dates))
+        self.n_grid = np.asarray(n_grid, dtype=float)
+
+        # The pre-auction leg only depends on n_prev and the post-auction leg on n_post.
+        jobs = [(spread, auction_dates, (n, n), multiplier) for n in self.n_grid]
+        if n_jobs == 1:
+            results = [_steepener_pnl(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_steepener_pnl, jobs))
+
+        # (n, auctions)
+        self.pre = np.stack([r[0] for r in results])
+        self.post = np.stack([r[1] for r in results])
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+def rule_signs(
+    rules: Mapping[str, Callable], auction_dates: pd.DataFrame, pass_row: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate each rule once per auction.
+    :param rules: Name -> trade rule, as passed to calc_all_trades.
+    :param auction_dates: Auction table.
+    :param pass_row: Call rules with the whole auction row (eg. to use "2Y Tail" or the
+                     bid-to-cover) instead of its bond_series. calc_all_trades passes the
+                     bond_series, so only rules evaluated here alone can use the row.
+    :return: (rules, auctions) arrays of +1 (steepener) / -1 (flattener) for each leg.
+    """
+    if not isinstance(auction_dates, pd.DataFrame):
+        # Without an auction table calc_all_trades always trades the default rule.
+        n = len(list(auction_dates))
+        return np.ones((len(rules), n)), -np.ones((len(rules), n))
+
+    inputs = [row for _, row in auction_dates.iterrows()] if pass_row else list(auction_dates["bond_series"])
+    pre = np.empty((len(rules), len(inputs)))
+    post = np.empty((len(rules), len(inputs)))
+    for r, rule in enumerate(rules.values()):
+        trades = [rule(x) for x in inputs]
+        pre[r] = [1.0 if t[0] == STEEPENER else -1.0 for t in trades]
+        post[r] = [1.0 if t[1] == STEEPENER else -1.0 for t in trades]
+    return pre, post
+
+
+def make_folds(
+    dates: Union[pd.DatetimeIndex, Sequence],
+    scheme: str = "anchored",
+    n_folds: int = 4,
+    window: int = 1,
+    split_date: Union[str, pd.Timestamp] = None,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    In-sample / out-of-sample masks over the auctions.
+    :param dates: Auction dates, in time order.
+    :param scheme: "anchored" (in-sample is everything before the test block), "rolling"
+                   (in-sample is the window blocks before the test block) or "split" (one
+                   fold, before / from split_date, as run_is_oos).
+    :param n_folds: Test blocks. The auctions are cut into n_folds + 1 contiguous blocks of
+                    equal size and the first block is only ever in-sample.
+    :param window: Blocks in each in-sample window for scheme="rolling".
+    :param split_date: First out-of-sample date for scheme="split".
+    :return: Fold name -> (in-sample mask, out-of-sample mask).
+    """
+    dates = pd.DatetimeIndex(list(dates))
+    if scheme == "split":
+        oos = np.asarray(dates >= pd.Timestamp(split_date))
+        return {f"split {pd.Timestamp(split_date).date()}": (~oos, oos)}
+
+    if scheme not in ("anchored", "rolling"):
+        raise ValueError(f"Unknown scheme {scheme!r}, use 'anchored', 'rolling' or 'split'.")
+    if n_folds < 1 or len(dates) < n_folds + 1:
+        raise ValueError(
+            f"{len(dates)} auctions cannot be cut into {n_folds} folds, need at least n_folds + 1."
+        )
+
+    block = np.minimum(np.arange(len(dates)) * (n_folds + 1) // max(len(dates), 1), n_folds)
+    folds = {}
+    for k in range(1, n_folds + 1):
+        oos = block == k
+        if scheme == "anchored":
+            ins = block < k
+        else:
+            ins = (block < k) & (block >= k - window)
+        folds[f"{scheme} {dates[oos][0].date()} - {dates[oos][-1].date()}"] = (ins, oos)
+    return folds
+
+
+def evaluate_rules(
+    grid: AuctionGrid,
+    rules: Mapping[str, Callable],
+    folds: Mapping[str, Tuple[np.ndarray, np.ndarray]],
+    pass_row: bool = False,
+) -> pd.DataFrame:
+    """
+    Pick n_prev and n_post in-sample and report in- and out-of-sample mean PnL per auction,
+    for every rule and fold.
+    :param grid: Cached steepener PnL.
+    :param rules: Name -> trade rule.
+    :param folds: Output of make_folds.
+    :param pass_row: See rule_signs.
+    :return: DataFrame indexed by (rule, fold).
+    """
+    sign_pre, sign_post = rule_signs(rules, grid.auction_dates, pass_row)
+    ins = np.stack([np.asarray(f[0], dtype=float) for f in folds.values()])
+    oos = np.stack([np.asarray(f[1], dtype=float) for f in folds.values()])
+    n_ins = ins.sum(axis=1)
+    n_oos = oos.sum(axis=1)
+
+    # Summed PnL per (fold, rule, n). Missing PnL (NaN) counts as zero.
+    pre = np.nan_to_num(grid.pre)
+    post = np.nan_to_num(grid.post)
+    is_pre = np.einsum("ra,ga,fa->frg", sign_pre, pre, ins)
+    is_post = np.einsum("ra,ga,fa->frg", sign_post, post, ins)
+    oos_pre = np.einsum("ra,ga,fa->frg", sign_pre, pre, oos)
+    oos_post = np.einsum("ra,ga,fa->frg", sign_post, post, oos)
+
+    best_pre = is_pre.argmax(axis=2)
+    best_post = is_post.argmax(axis=2)
+
+    def _at(x: np.ndarray, best: np.ndarray) -> np.ndarray:
+        return np.take_along_axis(x, best[:, :, None], axis=2)[:, :, 0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_is = 1 / n_ins[:, None]
+        per_oos = 1 / n_oos[:, None]
+        out = {
+            "n_prev": grid.n_grid[best_pre],
+            "n_post": grid.n_grid[best_post],
+            "is_auctions": np.broadcast_to(n_ins[:, None], best_pre.shape),
+            "oos_auctions": np.broadcast_to(n_oos[:, None], best_pre.shape),
+            "is_pre_pnl": _at(is_pre, best_pre) * per_is,
+            "is_post_pnl": _at(is_post, best_post) * per_is,
+            "oos_pre_pnl": _at(oos_pre, best_pre) * per_oos,
+            "oos_post_pnl": _at(oos_post, best_post) * per_oos,
+        }
+    out["is_total_pnl"] = out["is_pre_pnl"] + out["is_post_pnl"]
+    out["oos_total_pnl"] = out["oos_pre_pnl"] + out["oos_post_pnl"]
+
+    # (fold, rule) -> rows by (rule, fold).
+    index = pd.MultiIndex.from_product([list(rules), list(folds)], names=["rule", "fold"])
+    return pd.DataFrame({k: np.asarray(v).T.ravel() for k, v in out.items()}, index=index)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Average the fold results of evaluate_rules per rule, sorted by out-of-sample PnL, with
+    the share of folds where the out-of-sample PnL was positive.
+    """
+    grouped = results.groupby(level="rule")
+    summary = grouped[["is_total_pnl", "oos_total_pnl", "oos_pre_pnl", "oos_post_pnl"]].mean()
+    summary["oos_hit_rate"] = grouped["oos_total_pnl"].apply(lambda x: (x > 0).mean())
+    return summary.sort_values("oos_total_pnl", ascending=False)
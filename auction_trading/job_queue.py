@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+SQLite job queue for sweeps that do not fit on one machine.
+
+A sweep is submitted as one job per grid point (eg. calc_all_trades for every n, or a
+walk-forward run for every seq_size x step_size), then any number of workers lease jobs from
+the same database file, run them and write the results back:
+
+    >>> queue = JobQueue("sweep.db")
+    >>> queue.submit_many(calc_all_trades, [{"n": n} for n in range(1, 15)],
+    ...                   common={"spread": df["C2"], "auction_dates": twos})
+    >>> spawn_workers("sweep.db", 4, wait=True)      # or on each node:
+    $ python -m auction_trading.job_queue worker sweep.db
+    $ python -m auction_trading.job_queue progress sweep.db
+    >>> queue.results()
+
+Leases are taken inside BEGIN IMMEDIATE transactions, so two workers never get the same job.
+A running job's lease is renewed by a heartbeat thread; a job whose lease expires (worker
+crashed or lost) goes back to the queue until max_attempts is reached. Jobs are keyed by a
+content hash of their function and arguments (not their pickle, which changes once pandas
+has consolidated a frame's blocks), so resubmitting a sweep skips finished jobs, and a
+result is only ever written once:
+
+    >>> keys = queue.submit_many(calc_all_trades, grid, common=common)
+    >>> calc_all_trades(**common, **grid[0])                # consolidates the frames
+    >>> assert queue.submit_many(calc_all_trades, grid, common=common) == keys
+
+Job functions (and any trade rule passed as an argument) must be importable module-level
+functions, since workers look them up by name. For walk-forward model runs, wrap model
+construction and run_stepped_inc/run_stepped_retrain in such a function.
+
+NOTE: SQLite locking relies on the file system. It is reliable on a local disk and on most
+      shared file systems with working POSIX locks, but not on every NFS setup.
+"""
+
+import argparse
+import hashlib
+import importlib
+import os
+import pickle
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.results_store import rule_name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    blob_key TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    func TEXT NOT NULL,
+    params BLOB NOT NULL,
+    common_key TEXT REFERENCES blobs (blob_key),
+    status TEXT NOT NULL DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, job_id);
+
+CREATE TABLE IF NOT EXISTS results (
+    job_key TEXT PRIMARY KEY,
+    result BLOB,
+    worker TEXT,
+    finished_at REAL NOT NULL
+);
+"""
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+def _func_name(func: Union[Callable, str]) -> str:
+    if isinstance(func, str):
+        return func
+    name = f"{func.__module__}:{func.__qualname__}"
+    if "<" in name or func.__module__ == "__main__":
+        raise ValueError(f"{name} is not importable by workers, use a module-level function.")
+    return name
+
+
+def _resolve(name: str) -> Callable:
+    module, qualname = name.split(":")
+    obj = importlib.import_module(module)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _dumps(obj: Any) -> bytes:
+    try:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        raise ValueError(
+            "Job arguments must be picklable, pass trade rules as module-level functions, not lambdas."
+        ) from e
+
+
+def _hash_into(h, obj: Any) -> None:
+    # Content of obj in a canonical form: same values, same bytes.
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        names = obj.columns if isinstance(obj, pd.DataFrame) else [obj.name]
+        dtypes = obj.dtypes if isinstance(obj, pd.DataFrame) else [obj.dtype]
+        h.update(repr((type(obj).__name__, list(names), [str(d) for d in dtypes], obj.shape)).encode())
+        try:
+            hashed = pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index))
+        except TypeError:
+            # Unhashable cells, eg. the lists of an auction table's bond_series.
+            frame = obj.to_frame() if isinstance(obj, pd.Series) else pd.DataFrame(obj)
+            frame = frame.apply(lambda col: col.map(repr) if col.dtype == object else col)
+            hashed = pd.util.hash_pandas_object(frame, index=not isinstance(obj, pd.Index))
+        h.update(hashed.values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr(("ndarray", str(obj.dtype), obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else pickle.dumps(obj.tolist()))
+    elif isinstance(obj, Mapping):
+        h.update(f"dict{len(obj)}".encode())
+        for k in sorted(obj, key=repr):
+            _hash_into(h, k)
+            _hash_into(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _hash_into(h, item)
+    elif callable(obj) and hasattr(obj, "__code__"):
+        h.update(rule_name(obj).encode())
+    elif obj is None or isinstance(obj, (bool, int, float, complex, str, bytes, np.generic, pd.Timestamp)):
+        h.update(repr((type(obj).__name__, obj)).encode())
+    else:
+        h.update(_dumps(obj))
+
+
+def _content_key(*parts: Any) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        _hash_into(h, part)
+    return h.hexdigest()
+
+
+def worker_name() -> str:
+    """
+    :return: Default worker id, host:pid.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Job:
+    """
+    A leased job.
+    """
+
+    __slots__ = ("job_id", "job_key", "func", "params", "common_key", "attempts", "worker")
+
+    def __init__(self, job_id, job_key, func, params, common_key, attempts, worker):
+        self.job_id = job_id
+        self.job_key = job_key
+        self.func = func
+        self.params = params
+        self.common_key = common_key
+        self.attempts = attempts
+        self.worker = worker
+
+    def __repr__(self) -> str:
+        return f"Job({self.job_id}, {self.func}, attempt {self.attempts})"
+
+
+class JobQueue:
+    """
+    Job queue in a SQLite file shared by all workers.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        """
+        :param path: SQLite file, created if needed.
+        :param timeout: Seconds to wait for a lock held by another worker.
+        """
+        self.path = path
+        self.timeout = timeout
+        # Autocommit mode, transactions are explicit.
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.executescript(_SCHEMA)
+        self._common: Dict[str, Dict] = {}
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _transaction(self, sql: str, args: Sequence = ()) -> sqlite3.Cursor:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(sql, args)
+            self.conn.execute("COMMIT")
+            return cur
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    # -- Submitting ------------------------------------------------------------------------
+
+    def submit(self, func: Union[Callable, str], priority: int = 0, max_attempts: int = 3, **params) -> str:
+        """
+        Submit a single job, func(**params).
+        :return: Job key.
+        """
+        return self.submit_many(func, [params], priority=priority, max_attempts=max_attempts)[0]
+
+    def submit_many(
+        self,
+        func: Union[Callable, str],
+        grid: Iterable[Mapping[str, Any]],
+        common: Mapping[str, Any] = None,
+        priority: int = 0,
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """
+        Submit one job per grid point, func(**common, **point). The common arguments (eg. the
+        spread and auction table) are stored once and shared by all jobs. Jobs that already
+        exist, finished or not, are not submitted again.
+        :param func: Importable function, or its "module:qualname".
+        :param grid: Keyword arguments of each job.
+        :param common: Keyword arguments shared by every job.
+        :param priority: Lower runs first.
+        :param max_attempts: Leases per job before it is marked failed.
+        :return: Job keys, in grid order.
+        """
+        name = _func_name(func)
+        common = dict(common or {})
+        common_blob = _dumps(common)
+        common_key = _content_key(common)
+        now = time.time()
+
+        rows, keys = [], []
+        for point in grid:
+            params = _dumps(dict(point))
+            key = _content_key(name, common_key, dict(point))
+            keys.append(key)
+            rows.append((key, name, params, common_key, priority, max_attempts, now))
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (blob_key, data) VALUES (?, ?)", (common_key, common_blob)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job_key, func, params, common_key, priority, max_attempts, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return keys
+
+    # -- Leasing ---------------------------------------------------------------------------
+
+    def lease(self, worker: str = None, lease_seconds: float = 60.0) -> Union[Job, None]:
+        """
+        Atomically lease the next pending job, or a job whose lease has expired.
+        :param worker: Worker id, defaults to host:pid.
+        :param lease_seconds: Lease length, renewed by heartbeat().
+        :return: The leased job, or None if nothing can be leased now.
+        """
+        worker = worker or worker_name()
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts are failed, not retried.
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'lease expired') "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, LEASED, now),
+            )
+            row = self.conn.execute(
+                "SELECT job_id, job_key, func, params, common_key, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY priority, job_id LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started_at = ? WHERE job_id = ?",
+                (LEASED, worker, now + lease_seconds, now, row[0]),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        job_id, job_key, func, params, common_key, attempts = row
+        return Job(job_id, job_key, func, pickle.loads(params), common_key, attempts + 1, worker)
+
+    def heartbeat(self, job: Job, lease_seconds: float = 60.0) -> bool:
+        """
+        Extend the lease of a running job.
+        :return: False if the job is no longer leased by this worker.
+        """
+        cur = self._transaction(
+            "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND worker = ? AND status = ?",
+            (time.time() + lease_seconds, job.job_id, job.worker, LEASED),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job: Job, result: Any) -> bool:
+        """
+        Store the result of a job. Only the first result of a job is kept, so a worker whose
+        lease expired while it was still running cannot overwrite it.
+        :return: True if this call wrote the result.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO results (job_key, result, worker, finished_at) VALUES (?, ?, ?, ?)",
+                (job.job_key, _dumps(result), job.worker, now),
+            )
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = NULL WHERE job_id = ?",
+                (DONE, now, job.job_id),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def fail(self, job: Job, error: str) -> None:
+        """
+        Record a failed attempt. The job is retried until it reaches max_attempts.
+        """
+        self._transaction(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+            "error = ?, worker = NULL, lease_expires = NULL WHERE job_id = ? AND worker = ? AND status = ?",
+            (FAILED, PENDING, error, job.job_id, job.worker, LEASED),
+        )
+
+    def retry_failed(self) -> int:
+        """
+        Put failed jobs back in the queue with fresh attempts.
+        :return: Number of jobs requeued.
+        """
+        return self._transaction(
+            "UPDATE jobs SET status = ?, attempts = 0, error = NULL WHERE status = ?", (PENDING, FAILED)
+        ).rowcount
+
+    def load_common(self, job: Job) -> Dict:
+        """
+        Shared arguments of a job, cached per worker.
+        """
+        if job.common_key not in self._common:
+            (data,) = self.conn.execute(
+                "SELECT data FROM blobs WHERE blob_key = ?", (job.common_key,)
+            ).fetchone()
+            self._common[job.common_key] = pickle.loads(data)
+        return self._common[job.common_key]
+
+    # -- Monitoring and results ------------------------------------------------------------
+
+    def outstanding(self) -> int:
+        """
+        :return: Number of pending or leased jobs.
+        """
+        (n,) = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (PENDING, LEASED)
+        ).fetchone()
+        return n
+
+    def progress(self) -> pd.DataFrame:
+        """
+        Job counts per function and status, with the number of expired leases and the mean
+        runtime of finished jobs.
+        """
+        now = time.time()
+        df = pd.read_sql_query(
+            "SELECT func, status, COUNT(*) AS jobs, "
+            "SUM(CASE WHEN status = 'leased' AND lease_expires < ? THEN 1 ELSE 0 END) AS expired, "
+            "AVG(finished_at - started_at) AS mean_runtime_s, COUNT(DISTINCT worker) AS workers "
+            "FROM jobs GROUP BY func, status",
+            self.conn,
+            params=(now,),
+        )
+        table = df.pivot_table(index="func", columns="status", values="jobs", aggfunc="sum", fill_value=0)
+        for status in (PENDING, LEASED, DONE, FAILED):
+            if status not in table.columns:
+                table[status] = 0
+        table = table[[PENDING, LEASED, DONE, FAILED]]
+        table["total"] = table.sum(axis=1)
+        table["pct_done"] = 100 * table[DONE] / table["total"]
+        table["expired"] = df.groupby("func")["expired"].sum()
+        table["mean_runtime_s"] = df[df["status"] == DONE].set_index("func")["mean_runtime_s"]
+        table.columns.name = None
+        return table
+
+    def workers(self) -> pd.DataFrame:
+        """
+        Currently leased jobs by worker, with the seconds left on each lease.
+        """
+        df = pd.read_sql_query(
+            "SELECT worker, job_id, func, attempts, lease_expires FROM jobs WHERE status = ? ORDER BY worker",
+            self.conn,
+            params=(LEASED,),
+        )
+        df["lease_left_s"] = df.pop("lease_expires") - time.time()
+        return df
+
+    def errors(self) -> pd.DataFrame:
+        """
+        Last error of every job that has one.
+        """
+        df = pd.read_sql_query(
+            "SELECT job_id, func, status, attempts, error FROM jobs WHERE error IS NOT NULL", self.conn
+        )
+        return df
+
+    def results(self, func: Union[Callable, str] = None) -> List:
+        """
+        Finished jobs as (params, result) pairs, in submission order.
+        :param func: Only jobs of this function.
+        """
+        sql = "SELECT jobs.params, results.result FROM jobs JOIN results ON jobs.job_key = results.job_key "
+        args = ()
+        if func is not None:
+            sql += "WHERE jobs.func = ? "
+            args = (_func_name(func),)
+        rows = self.conn.execute(sql + "ORDER BY jobs.job_id", args).fetchall()
+        return [(pickle.loads(p), pickle.loads(r)) for p, r in rows]
+
+    def result(self, job_key: str) -> Any:
+        """
+        Result of a single job.
+        :raises KeyError: If the job has not finished.
+        """
+        row = self.conn.execute("SELECT result FROM results WHERE job_key = ?", (job_key,)).fetchone()
+        if row is None:
+            raise KeyError(job_key)
+        return pickle.loads(row[0])
+
+
+class _Heartbeat(threading.Thread):
+    # Renews a lease from its own connection while the job runs in the main thread.
+    def __init__(self, path: str, job: Job, lease_seconds: float, timeout: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self) -> None:
+        queue = JobQueue(self.path, self.timeout)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not queue.heartbeat(self.job, self.lease_seconds):
+                    self.lost = True
+                    return
+        finally:
+            queue.close()
+
+
+def run_worker(
+    path: str,
+    worker: str = None,
+    lease_seconds: float = 60.0,
+    poll: float = 1.0,
+    max_jobs: int = None,
+    idle_exit: bool = True,
+) -> int:
+    """
+    Lease and run jobs until the queue is drained.
+    :param path: Queue database.
+    :param worker: Worker id, defaults to host:pid.
+    :param lease_seconds: Lease length. A heartbeat renews it every third of this.
+    :param poll: Seconds to wait when no job can be leased.
+    :param max_jobs: Stop after this many jobs.
+    :param idle_exit: Stop when no job is pending or leased. Otherwise keep polling for new
+                      jobs forever.
+    :return: Number of jobs run.
+    """
+    worker = worker or worker_name()
+    queue = JobQueue(path)
+    done = 0
+    try:
+        while max_jobs is None or done < max_jobs:
+            job = queue.lease(worker, lease_seconds)
+            if job is None:
+                # Jobs leased by other workers may still come back if they crash.
+                if idle_exit and queue.outstanding() == 0:
+                    break
+                time.sleep(poll)
+                continue
+
+            heartbeat = _Heartbeat(path, job, lease_seconds, queue.timeout)
+            heartbeat.start()
+            try:
+                func = _resolve(job.func)
+                result = func(**queue.load_common(job), **job.params)
+            except Exception:
+                heartbeat.stopped.set()
+                heartbeat.join()
+                queue.fail(job, traceback.format_exc())
+            else:
+                heartbeat.stopped.set()
+                heartbeat.join()
+                queue.complete(job, result)
+            done += 1
+    finally:
+        queue.close()
+    return done
+
+
+def spawn_workers(
+    path: str, n_workers: int, wait: bool = False, lease_seconds: float = 60.0, **kwargs
+) -> List[subprocess.Popen]:
+    """
+    Launch local worker processes against a queue, eg. to test a sweep on one box.
+    :param path: Queue database.
+    :param n_workers: Number of processes.
+    :param wait: Block until all workers exit.
+    :param kwargs: Extra CLI options, eg. max_jobs=10 or poll=0.5.
+    :return: The worker processes.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+    args = [sys.executable, "-m", "auction_trading.job_queue", "worker", os.path.abspath(path)]
+    args += ["--lease", str(lease_seconds)]
+    for name, value in kwargs.items():
+        args += [f"--{name.replace('_', '-')}", str(value)]
+    procs = [subprocess.Popen(args, cwd=root, env=env) for _ in range(n_workers)]
+    if wait:
+        for p in procs:
+            p.wait()
+    return procs
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sweep job queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    w = sub.add_parser("worker", help="Run jobs until the queue is drained.")
+    w.add_argument("path")
+    w.add_argument("--worker", default=None, help="Worker id, defaults to host:pid.")
+    w.add_argument("--lease", type=float, default=60.0, help="Lease length in seconds.")
+    w.add_argument("--poll", type=float, default=1.0, help="Seconds between polls when idle.")
+    w.add_argument("--max-jobs", type=int, default=None, help="Stop after this many jobs.")
+    w.add_argument("--forever", action="store_true", help="Keep polling when the queue is empty.")
+
+    s = sub.add_parser("spawn", help="Launch local workers and wait for them.")
+    s.add_argument("path")
+    s.add_argument("-n", "--workers", type=int, default=os.cpu_count())
+    s.add_argument("--lease", type=float, default=60.0)
+
+    p = sub.add_parser("progress", help="Show job counts per status.")
+    p.add_argument("path")
+    p.add_argument("--errors", action="store_true", help="Also show the last error of each job.")
+
+    r = sub.add_parser("retry", help="Requeue failed jobs.")
+    r.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        run_worker(args.path, args.worker, args.lease, args.poll, args.max_jobs, idle_exit=not args.forever)
+    elif args.command == "spawn":
+        procs = spawn_workers(args.path, args.workers, wait=True, lease_seconds=args.lease)
+        return max((p.returncode for p in procs), default=0)
+    elif args.command == "progress":
+        with JobQueue(args.path) as queue:
+            print(queue.progress().to_string())
+            leased = queue.workers()
+            if len(leased):
+                print(leased.to_string(index=False))
+            if args.errors:
+                print(queue.errors().to_string(index=False))
+    elif args.command == "retry":
+        with JobQueue(args.path) as queue:
+            print(f"Requeued {queue.retry_failed()} jobs.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
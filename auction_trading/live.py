@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Asyncio runtime for the auction trade: enter n days before the auction, flip at 12:59:59
+(11:29:59 / 12:59:59 on 2Y and 5Y double auction days) and exit n days after.
+
+The runtime consumes a stream of (timestamp, symbol, price) events, keeps each spread up to
+date as its legs tick, and fills the pre- and post-auction legs of every scheduled auction as
+bars arrive. The legs use exactly the windows of calc_n_prior, so replaying a spread through
+run_replay gives the same PnL as calc_all_trades:
+
+    >>> trades = run_replay({"C2": df["C2"]}, {"C2": twos}, n=(2, 2), trade_rule=fun_1)
+    >>> trades["C2"]  # same layout as calc_all_trades(df["C2"], twos, (2, 2), ...)
+
+In live use, replace replay_feed with an async iterator over the real feed.
+"""
+
+import asyncio
+import bisect
+import heapq
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Mapping, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.utils import Number
+
+Event = Tuple[pd.Timestamp, str, float]
+
+
+class TradeLeg:
+    """
+    One side of an auction trade: a window [start, end] and a direction. The leg records the
+    first spread value at or after start and the last one at or before end.
+    """
+
+    __slots__ = ("auction_date", "leg", "start", "end", "side", "first_ts", "first_px", "last_ts", "last_px")
+
+    def __init__(
+        self, auction_date: pd.Timestamp, leg: str, start: pd.Timestamp, end: pd.Timestamp, side: str
+    ):
+        self.auction_date = auction_date
+        self.leg = leg
+        self.start = start
+        self.end = end
+        self.side = side
+        self.first_ts = None
+        self.first_px = None
+        self.last_ts = None
+        self.last_px = None
+
+    def update(self, ts: pd.Timestamp, px: float) -> None:
+        if self.first_ts is None:
+            self.first_ts, self.first_px = ts, px
+        self.last_ts, self.last_px = ts, px
+
+    def pnl(self, multiplier: Number) -> float:
+        if self.first_ts is None:
+            return np.nan
+        if self.side == "steepener":
+            return (self.last_px - self.first_px) * multiplier
+        return (self.first_px - self.last_px) * multiplier
+
+
+def _leg_windows(
+    auction_date: pd.Timestamp,
+    n: Number = None,
+    n_prev: Number = None,
+    n_post: Number = None,
+    bond_series=None,
+    business_days: bool = False,
+) -> Tuple[Tuple[pd.Timestamp, pd.Timestamp], Tuple[pd.Timestamp, pd.Timestamp]]:
+    # Mirrors calc_n_prior so that replays reproduce calc_all_trades.
+    def _shift(ts: pd.Timestamp, days: Number) -> pd.Timestamp:
+        if not business_days:
+            return ts + pd.Timedelta(days=days)
+        from lib.qlibdate import qlAddBusDays
+
+        day = qlAddBusDays(ts.date(), int(round(days)))
+        return pd.Timestamp.combine(day, ts.time())
+
+    if bond_series is not None and len(bond_series) == 2:
+        morning = auction_date.replace(hour=11, minute=29, second=59)
+        afternoon = auction_date.replace(hour=12, minute=59, second=59)
+        if n is not None:
+            return (_shift(morning, -n), morning), (_shift(afternoon, -n), afternoon)
+        return (_shift(morning, -n_prev), morning), (afternoon, _shift(afternoon, n_post))
+
+    split = auction_date.replace(hour=12, minute=59, second=59)
+    n_prev, n_post = (n, n) if n is not None else (n_prev, n_post)
+    return (_shift(split, -n_prev), split), (split, _shift(split, n_post))
+
+
+def schedule_auctions(
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DatetimeIndex, pd.DataFrame],
+    n: Union[Tuple[Number, Number], Number],
+    trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    business_days: bool = False,
+) -> List[TradeLeg]:
+    """
+    Build the pre- and post-auction legs for every auction. The trade rule is called once per
+    auction with its bond_series, as in calc_all_trades.
+    :param auction_dates: Auction dates, or a DataFrame with a bond_series column.
+    :param n: Days before/after the auction, or a (n_prev, n_post) tuple.
+    :param trade_rule: Maps bond_series to a (pre, post) pair of "steepener"/"flattener".
+    :param business_days: Count n in UST business days (lib.qlibdate) instead of calendar days.
+                          calc_all_trades uses calendar days.
+    :return: List of legs, two per auction.
+    """
+    if isinstance(n, tuple):
+        n_prev, n_post = n
+        n = None
+    else:
+        n_prev, n_post = None, None
+
+    if isinstance(auction_dates, pd.DataFrame):
+        features = auction_dates["bond_series"]
+        dates = list(features.index)
+    else:
+        features = None
+        dates = list(auction_dates)
+
+    legs = []
+    for idx, date in enumerate(dates):
+        date = pd.Timestamp(date)
+        bond_series = features.iloc[idx] if features is not None else None
+        trades = trade_rule(bond_series) if features is not None else ("steepener", "flattener")
+        pre, post = _leg_windows(date, n, n_prev, n_post, bond_series, business_days)
+        legs.append(TradeLeg(date, "pre", pre[0], pre[1], trades[0]))
+        legs.append(TradeLeg(date, "post", post[0], post[1], trades[1]))
+    return legs
+
+
+class SpreadBook:
+    """
+    Incrementally maintained spread: a weighted sum of the last price of each leg. The spread
+    is only defined once every leg has ticked.
+    """
+
+    def __init__(self, weights: Mapping[str, float]):
+        """
+        :param weights: Symbol -> weight, eg. {"TU": 1.0, "FV": -0.5}. A precomputed spread
+                        series is a single symbol with weight 1.
+        """
+        self.weights = dict(weights)
+        self.prices = {}
+        self.value = None
+        self._missing = set(self.weights)
+
+    def update(self, symbol: str, price: float) -> Union[float, None]:
+        old = self.prices.get(symbol)
+        self.prices[symbol] = price
+        if self._missing:
+            self._missing.discard(symbol)
+            if self._missing:
+                return None
+            self.value = sum(w * self.prices[s] for s, w in self.weights.items())
+        else:
+            # Only the leg that moved changes the spread.
+            self.value += self.weights[symbol] * (price - old)
+        return self.value
+
+
+class AuctionStrategy:
+    """
+    Event-time auction strategy for one spread. Legs are activated when a bar reaches their
+    start, updated on every bar inside their window and closed on the first bar after their
+    end (or at the end of the stream).
+    """
+
+    def __init__(self, name: str, legs: List[TradeLeg], multiplier: Number = 10_000):
+        self.name = name
+        self.multiplier = multiplier
+        self._pending = sorted(legs, key=lambda leg: leg.start)
+        self._starts = [leg.start for leg in self._pending]
+        self._next = 0
+        self._active: List[Tuple[pd.Timestamp, int, TradeLeg]] = []
+        self.closed: List[TradeLeg] = []
+
+    def on_bar(self, ts: pd.Timestamp, value: float) -> None:
+        # Close legs whose window ended before this bar.
+        while self._active and self._active[0][0] < ts:
+            self.closed.append(heapq.heappop(self._active)[2])
+
+        # Open legs whose window has started.
+        stop = bisect.bisect_right(self._starts, ts, lo=self._next)
+        for i in range(self._next, stop):
+            leg = self._pending[i]
+            if leg.end >= ts:
+                heapq.heappush(self._active, (leg.end, i, leg))
+            else:
+                # No bar inside the window.
+                self.closed.append(leg)
+        self._next = stop
+
+        for _, _, leg in self._active:
+            leg.update(ts, value)
+
+    def finish(self) -> None:
+        while self._active:
+            self.closed.append(heapq.heappop(self._active)[2])
+        self.closed.extend(self._pending[self._next :])
+        self._next = len(self._pending)
+
+    def results(self) -> pd.DataFrame:
+        """
+        Closed trades in the calc_all_trades layout, indexed by auction date.
+        """
+        pre = {leg.auction_date: leg for leg in self.closed if leg.leg == "pre"}
+        post = {leg.auction_date: leg for leg in self.closed if leg.leg == "post"}
+        dates = [
+            d for d in dict.fromkeys(leg.auction_date for leg in self._pending) if d in pre and d in post
+        ]
+        return pd.DataFrame(
+            {
+                "Enter at Pre-Auction Time": [pre[d].first_ts for d in dates],
+                "Exit at Pre-Auction Time": [pre[d].last_ts for d in dates],
+                "Pre-Auction PnL": [pre[d].pnl(self.multiplier) for d in dates],
+                "Enter at Post-Auction Time": [post[d].first_ts for d in dates],
+                "Exit at Post-Auction Time": [post[d].last_ts for d in dates],
+                "Post-Auction PnL": [post[d].pnl(self.multiplier) for d in dates],
+            },
+            index=dates,
+        )
+
+
+async def replay_feed(
+    series: Mapping[str, Union[pd.Series, pd.DataFrame]], speed: float = None, batch: int = 1_000
+) -> AsyncIterator[Event]:
+    """
+    Local stand-in for the live feed: replay one or more price series (eg. the data/ spreads
+    or the GetTechnicals closes) as a single time-ordered stream of (ts, symbol, price).
+    :param series: Symbol -> Series (or single column / "close" DataFrame) indexed by time.
+    :param speed: If given, sleep between events to replay at speed times real time.
+    :param batch: Yield control to the event loop every batch events when not sleeping.
+    """
+    frames = []
+    for symbol, s in series.items():
+        if isinstance(s, pd.DataFrame):
+            s = s["close"] if "close" in s.columns else s.iloc[:, 0]
+        s = s.dropna()
+        frames.append(pd.DataFrame({"symbol": symbol, "price": s.values.astype(float)}, index=s.index))
+    events = pd.concat(frames).sort_index(kind="mergesort")
+
+    prev = None
+    for i, (ts, symbol, price) in enumerate(
+        zip(events.index, events["symbol"].values, events["price"].values)
+    ):
+        if speed is not None and prev is not None:
+            await asyncio.sleep(max((ts - prev).total_seconds() / speed, 0))
+        elif i % batch == 0:
+            await asyncio.sleep(0)
+        prev = ts
+        yield ts, symbol, price
+
+
+class LiveEngine:
+    """
+    Runs many auction strategies concurrently over one feed. Each spread has its own queue
+    and consumer task; the dispatcher updates the spread books and routes spread values to
+    the queues. Queues are bounded, so a slow spread applies backpressure instead of growing
+    memory, and the dispatch-to-processed latency of every event is recorded.
+    """
+
+    def __init__(self, queue_size: int = 10_000):
+        self.queue_size = queue_size
+        self.books: Dict[str, SpreadBook] = {}
+        self.strategies: Dict[str, AuctionStrategy] = {}
+        self._by_symbol: Dict[str, List[str]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+
+    def add_spread(self, name: str, weights: Mapping[str, float], strategy: AuctionStrategy) -> None:
+        self.books[name] = SpreadBook(weights)
+        self.strategies[name] = strategy
+        self.latencies[name] = []
+        for symbol in weights:
+            self._by_symbol.setdefault(symbol, []).append(name)
+
+    async def _consume(self, name: str, queue: asyncio.Queue) -> None:
+        strategy = self.strategies[name]
+        latencies = self.latencies[name]
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            ts, value, sent = item
+            strategy.on_bar(ts, value)
+            latencies.append(time.perf_counter() - sent)
+        strategy.finish()
+
+    async def run(self, feed: AsyncIterator[Event]) -> Dict[str, pd.DataFrame]:
+        """
+        Consume the feed until it ends.
+        :return: Spread name -> trades in the calc_all_trades layout.
+        """
+        queues = {name: asyncio.Queue(self.queue_size) for name in self.strategies}
+        consumers = [asyncio.create_task(self._consume(name, q)) for name, q in queues.items()]
+        try:
+            async for ts, symbol, price in feed:
+                for name in self._by_symbol.get(symbol, ()):
+                    value = self.books[name].update(symbol, price)
+                    if value is not None:
+                        await queues[name].put((ts, value, time.perf_counter()))
+        finally:
+            for q in queues.values():
+                await q.put(None)
+            await asyncio.gather(*consumers)
+        return {name: strategy.results() for name, strategy in self.strategies.items()}
+
+    def latency_summary(self) -> pd.DataFrame:
+        """
+        Per-spread event latency (seconds from dispatch to processed).
+        """
+        rows = {}
+        for name, lat in self.latencies.items():
+            arr = np.asarray(lat) if lat else np.array([np.nan])
+            rows[name] = {
+                "events": len(lat),
+                "mean_s": np.nanmean(arr),
+                "p99_s": np.nanpercentile(arr, 99),
+                "max_s": np.nanmax(arr),
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def run_replay(
+    spreads: Mapping[str, pd.Series],
+    auction_dates: Mapping[str, Union[Iterable[pd.Timestamp], pd.DataFrame]],
+    n: Union[Tuple[Number, Number], Number],
+    multiplier: int = 10_000,
+    trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    speed: float = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Replay precomputed spreads through the live engine. The result for each spread matches
+    calc_all_trades(spreads[name], auction_dates[name], n, multiplier, trade_rule).
+    :param spreads: Spread name -> spread series.
+    :param auction_dates: Spread name -> auction schedule.
+    :return: Spread name -> trades.
+    """
+    engine = LiveEngine()
+    for name, spread in spreads.items():
+        legs = schedule_auctions(auction_dates[name], n, trade_rule)
+        engine.add_spread(name, {name: 1.0}, AuctionStrategy(name, legs, multiplier))
+    results = asyncio.run(engine.run(replay_feed(spreads, speed)))
+    for name, dates in auction_dates.items():
+        if isinstance(dates, pd.Index):
+            # calc_all_trades keeps the name of an index of auction dates.
+            results[name].index.name = dates.name
+    return results
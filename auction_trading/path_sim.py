@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Path-dependent simulation of the auction trades.
+
+calc_steepener and calc_flattener only use the first and last bar of each window, so a trade
+that was 30bp under water before finishing flat looks the same as one that never moved.
+AuctionPaths gathers the bars of every pre- or post-auction window (the same windows as
+calc_n_prior) into one padded (auctions, bars) array of PnL paths, and everything else is
+array operations on it:
+
+- excursions: max adverse / favourable excursion (MAE / MFE) and the time to reach them.
+- stop_target_grid: exit PnL for every (stop-loss, take-profit) pair on every auction at
+  once, from the running min / max of each path.
+
+    >>> paths = AuctionPaths(df["C2"], twos, n=2, leg="pre")
+    >>> paths.excursions().describe()
+    >>> summarize_grid(paths, stops=[5, 10, 20], targets=[5, 10, 20, np.inf])
+
+Windows are padded by repeating their last bar, so a padded path stays flat at its final
+PnL and the running min / max are unaffected.
+"""
+
+from typing import Callable, Iterable, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.integrity import window_bounds
+from auction_trading.is_oos import rule_signs
+from auction_trading.utils import Number
+
+_LEGS = ("pre", "post")
+
+
+class AuctionPaths:
+    """
+    PnL paths of one leg of the auction trade, for all auctions.
+    """
+
+    def __init__(
+        self,
+        spread: Union[pd.DataFrame, pd.Series],
+        auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+        n: Union[Tuple[Number, Number], Number],
+        leg: str = "pre",
+        multiplier: int = 10_000,
+        trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    ):
+        """
+        :param spread: Spread to trade. For a DataFrame the first column is used, as
+                       calc_steepener does.
+        :param auction_dates: Auction dates or table, as passed to calc_all_trades.
+        :param n: Days before/after the auction, as passed to calc_all_trades.
+        :param leg: "pre" or "post" auction leg.
+        :param multiplier: Multiplier to use for PnL calculation.
+        :param trade_rule: Trade rule, as passed to calc_all_trades (only used with an
+                           auction table).
+        """
+        if leg not in _LEGS:
+            raise ValueError(f"leg must be one of {_LEGS}.")
+        if isinstance(spread, pd.DataFrame):
+            spread = spread.iloc[:, 0]
+        if not spread.index.is_monotonic_increasing:
+            spread = spread.sort_index()
+
+        self.leg = leg
+        self.dates = (
+            pd.DatetimeIndex(auction_dates.index)
+            if isinstance(auction_dates, pd.DataFrame)
+            else pd.DatetimeIndex(list(auction_dates))
+        )
+
+        # Window positions, as the inclusive .loc slices of calc_n_prior.
+        pre_start, pre_end, post_start, post_end = window_bounds(auction_dates, n)
+        start, end = (pre_start, pre_end) if leg == "pre" else (post_start, post_end)
+        bars = np.asarray(spread.index, dtype="datetime64[ns]").astype(np.int64)
+        first = np.searchsorted(bars, start, side="left")
+        self.lengths = np.searchsorted(bars, end, side="right") - first
+
+        # +1 steepener, -1 flattener.
+        sign_pre, sign_post = rule_signs({"rule": trade_rule}, auction_dates)
+        self.sides = (sign_pre if leg == "pre" else sign_post)[0]
+
+        # Padded (auctions, bars) positions, repeating the last bar of each window.
+        width = max(int(self.lengths.max(initial=0)), 1)
+        steps = np.minimum(np.arange(width)[None, :], np.maximum(self.lengths, 1)[:, None] - 1)
+        pos = np.minimum(first[:, None] + steps, len(bars) - 1)
+        empty = self.lengths == 0
+
+        values = spread.values.astype(float)[pos]
+        values[empty] = np.nan
+        self.times = bars[pos]
+        self.times[empty] = np.iinfo(np.int64).min
+        self.valid = np.arange(width)[None, :] < self.lengths[:, None]
+        # PnL of the position since entry, per bar.
+        self.pnl = self.sides[:, None] * (values - values[:, :1]) * multiplier
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def final(self) -> np.ndarray:
+        """
+        PnL at the end of each window, ie. calc_all_trades' PnL.
+        """
+        return self.pnl[:, -1]
+
+    def excursions(self) -> pd.DataFrame:
+        """
+        :return: DataFrame per auction with the final PnL, MAE (most negative PnL, <= 0), MFE
+                 (most positive PnL, >= 0), the bars and time from entry to each, and the bars
+                 in the window.
+        """
+        ok = self.lengths > 0
+        # Padding repeats the final bar, which argmin / argmax never pick over the real one.
+        pnl = np.where(ok[:, None], self.pnl, 0.0)
+        mae_bar = pnl.argmin(axis=1)
+        mfe_bar = pnl.argmax(axis=1)
+        rows = np.arange(len(self))
+
+        def _elapsed(bar: np.ndarray) -> pd.TimedeltaIndex:
+            delta = (self.times[rows, bar] - self.times[:, 0]).astype("timedelta64[ns]")
+            return pd.to_timedelta(np.where(ok, delta, np.timedelta64("NaT")))
+
+        return pd.DataFrame(
+            {
+                "pnl": np.where(ok, self.final, np.nan),
+                "mae": np.where(ok, pnl[rows, mae_bar], np.nan),
+                "mfe": np.where(ok, pnl[rows, mfe_bar], np.nan),
+                "bars_to_mae": np.where(ok, mae_bar, -1),
+                "bars_to_mfe": np.where(ok, mfe_bar, -1),
+                "time_to_mae": _elapsed(mae_bar),
+                "time_to_mfe": _elapsed(mfe_bar),
+                "bars": self.lengths,
+            },
+            index=self.dates,
+        )
+
+    def first_hit(self, levels: Sequence[Number], adverse: bool = True) -> np.ndarray:
+        """
+        First bar at which each path reaches each level.
+        :param levels: Positive PnL distances, eg. stop-losses of [5, 10] for -5 and -10.
+        :param adverse: True for losses (stops), False for gains (targets).
+        :return: (levels, auctions) array of bars, the window length where never reached.
+        """
+        levels = np.asarray(levels, dtype=float)
+        if adverse:
+            running = -np.fmin.accumulate(self.pnl, axis=1)
+        else:
+            running = np.fmax.accumulate(self.pnl, axis=1)
+        # The running extreme is non-decreasing, so the first hit is the count of bars
+        # before it reaches the level. Padding repeats the last bar, so it never hits first.
+        hit = (running[None, :, :] < levels[:, None, None]).sum(axis=2)
+        return np.minimum(hit, self.lengths[None, :])
+
+    def exits(
+        self, stops: Sequence[Number] = (np.inf,), targets: Sequence[Number] = (np.inf,)
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Exit bar of every auction for every stop-loss / take-profit pair. The position is
+        closed at the first bar that reaches either level, or at the end of the window. If
+        both are reached on the same bar, the stop is assumed to have been hit first.
+        :param stops: Stop-loss distances, positive, in PnL units. np.inf for no stop.
+        :param targets: Take-profit distances, positive, in PnL units. np.inf for no target.
+        :return: Tuple of (stops, targets, auctions) arrays (exit bar, stopped out, took
+                 profit).
+        """
+        stop_bar = self.first_hit(stops, adverse=True)[:, None, :]
+        target_bar = self.first_hit(targets, adverse=False)[None, :, :]
+        length = self.lengths[None, None, :]
+
+        stopped = (stop_bar < length) & (stop_bar <= target_bar)
+        taken = (target_bar < length) & ~stopped
+        exit_bar = np.where(stopped, stop_bar, np.where(taken, target_bar, np.maximum(length - 1, 0)))
+        return exit_bar, stopped, taken
+
+    def stop_target_grid(
+        self,
+        stops: Sequence[Number] = (np.inf,),
+        targets: Sequence[Number] = (np.inf,),
+        fill: str = "bar",
+    ) -> np.ndarray:
+        """
+        Exit PnL of every auction for every stop-loss / take-profit pair, see exits.
+        :param stops: Stop-loss distances.
+        :param targets: Take-profit distances.
+        :param fill: "bar" to exit at the PnL of the bar that reached the level (bars are
+                     discrete, so this includes the gap through the level), or "level" to
+                     exit exactly at the level.
+        :return: (stops, targets, auctions) exit PnL, NaN for empty windows.
+        """
+        if fill not in ("bar", "level"):
+            raise ValueError("fill must be 'bar' or 'level'.")
+        exit_bar, stopped, taken = self.exits(stops, targets)
+        out = self.pnl[np.arange(len(self))[None, None, :], exit_bar]
+        if fill == "level":
+            stops = np.asarray(stops, dtype=float)[:, None, None]
+            targets = np.asarray(targets, dtype=float)[None, :, None]
+            out = np.where(stopped, -stops, np.where(taken, targets, out))
+        return out
+
+
+def summarize_grid(
+    paths: AuctionPaths,
+    stops: Sequence[Number] = (np.inf,),
+    targets: Sequence[Number] = (np.inf,),
+    fill: str = "bar",
+) -> pd.DataFrame:
+    """
+    Per (stop, target) pair: mean and total PnL, hit rate, worst trade and the share of
+    auctions stopped out / taking profit. Empty windows are left out.
+    :param paths: AuctionPaths of one leg.
+    :param stops: Stop-loss distances.
+    :param targets: Take-profit distances.
+    :param fill: See AuctionPaths.stop_target_grid.
+    :return: DataFrame indexed by (stop, target).
+    """
+    ok = paths.lengths > 0
+    pnl = paths.stop_target_grid(stops, targets, fill)[:, :, ok]
+    _, stopped, taken = paths.exits(stops, targets)
+    index = pd.MultiIndex.from_product([list(stops), list(targets)], names=["stop", "target"])
+    return pd.DataFrame(
+        {
+            "mean_pnl": pnl.mean(axis=2).ravel(),
+            "total_pnl": pnl.sum(axis=2).ravel(),
+            "hit_rate": (pnl > 0).mean(axis=2).ravel(),
+            "worst": pnl.min(axis=2).ravel(),
+            "stopped": stopped[:, :, ok].mean(axis=2).ravel(),
+            "took_profit": taken[:, :, ok].mean(axis=2).ravel(),
+        },
+        index=index,
+    )
@@ -15,6 +15,7 @@ from functools import partial
 
 # Import utils for date slicing.
 from auction_trading.utils import calc_n_prior, calc_n_prior_generator, Number
+from auction_trading.instrumentation import count, profile_job, timed, timer
 
 
 def calc_steepener(
@@ -115,12 +116,14 @@ def calc_slope_curve(
     return calc_single_trade(days_before, days_after, multiplier, trades)
 
 
+@timed()
 def calc_all_trades(
     spread: Union[pd.DataFrame, pd.Series],
     auction_dates: Union[Iterable[pd.Timestamp], pd.DatetimeIndex, pd.DataFrame],
     n: Union[Tuple[Number, Number], Number],
     multiplier: int = 10_000,
     trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    cost_model=None,
 ) -> pd.DataFrame:
     """
     Calculate the PnL for each auction date.
@@ -128,6 +131,11 @@ def calc_all_trades(
     :param auction_dates: DataFrame containing auction dates.
     :param n: Days before to enter/close position.
     :param multiplier:  Multiplier to use for PnL calculation.
+    :param cost_model: Optional auction_trading.costs.CostModel. If given, the PnL is net of
+                       costs and the costs are added as "Pre-Auction Cost"/"Post-Auction Cost".
+                       Its costs are in dollars, so either the PnL must be in dollars
+                       (eg. spreads.build_spreads output with multiplier=1) or the model's
+                       pnl_unit must be the dollar value of one unit of this PnL.
     :return: DataFrame containing PnL for each auction date.
     """
 
@@ -151,16 +159,21 @@ def calc_all_trades(
     enter_at_post = []
     exit_at_pre = []
     exit_at_post = []
+    sides = []
 
     # Iterate through each auction date
     for idx, (p, a) in enumerate(calc_n_prior_generator(spread, auction_dates, n, n_prev, n_post, auction_features)):
         # Calculate PnL
         if auction_features is not None:
-            trades = trade_rule(auction_features.iloc[idx])
+            with timer("trade_rule"):
+                trades = trade_rule(auction_features.iloc[idx])
         else:
             trades = ('steepener', 'flattener')
 
-        prior_pnl, after_pnl = calc_single_trade(p, a, multiplier, trades)
+        with timer("calc_single_trade"):
+            prior_pnl, after_pnl = calc_single_trade(p, a, multiplier, trades)
+        count("auctions")
+        sides.append(trades)
 
         # Append PnL to list
         prior.append(prior_pnl)
@@ -176,7 +189,7 @@ def calc_all_trades(
     # Return DataFrame indexed by auction dates.
     # Note: given the index, be careful when using these results as it may introduce
     # lookahead bias, since we are returning ex-post PnL for each auction date.
-    return pd.DataFrame(
+    trades = pd.DataFrame(
         {
             "Enter at Pre-Auction Time": enter_at_pre,
             "Exit at Pre-Auction Time": exit_at_pre,
@@ -187,6 +200,9 @@ def calc_all_trades(
         },
         index=auction_dates,
     )
+    if cost_model is not None:
+        trades = cost_model.apply_to_trades(trades, [t[0] for t in sides], [t[1] for t in sides])
+    return trades
 
 
 def optimize_entry_time(
@@ -205,6 +221,17 @@ def optimize_entry_time(
     :return: n that maximizes PnL.
     """
 
+    with profile_job("optimize_entry_time"):
+        return _optimize_entry_time(spread, auction_dates, symmetric, multiplier, trade_rule)
+
+
+def _optimize_entry_time(
+    spread: Union[pd.DataFrame, pd.Series],
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DatetimeIndex, pd.DataFrame],
+    symmetric: bool,
+    multiplier: int,
+    trade_rule: Callable,
+) -> Union[Number, Tuple[Number, Number]]:
     if symmetric:
         # Calculate PnL for both pre- and post-auction periods.
         def _calc_pnl(spread, auction_dates, n=None, multiplier=None, trade_rule=trade_rule):
@@ -268,51 +295,83 @@ def optimize_entry_time(
         return res_pre, res_post
 
 
+def draw_single_trade(
+    ax,
+    days_before: Union[pd.DataFrame, pd.Series],
+    days_after: Union[pd.DataFrame, pd.Series],
+    auction_date: pd.Timestamp,
+    before_pnl: Number,
+    after_pnl: Number,
+    n: Number,
+    artists: dict = None,
+) -> dict:
+    """
+    Draw the spread around one auction on ax. Shared by plot_single_trade and
+    auction_trading.reports, which redraws many auctions on the same axes.
+    :param ax: Matplotlib axes.
+    :param days_before: Pre-auction window, from calc_n_prior.
+    :param days_after: Post-auction window, from calc_n_prior.
+    :param auction_date: Date of auction.
+    :param before_pnl: Pre-auction PnL.
+    :param after_pnl: Post-auction PnL.
+    :param n: Days before/after, for the title.
+    :param artists: Artists returned by a previous call on the same ax. If given, they are
+                    updated in place instead of drawing the chart again.
+    :return: Dict of the artists.
+    """
+
+    # Concat the two series.
+    window = pd.concat([days_before, days_after])
+    values = window.values.reshape(len(window), -1)[:, 0]
+
+    # Make the auction date at 1pm
+    auction_date = auction_date.replace(hour=13, minute=0, second=0, microsecond=0)
+    pnl_text = f"PnL Before: ${before_pnl:,.2f}\nPnL After: ${after_pnl:,.2f}"
+    title = f"Spread for {n} Days Before and After Auction Date"
+
+    if artists is None:
+        # Plot the series.
+        (line,) = ax.plot(window.index, values, label="Spread")
+
+        # Add vertical line at auction date.
+        vline = ax.axvline(auction_date, color="red", linestyle="--", label="Auction Date")
+
+        # Add one label for the PnL before auction
+        text = ax.text(0.2, 0.99, pnl_text, ha="left", va="top", transform=ax.transAxes)
+
+        ax.legend()
+        ax.set_title(title)
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Spread (bp)")
+        return {"line": line, "vline": vline, "text": text}
+
+    artists["line"].set_data(window.index, values)
+    artists["vline"].set_xdata([auction_date, auction_date])
+    artists["text"].set_text(pnl_text)
+    ax.set_title(title)
+    ax.relim()
+    ax.autoscale_view()
+    return artists
+
+
 def plot_single_trade(
-    spread: Union[pd.DataFrame, pd.Series], auction_date: pd.Timestamp, n: Number
+    spread: Union[pd.DataFrame, pd.Series], auction_date: pd.Timestamp, n: Number, multiplier: int = 10_000
 ) -> None:
     """
     Plot the spread for n days before and after the auction. Include a vertical line at the auction date.
     :param spread: Spread to trade.
     :param auction_date: Date of auction.
     :param n: Days before to enter/close position.
+    :param multiplier: Multiplier to use for PnL calculation.
     :return: None
     """
 
     fig, ax = plt.subplots(figsize=(16, 9))
 
-    # Plot the spread.
+    # Calculate the windows once, for both the plot and the PnL.
     days_before, days_after = calc_n_prior(spread, auction_date, n)
+    before_pnl, after_pnl = calc_single_trade(days_before, days_after, multiplier)
 
-    # Concat the two series.
-    days_before = pd.concat([days_before, days_after])
-
-    # Plot the series.
-    days_before.plot(ax=ax, label="Spread")
-
-    # Add vertical line at auction date.
-    # Make the auction date at 1pm
-    auction_date = auction_date.replace(hour=13, minute=0, second=0, microsecond=0)
-    ax.axvline(auction_date, color="red", linestyle="--", label="Auction Date")
-
-    # Calculate PnL.
-    before_pnl, after_pnl = calc_slope_curve(spread, auction_date, n)
-
-    # Add one label for the PnL before auction
-    ax.text(
-        0.2,
-        0.99,
-        f"PnL Before: ${before_pnl:,.2f}\nPnL After: ${after_pnl:,.2f}",
-        ha="left",
-        va="top",
-        transform=ax.transAxes,
-    )
-
-    ax.legend()
-
-    ax.set_title(f"Spread for {n} Days Before and After Auction Date")
-
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Spread (bp)")
+    draw_single_trade(ax, days_before, days_after, auction_date, before_pnl, after_pnl, n)
 
     plt.show()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Portfolio view of the auction trades of several spreads.
+
+calc_all_trades prices each auction of one spread on its own, but the 2Y, 5Y and 7Y
+auctions of the same week hold overlapping positions in TU/FV, FV/TY and TY/UXY. Portfolio
+lays every leg of every trade onto one shared intraday timeline as a sparse (time x spread)
+matrix of position changes, +side at the entry bar and -side at the exit bar, so that
+
+    positions = cumsum(deltas)                      (units held after each bar)
+    pnl_t     = positions_t-1 * (x_t - x_t-1) * multiplier
+
+is the mark-to-market PnL of the combined book. Summed over the history it equals the summed
+endpoint PnL of calc_all_trades (check), and in between it gives exposures, rolling risk and
+daily capital usage:
+
+    >>> book = Portfolio()
+    >>> book.add("TU/FV", df["TU/FV"], twos, n=2)
+    >>> book.add("FV/TY", df["FV/TY"], fives, n=2)
+    >>> book.pnl()["total"].cumsum().plot()
+    >>> book.daily(margin={"TU/FV": 1_500, "FV/TY": 2_000})
+    >>> # Sizes and costs scale together, so the net PnL still reconciles:
+    >>> book.add("TY/UXY", dollar_spread, sevens, n=2, multiplier=1, size=2, cost_model=CostModel())
+    >>> assert book.check()["ok"].all()
+
+NOTE: Duplicate timestamps are dropped from each spread (keeping the last bar) before the
+      trades are computed, so calc_n_prior and the timeline see the same bars.
+"""
+
+from typing import Callable, Dict, Iterable, Mapping, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from auction_trading.is_oos import rule_signs
+from auction_trading.pnl_calcs import calc_all_trades
+from auction_trading.spreads import rolling_covariance
+from auction_trading.utils import Number
+
+_LEGS = (
+    ("Enter at Pre-Auction Time", "Exit at Pre-Auction Time", "Pre-Auction Cost"),
+    ("Enter at Post-Auction Time", "Exit at Post-Auction Time", "Post-Auction Cost"),
+)
+
+
+class Portfolio:
+    """
+    Auction trades of several spreads on one timeline.
+    """
+
+    def __init__(self):
+        self.books: Dict[str, Dict] = {}
+        self._built = None
+
+    def __len__(self) -> int:
+        return len(self.books)
+
+    def add(
+        self,
+        name: str,
+        spread: Union[pd.DataFrame, pd.Series],
+        auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+        n: Union[Tuple[Number, Number], Number],
+        multiplier: int = 10_000,
+        trade_rule: Callable = lambda x: ("steepener", "flattener"),
+        size: float = 1.0,
+        cost_model=None,
+    ) -> pd.DataFrame:
+        """
+        Trade a spread around the given auctions, as calc_all_trades.
+        :param name: Name of the book, eg. "TU/FV".
+        :param spread: Spread to trade. For a DataFrame the first column is used.
+        :param auction_dates: Auction dates or table.
+        :param n: Days before/after the auction.
+        :param multiplier: Multiplier to use for PnL calculation (1 for the dollar PnL series
+                           of spreads.build_spreads).
+        :param trade_rule: Trade rule, as passed to calc_all_trades.
+        :param size: Units of the spread per trade, scales the positions and the costs.
+        :param cost_model: Optional costs.CostModel, costs are booked at the exit of each leg.
+        :return: The trades of calc_all_trades.
+        """
+        if isinstance(spread, pd.DataFrame):
+            spread = spread.iloc[:, 0]
+        spread = spread[~spread.index.duplicated(keep="last")].sort_index()
+        trades = calc_all_trades(spread, auction_dates, n, multiplier, trade_rule, cost_model)
+        sign_pre, sign_post = rule_signs({"rule": trade_rule}, auction_dates)
+        self.add_trades(name, spread, trades, sign_pre[0], sign_post[0], multiplier, size)
+        return trades
+
+    def add_trades(
+        self,
+        name: str,
+        spread: pd.Series,
+        trades: pd.DataFrame,
+        sides_pre: Iterable[float],
+        sides_post: Iterable[float],
+        multiplier: int = 10_000,
+        size: float = 1.0,
+    ) -> None:
+        """
+        Add trades that were already computed.
+        :param spread: The (deduplicated) spread the trades were computed on.
+        :param trades: Output of calc_all_trades.
+        :param sides_pre: +1 (steepener) / -1 (flattener) of each pre-auction leg.
+        :param sides_post: Same for the post-auction leg.
+        """
+        if name in self.books:
+            raise ValueError(f"Book {name!r} already exists.")
+        self.books[name] = {
+            "spread": spread,
+            "trades": trades,
+            "sides": (np.asarray(sides_pre, dtype=float), np.asarray(sides_post, dtype=float)),
+            "multiplier": multiplier,
+            "size": size,
+        }
+        self._built = None
+
+    # -- Timeline --------------------------------------------------------------------------
+
+    def _build(self) -> Dict:
+        if self._built is not None:
+            return self._built
+        if not self.books:
+            raise ValueError("Portfolio has no books.")
+
+        names = list(self.books)
+        timeline = pd.DatetimeIndex(
+            np.unique(
+                np.concatenate(
+                    [np.asarray(b["spread"].index, dtype="datetime64[ns]") for b in self.books.values()]
+                )
+            )
+        )
+        T, K = len(timeline), len(names)
+
+        # Spread levels on the shared timeline, carried forward over bars a spread does not have.
+        prices = np.column_stack([b["spread"].reindex(timeline).ffill().values for b in self.books.values()])
+        multiplier = np.array([b["multiplier"] for b in self.books.values()], dtype=float)
+
+        rows, cols, data, cost_rows, cost_cols, cost_data = [], [], [], [], [], []
+        for k, book in enumerate(self.books.values()):
+            trades = book["trades"]
+            for (enter, exit_, cost), side in zip(_LEGS, book["sides"]):
+                ok = trades[enter].notna().values & trades[exit_].notna().values
+                start = timeline.get_indexer(pd.DatetimeIndex(trades[enter][ok]))
+                end = timeline.get_indexer(pd.DatetimeIndex(trades[exit_][ok]))
+                rows += [start, end]
+                cols += [np.full(len(start), k), np.full(len(end), k)]
+                data += [side[ok] * book["size"], -side[ok] * book["size"]]
+                if cost in trades.columns:
+                    cost_rows.append(end)
+                    cost_cols.append(np.full(len(end), k))
+                    # calc_all_trades costs are per unit, like its PnL.
+                    cost_data.append(trades[cost].values[ok].astype(float) * book["size"])
+
+        # Duplicate (row, col) entries are summed, eg. a pre-auction exit and post-auction
+        # entry on the same bar.
+        deltas = sparse.coo_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(T, K)
+        ).tocsc()
+        costs = np.zeros((T, K))
+        if cost_rows:
+            np.add.at(
+                costs, (np.concatenate(cost_rows), np.concatenate(cost_cols)), np.concatenate(cost_data)
+            )
+
+        self._built = {
+            "names": names,
+            "timeline": timeline,
+            "prices": prices,
+            "multiplier": multiplier,
+            "deltas": deltas,
+            "costs": costs,
+        }
+        return self._built
+
+    @property
+    def timeline(self) -> pd.DatetimeIndex:
+        return self._build()["timeline"]
+
+    @property
+    def deltas(self) -> sparse.csc_matrix:
+        """
+        Sparse (time, spread) matrix of position changes, in units of the spread.
+        """
+        return self._build()["deltas"]
+
+    def positions(self) -> pd.DataFrame:
+        """
+        Units of each spread held after each bar.
+        """
+        b = self._build()
+        pos = np.cumsum(b["deltas"].toarray(), axis=0)
+        # Clean up the float residue of positions that net to zero.
+        pos[np.abs(pos) < 1e-12] = 0.0
+        return pd.DataFrame(pos, index=b["timeline"], columns=b["names"])
+
+    # -- PnL and risk ----------------------------------------------------------------------
+
+    def pnl(self, net: bool = True) -> pd.DataFrame:
+        """
+        Mark-to-market PnL per bar of each book and of the total book.
+        :param net: Subtract the costs of cost_model (booked at the exit of each leg).
+        """
+        b = self._build()
+        pos = self.positions().values
+        change = np.diff(b["prices"], axis=0, prepend=np.nan)
+        held = np.vstack([np.zeros((1, pos.shape[1])), pos[:-1]])
+        pnl = np.where(held != 0, held * change, 0.0) * b["multiplier"]
+        if net:
+            pnl = pnl - b["costs"]
+        out = pd.DataFrame(pnl, index=b["timeline"], columns=b["names"])
+        out["total"] = out.sum(axis=1)
+        return out
+
+    def endpoint_pnl(self) -> pd.Series:
+        """
+        Summed calc_all_trades PnL of each book, times its size.
+        """
+        return pd.Series(
+            {
+                name: (
+                    book["trades"]["Pre-Auction PnL"].astype(float).sum()
+                    + book["trades"]["Post-Auction PnL"].astype(float).sum()
+                )
+                * book["size"]
+                for name, book in self.books.items()
+            }
+        )
+
+    def check(self, rtol: float = 1e-9) -> pd.DataFrame:
+        """
+        Compare the total mark-to-market PnL of each book with its summed endpoint PnL.
+        """
+        mtm = self.pnl().drop(columns="total").sum()
+        end = self.endpoint_pnl()
+        out = pd.DataFrame({"mtm": mtm, "endpoint": end})
+        out["ok"] = np.isclose(out["mtm"], out["endpoint"], rtol=rtol, atol=1e-6)
+        return out
+
+    def exposure(self, units: Mapping[str, float] = None) -> pd.DataFrame:
+        """
+        Gross and net exposure of the book after each bar.
+        :param units: Exposure of one unit of each spread, eg. its DV01 in dollars. Defaults
+                      to 1 (exposures are then in units of spread).
+        :return: DataFrame with long, short, gross, net and the number of open books.
+        """
+        pos = self.positions()
+        scale = np.array([(units or {}).get(c, 1.0) for c in pos.columns], dtype=float)
+        exp = pos.values * scale
+        return pd.DataFrame(
+            {
+                "long": np.where(exp > 0, exp, 0.0).sum(axis=1),
+                "short": np.where(exp < 0, exp, 0.0).sum(axis=1),
+                "gross": np.abs(exp).sum(axis=1),
+                "net": exp.sum(axis=1),
+                "open_books": (exp != 0).sum(axis=1),
+            },
+            index=pos.index,
+        )
+
+    def rolling_risk(self, window: int = 60, min_periods: int = None) -> pd.DataFrame:
+        """
+        Rolling risk of the total book, per bar.
+        :param window: Bars in the rolling window.
+        :param min_periods: Minimum bars, defaults to window // 2.
+        :return: DataFrame with
+                 - realized_vol: rolling std of the total PnL per bar.
+                 - ex_ante_vol: sqrt(w' C w) of the positions held after the bar, with C the
+                   rolling covariance of the books' PnL per unit (spreads.rolling_covariance).
+                 - drawdown: cumulative PnL minus its running maximum.
+        """
+        b = self._build()
+        min_periods = min_periods or max(window // 2, 2)
+        pnl = self.pnl()
+        total = pnl["total"]
+
+        unit_changes = np.diff(b["prices"], axis=0, prepend=np.nan) * b["multiplier"]
+        cov = rolling_covariance(unit_changes, window, min_periods)
+        pos = self.positions().values
+        with np.errstate(invalid="ignore"):
+            ex_ante = np.sqrt(np.einsum("tk,tkl,tl->t", pos, cov, pos))
+        ex_ante[(pos == 0).all(axis=1)] = 0.0
+
+        equity = total.cumsum()
+        return pd.DataFrame(
+            {
+                "realized_vol": total.rolling(window, min_periods=min_periods).std().values,
+                "ex_ante_vol": ex_ante,
+                "drawdown": (equity - equity.cummax()).values,
+            },
+            index=b["timeline"],
+        )
+
+    def daily(self, margin: Mapping[str, float] = None, units: Mapping[str, float] = None) -> pd.DataFrame:
+        """
+        Daily summary of the book.
+        :param margin: Capital (eg. initial margin) per unit of each spread. Defaults to 1.
+        :param units: Exposure per unit of each spread, see exposure.
+        :return: DataFrame per day with the PnL, maximum gross exposure, capital used (maximum
+                 over the day of sum |units| * margin), units traded and open books.
+        """
+        pos = self.positions()
+        margin_vec = np.array([(margin or {}).get(c, 1.0) for c in pos.columns], dtype=float)
+        capital = pd.Series(np.abs(pos.values) @ margin_vec, index=pos.index)
+        exposure = self.exposure(units)
+        traded = pd.Series(np.asarray(abs(self.deltas).sum(axis=1)).ravel(), index=pos.index)
+
+        day = pos.index.normalize()
+        return pd.DataFrame(
+            {
+                "pnl": self.pnl()["total"].groupby(day).sum(),
+                "max_gross": exposure["gross"].groupby(day).max(),
+                "capital": capital.groupby(day).max(),
+                "traded": traded.groupby(day).sum(),
+                "max_open_books": exposure["open_books"].groupby(day).max(),
+            }
+        )
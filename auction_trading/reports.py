@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Batch rendering of the per-auction trade charts of plot_single_trade.
+
+plot_single_trade computes the windows and PnL of one auction and opens an interactive
+figure. trade_report renders every auction of a calc_all_trades run instead:
+
+- The windows are sliced from the spread at the enter/exit times of the trades table, so
+  calc_n_prior is not run again (and the PnL shown is the table's, net of costs if any).
+- Charts are drawn with the Agg canvas in a process pool. Each worker draws its auctions on
+  one figure, updating the artists of draw_single_trade in place, and returns PNG bytes.
+- The pages are written as one multi-page PDF or a self-contained HTML gallery.
+
+    >>> trades = calc_all_trades(spread, auction_dates, n=2)
+    >>> trade_report(spread, trades, "twos.html", n=2)
+    >>> trade_report(spread, trades, "twos.pdf", n=2, processes=4)
+"""
+
+import base64
+import html
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.instrumentation import count, timed
+from auction_trading.pnl_calcs import draw_single_trade
+from auction_trading.utils import Number
+
+# (auction date, pre-auction window, post-auction window, pre PnL, post PnL)
+TradeWindow = Tuple[pd.Timestamp, pd.Series, pd.Series, float, float]
+
+_PRE, _POST = "Pre-Auction", "Post-Auction"
+
+
+def trade_windows(spread: Union[pd.DataFrame, pd.Series], trades: pd.DataFrame) -> Iterator[TradeWindow]:
+    """
+    Pre- and post-auction windows of every trade, sliced at the enter/exit times of a
+    calc_all_trades table. Same rows as calc_n_prior (inclusive on both ends).
+    :param spread: Spread the trades were computed on, sorted by time.
+    :param trades: Output of calc_all_trades.
+    """
+    if isinstance(spread, pd.DataFrame):
+        spread = spread.iloc[:, 0]
+    index = spread.index.values
+
+    def bounds(leg: str) -> Tuple[np.ndarray, np.ndarray]:
+        enter = trades[f"Enter at {leg} Time"].values.astype(index.dtype)
+        exit = trades[f"Exit at {leg} Time"].values.astype(index.dtype)
+        return np.searchsorted(index, enter, "left"), np.searchsorted(index, exit, "right")
+
+    pre_start, pre_end = bounds(_PRE)
+    post_start, post_end = bounds(_POST)
+    pre_pnl, post_pnl = trades[f"{_PRE} PnL"].values, trades[f"{_POST} PnL"].values
+    for k, date in enumerate(trades.index):
+        yield (
+            pd.Timestamp(date),
+            spread.iloc[pre_start[k] : pre_end[k]],
+            spread.iloc[post_start[k] : post_end[k]],
+            float(pre_pnl[k]),
+            float(post_pnl[k]),
+        )
+
+
+class TradeCanvas:
+    """
+    One Agg figure, reused for every chart drawn on it.
+    """
+
+    def __init__(self, figsize: Tuple[float, float] = (12, 6.75), dpi: int = 80):
+        # Figure and the Agg canvas directly, without pyplot, so nothing is shown and the
+        # interactive backend of the caller is not touched.
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.artists = None
+
+    def render(self, window: TradeWindow, n: Number) -> bytes:
+        """
+        :return: PNG of the chart of one auction.
+        """
+        date, before, after, pre_pnl, post_pnl = window
+        self.artists = draw_single_trade(self.ax, before, after, date, pre_pnl, post_pnl, n, self.artists)
+        buf = io.BytesIO()
+        # Fast zlib level: the pages are rendered in bulk and the size difference is small.
+        self.fig.savefig(buf, format="png", pil_kwargs={"compress_level": 1})
+        count("trade_charts")
+        return buf.getvalue()
+
+
+# Worker processes keep their canvas between chunks.
+_canvas = None
+
+
+def _render_chunk(args: Tuple[List[TradeWindow], Number, Tuple[float, float], int]) -> List[bytes]:
+    global _canvas
+    windows, n, figsize, dpi = args
+    if _canvas is None or _canvas.fig.get_dpi() != dpi or tuple(_canvas.fig.get_size_inches()) != figsize:
+        _canvas = TradeCanvas(figsize, dpi)
+    return [_canvas.render(window, n) for window in windows]
+
+
+@timed()
+def render_trade_charts(
+    spread: Union[pd.DataFrame, pd.Series],
+    trades: pd.DataFrame,
+    n: Number,
+    processes: int = None,
+    figsize: Tuple[float, float] = (12, 6.75),
+    dpi: int = 80,
+    chunk_size: int = 32,
+) -> List[bytes]:
+    """
+    PNG chart of every trade, in the order of the trades table.
+    :param spread: Spread the trades were computed on.
+    :param trades: Output of calc_all_trades.
+    :param n: Days before/after, for the chart titles.
+    :param processes: Worker processes. Defaults to the number of CPUs, 1 renders here.
+    :param figsize: Figure size in inches.
+    :param dpi: Resolution of the PNGs.
+    :param chunk_size: Charts per task.
+    :return: List of PNG bytes.
+    """
+    windows = list(trade_windows(spread, trades))
+    figsize = tuple(float(x) for x in figsize)
+    chunks = [(windows[i : i + chunk_size], n, figsize, dpi) for i in range(0, len(windows), chunk_size)]
+    processes = min(processes or os.cpu_count() or 1, max(len(chunks), 1))
+
+    if processes == 1:
+        pages = [_render_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            pages = list(pool.map(_render_chunk, chunks))
+    return [png for chunk in pages for png in chunk]
+
+
+def write_pdf(pngs: Sequence[bytes], path: str) -> str:
+    """
+    One PDF page per chart.
+    """
+    from PIL import Image
+
+    images = [Image.open(io.BytesIO(png)).convert("RGB") for png in pngs]
+    if not images:
+        raise ValueError("No charts to write.")
+    images[0].save(path, format="PDF", save_all=True, append_images=images[1:])
+    return path
+
+
+def write_html(pngs: Sequence[bytes], path: str, trades: pd.DataFrame, title: str = "Auction trades") -> str:
+    """
+    Self-contained HTML gallery: a summary table of the trades, then one chart per auction
+    with its PnL, the images inlined as base64.
+    """
+    pnl_cols = [c for c in trades.columns if c.endswith("PnL") or c.endswith("Cost")]
+    total = trades[pnl_cols].sum().to_frame("Total").T
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif;margin:1em}"
+        ".chart{display:inline-block;margin:0.5em;vertical-align:top}"
+        ".chart img{width:600px}table{border-collapse:collapse}"
+        "td,th{padding:2px 8px;text-align:right}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        total.to_html(float_format="{:,.2f}".format),
+    ]
+    for date, png, (_, row) in zip(trades.index, pngs, trades.iterrows()):
+        label = (
+            f"{pd.Timestamp(date):%Y-%m-%d}: pre ${row[f'{_PRE} PnL']:,.2f}, post ${row[f'{_POST} PnL']:,.2f}"
+        )
+        parts.append(
+            f"<div class='chart' id='{pd.Timestamp(date):%Y%m%d}'><div>{html.escape(label)}</div>"
+            f"<img src='data:image/png;base64,{base64.b64encode(png).decode()}'></div>"
+        )
+    parts.append("</body></html>")
+
+    with open(path, "w") as f:
+        f.write("\n".join(parts))
+    return path
+
+
+@timed()
+def trade_report(
+    spread: Union[pd.DataFrame, pd.Series],
+    trades: pd.DataFrame,
+    path: str,
+    n: Number,
+    processes: int = None,
+    title: str = None,
+    **render_kwargs,
+) -> str:
+    """
+    Render every trade of a calc_all_trades table to a PDF or HTML report.
+    :param spread: Spread the trades were computed on.
+    :param trades: Output of calc_all_trades.
+    :param path: Output file, .pdf or .html.
+    :param n: Days before/after, for the chart titles.
+    :param processes: Worker processes, see render_trade_charts.
+    :param title: HTML page title.
+    :param render_kwargs: figsize, dpi or chunk_size for render_trade_charts.
+    :return: path.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".pdf", ".html", ".htm"):
+        raise ValueError(f"Unknown report format {ext!r}, expected .pdf or .html.")
+
+    pngs = render_trade_charts(spread, trades, n, processes, **render_kwargs)
+    if ext == ".pdf":
+        return write_pdf(pngs, path)
+    return write_html(pngs, path, trades, title or f"Auction trades, n = {n}")
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Persistent store for backtest and sweep results, backed by a local SQLite file.
+
+Each call to calc_all_trades, optimize_entry_time or a model backtest is stored as a "run",
+keyed by spread, trade rule, window parameters, data version and model hash. Per-auction
+trades and PnL time series are stored in their own tables so that reports can read them
+back without recomputing:
+
+    >>> store = ResultsStore("results.db")
+    >>> trades = cached_calc_all_trades(store, df["C2"], twos, (2, 2), spread_name="C2")
+    >>> store.best_configs(spread="C2", top=5)
+"""
+
+import hashlib
+import inspect
+import json
+import pickle
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.schema import tenor_mask
+from auction_trading.utils import Number
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    spread TEXT,
+    trade_rule TEXT,
+    symmetric INTEGER,
+    n_prev REAL,
+    n_post REAL,
+    multiplier REAL,
+    data_version TEXT,
+    model_hash TEXT,
+    params TEXT,
+    pre_pnl REAL,
+    post_pnl REAL,
+    total_pnl REAL,
+    n_trades INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (spread, trade_rule, n_prev, n_post, data_version);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model_hash, data_version);
+CREATE INDEX IF NOT EXISTS runs_pnl ON runs (kind, total_pnl);
+
+CREATE TABLE IF NOT EXISTS trades (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    auction_date INTEGER NOT NULL,
+    enter_pre INTEGER,
+    exit_pre INTEGER,
+    pre_pnl REAL,
+    enter_post INTEGER,
+    exit_post INTEGER,
+    post_pnl REAL
+);
+CREATE INDEX IF NOT EXISTS trades_run ON trades (run_id, auction_date);
+
+CREATE TABLE IF NOT EXISTS pnl (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    ts INTEGER NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS pnl_run ON pnl (run_id, ts);
+"""
+
+# Mapping between the calc_all_trades columns and the trades table.
+_TRADE_COLUMNS = {
+    "Enter at Pre-Auction Time": "enter_pre",
+    "Exit at Pre-Auction Time": "exit_pre",
+    "Pre-Auction PnL": "pre_pnl",
+    "Enter at Post-Auction Time": "enter_post",
+    "Exit at Post-Auction Time": "exit_post",
+    "Post-Auction PnL": "post_pnl",
+}
+_TIME_COLUMNS = ("enter_pre", "exit_pre", "enter_post", "exit_post")
+
+_RUN_KEYS = (
+    "kind",
+    "spread",
+    "trade_rule",
+    "symmetric",
+    "n_prev",
+    "n_post",
+    "multiplier",
+    "data_version",
+    "model_hash",
+    "params",
+)
+
+
+def data_version(data: Union[pd.DataFrame, pd.Series, pd.Index, Iterable]) -> str:
+    """
+    Content hash of the input data, so results can be matched to the data they came from.
+    Auction tables are hashed on their dates and bond_series (which set the calc_n_prior
+    windows and feed the trade rules), not on the other auction result columns.
+    :param data: Spread, auction table or list of auction dates.
+    :return: Hex digest.
+    """
+    if isinstance(data, pd.DataFrame) and "bond_series" in data.columns:
+        data = pd.Series(tenor_mask(data["bond_series"]), index=data.index)
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        hashed = pd.util.hash_pandas_object(data, index=True).values
+    else:
+        hashed = pd.util.hash_pandas_object(pd.Index(list(data))).values
+    return hashlib.sha1(hashed.tobytes()).hexdigest()[:16]
+
+
+def rule_name(trade_rule: Callable) -> str:
+    """
+    Stable key for a trade rule: its name (for display) and a hash of its source, so that a
+    rule redefined with a different body, or two different lambdas, are not stored under the
+    same key. Without source (eg. defined in an interactive shell) the bytecode and constants
+    are hashed instead.
+    :param trade_rule: Trade rule passed to calc_all_trades.
+    :return: Key of the rule, eg. "twos_rule:3f2a9c01b4d7".
+    """
+    name = getattr(trade_rule, "__name__", type(trade_rule).__name__)
+    if name == "<lambda>":
+        name = "lambda"
+    func = getattr(trade_rule, "__func__", trade_rule)
+    try:
+        source = inspect.getsource(func).strip()
+    except (OSError, TypeError):
+        code = getattr(func, "__code__", None)
+        source = repr((code.co_code, code.co_consts)) if code is not None else repr(trade_rule)
+    # Defaults and closure values change the rule without changing its source.
+    cells = tuple(c.cell_contents for c in (getattr(func, "__closure__", None) or ()))
+    source += repr((getattr(func, "__defaults__", None), cells))
+    return name + ":" + hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def model_hash(model) -> str:
+    """
+    Hash of a fitted model's parameters. Supports Keras models, XGBoost boosters/estimators
+    and anything picklable.
+    :param model: Fitted model.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha1()
+    if hasattr(model, "get_weights"):
+        for w in model.get_weights():
+            digest.update(np.ascontiguousarray(w).tobytes())
+    elif hasattr(model, "get_booster"):
+        digest.update(bytes(model.get_booster().save_raw()))
+    elif hasattr(model, "save_raw"):
+        digest.update(bytes(model.save_raw()))
+    else:
+        digest.update(pickle.dumps(model))
+    return digest.hexdigest()[:16]
+
+
+def _split_n(n: Union[Tuple[Number, Number], Number]) -> Tuple[int, float, float]:
+    if isinstance(n, tuple):
+        return 0, float(n[0]), float(n[1])
+    return 1, float(n), float(n)
+
+
+def _to_ns(values: pd.Series) -> List:
+    values = pd.to_datetime(values)
+    return [None if pd.isna(v) else v.value for v in values]
+
+
+class ResultsStore:
+    """
+    SQLite-backed store of backtest runs, per-auction trades and PnL time series.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        :param path: SQLite database file. Created if it does not exist.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # --------------------------------------------------------------------------------------
+    # Writes.
+    # --------------------------------------------------------------------------------------
+    def _insert_run(self, run: Dict) -> int:
+        row = {k: run.get(k) for k in _RUN_KEYS}
+        if isinstance(row["params"], dict):
+            row["params"] = json.dumps(row["params"], sort_keys=True, default=str)
+        row.update(
+            pre_pnl=run.get("pre_pnl"),
+            post_pnl=run.get("post_pnl"),
+            total_pnl=run.get("total_pnl"),
+            n_trades=run.get("n_trades"),
+            created_at=pd.Timestamp.now().isoformat(),
+        )
+        cols = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        cur = self.conn.execute(f"INSERT INTO runs ({cols}) VALUES ({marks})", list(row.values()))
+        return cur.lastrowid
+
+    def _insert_trades(self, run_id: int, trades: pd.DataFrame) -> None:
+        df = trades.rename(columns=_TRADE_COLUMNS)
+        columns = {"auction_date": _to_ns(pd.Series(trades.index))}
+        for col in _TIME_COLUMNS:
+            columns[col] = _to_ns(df[col])
+        for col in ("pre_pnl", "post_pnl"):
+            columns[col] = df[col].astype(float).tolist()
+        rows = zip(
+            [run_id] * len(df),
+            columns["auction_date"],
+            columns["enter_pre"],
+            columns["exit_pre"],
+            columns["pre_pnl"],
+            columns["enter_post"],
+            columns["exit_post"],
+            columns["post_pnl"],
+        )
+        self.conn.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def append_many(self, runs: Iterable[Dict]) -> List[int]:
+        """
+        Bulk-append runs in a single transaction. Each run is a dict with the run keys
+        (kind, spread, trade_rule, n, multiplier, data_version, model_hash, params) and
+        optionally "trades" (a calc_all_trades DataFrame) and/or "pnl" (a Series of PnL
+        indexed by time).
+        :param runs: Iterable of run dicts.
+        :return: List of run ids.
+        """
+        run_ids = []
+        with self.conn:
+            for run in runs:
+                run = dict(run)
+                if "n" in run:
+                    run["symmetric"], run["n_prev"], run["n_post"] = _split_n(run.pop("n"))
+                if callable(run.get("trade_rule")):
+                    run["trade_rule"] = rule_name(run["trade_rule"])
+                trades = run.pop("trades", None)
+                pnl = run.pop("pnl", None)
+                if trades is not None:
+                    run.setdefault("kind", "auction")
+                    run["pre_pnl"] = float(trades["Pre-Auction PnL"].sum())
+                    run["post_pnl"] = float(trades["Post-Auction PnL"].sum())
+                    run["total_pnl"] = run["pre_pnl"] + run["post_pnl"]
+                    run["n_trades"] = len(trades)
+                elif pnl is not None:
+                    run.setdefault("kind", "model")
+                    run.setdefault("total_pnl", float(pnl.iloc[-1]) if len(pnl) else None)
+                run_id = self._insert_run(run)
+                if trades is not None:
+                    self._insert_trades(run_id, trades)
+                if pnl is not None:
+                    self.conn.executemany(
+                        "INSERT INTO pnl VALUES (?, ?, ?)",
+                        zip([run_id] * len(pnl), _to_ns(pd.Series(pnl.index)), pnl.astype(float).tolist()),
+                    )
+                run_ids.append(run_id)
+        return run_ids
+
+    def append_trades(
+        self,
+        trades: pd.DataFrame,
+        spread: str,
+        trade_rule: Union[str, Callable],
+        n: Union[Tuple[Number, Number], Number],
+        multiplier: int = 10_000,
+        data_version: str = None,
+        params: Dict = None,
+    ) -> int:
+        """
+        Append the output of calc_all_trades as one run.
+        :return: Run id.
+        """
+        return self.append_many(
+            [
+                {
+                    "kind": "auction",
+                    "trades": trades,
+                    "spread": spread,
+                    "trade_rule": trade_rule,
+                    "n": n,
+                    "multiplier": multiplier,
+                    "data_version": data_version,
+                    "params": params,
+                }
+            ]
+        )[0]
+
+    def append_pnl_series(
+        self,
+        pnl: pd.Series,
+        spread: str = None,
+        model_hash: str = None,
+        data_version: str = None,
+        params: Dict = None,
+        kind: str = "model",
+    ) -> int:
+        """
+        Append a PnL time series, eg. backtest(...)["cum_pnl"], as one run.
+        :return: Run id.
+        """
+        return self.append_many(
+            [
+                {
+                    "kind": kind,
+                    "pnl": pnl,
+                    "spread": spread,
+                    "model_hash": model_hash,
+                    "data_version": data_version,
+                    "params": params,
+                }
+            ]
+        )[0]
+
+    # --------------------------------------------------------------------------------------
+    # Reads.
+    # --------------------------------------------------------------------------------------
+    def query_runs(self, min_total_pnl: float = None, **filters) -> pd.DataFrame:
+        """
+        Runs matching the given column filters, eg. spread="C2", trade_rule="fun_1".
+        A filter value can be a list to match any of its values. trade_rule also accepts the
+        rule itself, and a bare name matches every version of the rule with that name.
+        :param min_total_pnl: Only return runs with at least this total PnL.
+        :return: DataFrame of runs indexed by run_id.
+        """
+        clauses, args = [], []
+        for key, value in filters.items():
+            if key not in _RUN_KEYS:
+                raise ValueError(f"Unknown filter: {key}")
+            if key == "trade_rule" and callable(value):
+                value = rule_name(value)
+            if key == "trade_rule" and isinstance(value, str) and ":" not in value:
+                clauses.append("trade_rule LIKE ?")
+                args.append(value + ":%")
+            elif isinstance(value, (list, tuple, set)):
+                clauses.append(f"{key} IN ({', '.join('?' for _ in value)})")
+                args.extend(value)
+            elif value is None:
+                clauses.append(f"{key} IS NULL")
+            else:
+                clauses.append(f"{key} = ?")
+                args.append(value)
+        if min_total_pnl is not None:
+            clauses.append("total_pnl >= ?")
+            args.append(min_total_pnl)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return pd.read_sql_query(f"SELECT * FROM runs {where}", self.conn, params=args, index_col="run_id")
+
+    def best_configs(self, top: int = 10, by: str = "total_pnl", **filters) -> pd.DataFrame:
+        """
+        Best runs by total (or pre/post) PnL.
+        :param top: Number of runs to return.
+        :param by: "total_pnl", "pre_pnl" or "post_pnl".
+        :return: DataFrame of runs, best first.
+        """
+        if by not in ("total_pnl", "pre_pnl", "post_pnl"):
+            raise ValueError(f"Cannot rank by {by}")
+        return self.query_runs(**filters).sort_values(by, ascending=False).head(top)
+
+    def find_run(
+        self,
+        spread: str,
+        trade_rule: Union[str, Callable],
+        n: Union[Tuple[Number, Number], Number],
+        data_version: str = None,
+        multiplier: int = 10_000,
+    ) -> Union[int, None]:
+        """
+        Latest auction run with exactly these parameters, or None.
+        """
+        symmetric, n_prev, n_post = _split_n(n)
+        rule = rule_name(trade_rule) if callable(trade_rule) else trade_rule
+        row = self.conn.execute(
+            "SELECT MAX(run_id) FROM runs WHERE kind = 'auction' AND spread = ? AND trade_rule = ? "
+            "AND symmetric = ? AND n_prev = ? AND n_post = ? AND multiplier = ? AND data_version IS ?",
+            (spread, rule, symmetric, n_prev, n_post, multiplier, data_version),
+        ).fetchone()
+        return row[0]
+
+    def load_trades(self, run_id: int) -> pd.DataFrame:
+        """
+        Trades of a run in the calc_all_trades format.
+        """
+        df = pd.read_sql_query(
+            "SELECT * FROM trades WHERE run_id = ? ORDER BY auction_date", self.conn, params=(run_id,)
+        )
+        for col in ("auction_date",) + _TIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col])
+        df = df.set_index("auction_date").drop(columns="run_id")
+        df.index.name = None
+        return df.rename(columns={v: k for k, v in _TRADE_COLUMNS.items()})[list(_TRADE_COLUMNS)]
+
+    def load_pnl_series(self, run_ids: Union[int, Iterable[int]]) -> Union[pd.Series, pd.DataFrame]:
+        """
+        PnL time series of one run (Series) or several runs (DataFrame, one column per run).
+        """
+        single = isinstance(run_ids, (int, np.integer))
+        ids = [int(run_ids)] if single else [int(r) for r in run_ids]
+        df = pd.read_sql_query(
+            f"SELECT run_id, ts, value FROM pnl WHERE run_id IN ({', '.join('?' for _ in ids)})",
+            self.conn,
+            params=ids,
+        )
+        df["ts"] = pd.to_datetime(df["ts"])
+        wide = df.pivot(index="ts", columns="run_id", values="value")
+        return wide[ids[0]].rename(None) if single else wide
+
+
+def cached_calc_all_trades(
+    store: ResultsStore,
+    spread: Union[pd.DataFrame, pd.Series],
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DatetimeIndex, pd.DataFrame],
+    n: Union[Tuple[Number, Number], Number],
+    multiplier: int = 10_000,
+    trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    spread_name: str = None,
+) -> pd.DataFrame:
+    """
+    calc_all_trades backed by the results store: returns the stored trades if a run with the
+    same spread, rule, window and data version exists, otherwise computes and stores them.
+    :param store: Results store.
+    :param spread_name: Name of the spread. Defaults to the Series name.
+    :return: DataFrame containing PnL for each auction date.
+    """
+    from auction_trading.pnl_calcs import calc_all_trades
+
+    spread_name = spread_name or getattr(spread, "name", None) or "spread"
+    version = data_version(spread) + ":" + data_version(auction_dates)
+    run_id = store.find_run(spread_name, trade_rule, n, version, multiplier)
+    if run_id is not None:
+        return store.load_trades(run_id)
+
+    trades = calc_all_trades(spread, auction_dates, n, multiplier, trade_rule)
+    store.append_trades(trades, spread_name, trade_rule, n, multiplier, version)
+    return trades
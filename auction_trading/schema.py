@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Typed, compact loaders for the qm_data, transformer_data and auction tables.
+
+Features are stored as float32, the S1..S7 / Sum signal columns and the hour column as int8
+(nullable Int8 where they have gaps, eg. after an outer align_frames),
+timestamps as a datetime64[ns] index (shared between frames with align_frames) and the
+auction bond_series lists as a uint8 tenor bitmask. This roughly halves the feature frames
+and shrinks the auction table's bond_series from one Python list per row to one byte.
+
+NOTE: float32 keeps ~7 significant digits, ie. ~1e-5 on a futures price around 100. That is
+      fine for features, but pass float_dtype="float64" when loading prices that go
+      straight into a PnL calculation with multiplier=10_000.
+"""
+
+import glob
+import os
+import re
+from typing import Dict, Iterable, List, Mapping, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Bit of each tenor in the tenor mask.
+TENORS = ("2Y", "3Y", "5Y", "7Y", "10Y", "20Y", "30Y")
+TENOR_BITS = {tenor: np.uint8(1 << i) for i, tenor in enumerate(TENORS)}
+
+# Signal columns produced by the GetTechnicals notebooks, small integers.
+SIGNAL_COLUMNS = re.compile(r"^(S\d+|Sum|time|year)$")
+
+
+def memory_usage(frame: Union[pd.DataFrame, pd.Series]) -> int:
+    """
+    :return: Deep memory usage of the frame in bytes, including its index.
+    """
+    usage = frame.memory_usage(index=True, deep=True)
+    return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+
+
+def tenor_mask(bond_series: Iterable[Sequence[str]]) -> np.ndarray:
+    """
+    Encode lists of tenors, eg. ["2Y", "5Y"], as a uint8 bitmask.
+    :param bond_series: Iterable of lists of tenors, eg. the bond_series column.
+    :return: Array of bitmasks.
+    """
+    lookup = {tenor: int(bit) for tenor, bit in TENOR_BITS.items()}
+    return np.fromiter((sum(lookup[t] for t in tenors) for tenors in bond_series), dtype=np.uint8)
+
+
+def tenors_from_mask(mask: int) -> List[str]:
+    """
+    Decode a tenor bitmask back into the bond_series list.
+    """
+    return [tenor for tenor, bit in TENOR_BITS.items() if int(mask) & int(bit)]
+
+
+def has_tenor(mask: Union[np.ndarray, pd.Series], tenor: str) -> np.ndarray:
+    """
+    Vectorized membership test, eg. has_tenor(table["tenor_mask"], "5Y") selects the 5Y
+    auctions without scanning the bond_series lists.
+    """
+    return (np.asarray(mask, dtype=np.uint8) & TENOR_BITS[tenor]) != 0
+
+
+def _signal_column(values: pd.Series) -> Union[pd.Series, None]:
+    # Smallest integer type that holds the signal, nullable (Int8, ...) if it has gaps. None
+    # if the values are not whole numbers.
+    valid = values.dropna()
+    numbers = pd.to_numeric(valid, errors="coerce")
+    if numbers.isna().any() or not np.all(np.mod(numbers, 1) == 0):
+        return None
+    lo, hi = (numbers.min(), numbers.max()) if len(numbers) else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+            break
+    if len(valid) == len(values):
+        return values.astype(dtype)
+    return values.astype(pd.api.types.pandas_dtype(dtype.__name__.capitalize()))
+
+
+def signal_na_values(columns: Iterable[str], na_values) -> Union[Dict[str, list], None]:
+    """
+    na_values for pd.read_csv that leave the signal columns alone: the notebooks read the
+    features with na_values=["-1"], but -1 is a valid S1..S7 / Sum value.
+    :param columns: Columns of the file.
+    :param na_values: na_values as passed by the caller. A dict is used as is.
+    :return: Per-column na_values, or None.
+    """
+    if na_values is None or isinstance(na_values, dict):
+        return na_values
+    if isinstance(na_values, (str, int, float)):
+        na_values = [na_values]
+    return {c: list(na_values) for c in columns if not SIGNAL_COLUMNS.match(str(c))}
+
+
+def compact_frame(df: pd.DataFrame, float_dtype: str = "float32") -> pd.DataFrame:
+    """
+    Downcast a feature frame: floats to float_dtype, signal columns (S1..S7, Sum, time, year)
+    to the smallest integer type that holds them. Signal columns with missing values use the
+    nullable Int8 / Int16 dtypes, so they keep their size and their gaps; for model input
+    take frame.to_numpy(np.float32, na_value=np.nan).
+    :param df: Feature frame.
+    :param float_dtype: Dtype for the feature columns.
+    :return: New, downcast frame.
+    """
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        signal = _signal_column(values) if SIGNAL_COLUMNS.match(str(col)) else None
+        if signal is not None:
+            out[col] = signal
+        elif pd.api.types.is_float_dtype(values) or pd.api.types.is_integer_dtype(values):
+            out[col] = values.astype(float_dtype)
+        else:
+            out[col] = values
+    return pd.DataFrame(out, index=df.index)
+
+
+def _read_dated_csv(filename: str, date_col: str, float_dtype: str, **read_kwargs) -> pd.DataFrame:
+    # Read the numeric columns straight into float_dtype so the float64 frame never exists.
+    header = pd.read_csv(filename, nrows=0, index_col=False).columns
+    columns = [c for c in header if c != date_col and not str(c).startswith("Unnamed")]
+    dtypes = {c: float_dtype for c in columns}
+    if "na_values" in read_kwargs:
+        read_kwargs["na_values"] = signal_na_values(columns, read_kwargs["na_values"])
+    df = pd.read_csv(filename, usecols=[date_col] + columns, dtype=dtypes, index_col=False, **read_kwargs)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop(date_col)), name=date_col)
+    # Some exports end in rows of empty cells.
+    df = df[df.index.notna()]
+    return compact_frame(df, float_dtype)
+
+
+def load_qm_data(filename: str, float_dtype: str = "float32", **read_kwargs) -> pd.DataFrame:
+    """
+    Load a data/qm_data_*.csv feature file with a DatetimeIndex and compact dtypes.
+    :param filename: qm_data CSV.
+    :param float_dtype: Dtype for the feature columns.
+    :param read_kwargs: Passed to pd.read_csv, eg. na_values=["-1"] as in the notebooks.
+    :return: DataFrame indexed by "Date".
+    """
+    return _read_dated_csv(filename, "Date", float_dtype, **read_kwargs)
+
+
+def load_transformer_data(filename: str, float_dtype: str = "float32", **read_kwargs) -> pd.DataFrame:
+    """
+    Load a transformers/transformer_data_*.csv file (date, year, close, target) with a
+    DatetimeIndex and compact dtypes. Empty trailing columns are dropped.
+    :param filename: transformer_data CSV.
+    :param float_dtype: Dtype for close/target.
+    :return: DataFrame indexed by "date".
+    """
+    return _read_dated_csv(filename, "date", float_dtype, **read_kwargs)
+
+
+def compact_auction_table(table: pd.DataFrame, float_dtype: str = "float32") -> pd.DataFrame:
+    """
+    Compact a table from loadJPMFullAuctionTable / pdGetOneAuctionResults: bond_series is
+    replaced by a uint8 tenor_mask column, num_auctions becomes int8 and the auction results
+    float_dtype.
+    :param table: Auction table with a bond_series column.
+    :return: New, compact table.
+    """
+    out = table.drop(columns=["bond_series"])
+    out = compact_frame(out, float_dtype)
+    if "num_auctions" in out.columns:
+        out["num_auctions"] = out["num_auctions"].astype(np.int8)
+    out.insert(0, "tenor_mask", tenor_mask(table["bond_series"]))
+    return out
+
+
+def expand_bond_series(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inverse of compact_auction_table for the bond_series column, so that a compact table can
+    be passed to calc_all_trades and its trade rules.
+    """
+    out = table.drop(columns=["tenor_mask"])
+    out.insert(0, "bond_series", [tenors_from_mask(m) for m in table["tenor_mask"]])
+    return out
+
+
+def align_frames(frames: Mapping[str, pd.DataFrame], how: str = "outer") -> Dict[str, pd.DataFrame]:
+    """
+    Reindex frames onto one shared DatetimeIndex, so that cross-spread work can use
+    positional indexing and the index is held in memory once.
+    :param frames: Mapping of name to frame.
+    :param how: "outer" for the union of all timestamps, "inner" for the intersection.
+    :return: Dict of name to reindexed frame, all sharing the same index object.
+    """
+    index = None
+    for df in frames.values():
+        if index is None:
+            index = df.index
+        elif how == "inner":
+            index = index.intersection(df.index)
+        else:
+            index = index.union(df.index)
+    index = index.sort_values()
+    aligned = {}
+    for name, df in frames.items():
+        df = df[~df.index.duplicated(keep="last")]
+        out = df.reindex(index)
+        if len(out) != len(df) or not out.index.equals(df.index):
+            # Rows added by the reindex are NaN, which upcasts int8 signals to float64;
+            # compact_frame turns them back into nullable Int8.
+            out = compact_frame(out, "float64" if (df.dtypes == np.float64).any() else "float32")
+        out.index = index
+        aligned[name] = out
+    return aligned
+
+
+def load_all_qm_data(
+    directory: str,
+    pattern: str = "qm_data_*.csv",
+    float_dtype: str = "float32",
+    how: str = "outer",
+    **read_kwargs,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Load every qm_data file in a directory onto a shared index.
+    :param directory: Directory containing the files, eg. "data".
+    :param read_kwargs: Passed to load_qm_data, eg. na_values=["-1"].
+    :return: Dict of contract name (eg. "TY", "tufv") to frame.
+    """
+    frames = {}
+    for filename in sorted(glob.glob(os.path.join(directory, pattern))):
+        name = os.path.splitext(os.path.basename(filename))[0].replace("qm_data_", "")
+        frames[name] = load_qm_data(filename, float_dtype, **read_kwargs)
+    return align_frames(frames, how)
+
+
+def memory_report(
+    before: Mapping[str, Union[pd.DataFrame, pd.Series]], after: Mapping[str, Union[pd.DataFrame, pd.Series]]
+) -> pd.DataFrame:
+    """
+    Compare memory usage of frames before and after compaction. Shared indexes are only
+    counted once in the total of the "after" column.
+    :param before: Mapping of name to original frame.
+    :param after: Mapping of name to compact frame.
+    :return: DataFrame of MB before/after and the ratio, per frame and in total.
+    """
+    rows = {}
+    seen_indexes = set()
+    total_before, total_after = 0, 0
+    for name in before:
+        b = memory_usage(before[name])
+        a = memory_usage(after[name])
+        rows[name] = {"before_mb": b / 2**20, "after_mb": a / 2**20}
+        total_before += b
+        idx = after[name].index
+        total_after += a if id(idx) not in seen_indexes else a - idx.memory_usage(deep=True)
+        seen_indexes.add(id(idx))
+    rows["total"] = {"before_mb": total_before / 2**20, "after_mb": total_after / 2**20}
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report["ratio"] = report["after_mb"] / report["before_mb"]
+    return report
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Resample raw OHLC bars (eg. GetTechnicals/ty.csv) onto a session grid.
+
+GetTechnicals_new.ipynb keeps only the bars whose float hour is in the trading times, which
+drops every bar in between (and their highs/lows). Here every raw bar is assigned to the
+next grid point at or after it, using integer minute-of-day arithmetic, and bars between
+two grid points are aggregated into one OHLC bar:
+
+    open = first open, high = max high, low = min low, close = last close
+
+The close at each grid point is therefore the same as the notebook's, and n_bars records
+how many raw bars went into each grid bar, so no bar is dropped silently. Bars after the
+last grid point of a day roll into the first grid point of the next session day; with a
+session calendar, weekend and holiday bars roll into the next business day.
+"""
+
+import datetime as dt
+import io
+import os
+from typing import Iterable, Iterator, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Two hour UST grid from GetTechnicals_new.ipynb.
+UST_TRADING_HOURS = (3, 5, 7, 9, 11, 13, 15, 19, 21)
+
+# Timestamp format of GetTechnicals/*.csv.
+OHLC_DATE_FORMAT = "%m/%d/%y %H:%M"
+
+_NS_PER_MINUTE = 60 * 10**9
+_NS_PER_DAY = 24 * 60 * _NS_PER_MINUTE
+_OHLC = ("open", "high", "low", "close")
+
+
+def grid_minutes(times: Iterable[Union[int, float, str, dt.time]] = UST_TRADING_HOURS) -> np.ndarray:
+    """
+    Convert grid times to sorted minutes of the day.
+    :param times: Hours as numbers (eg. 13 or 9.5), "HH:MM" strings or datetime.time.
+    :return: Sorted int64 array of minutes since midnight.
+    """
+    minutes = []
+    for t in times:
+        if isinstance(t, dt.time):
+            minutes.append(t.hour * 60 + t.minute)
+        elif isinstance(t, str):
+            hour, minute = t.split(":")
+            minutes.append(int(hour) * 60 + int(minute))
+        else:
+            minutes.append(int(round(float(t) * 60)))
+    grid = np.unique(np.asarray(minutes, dtype=np.int64))
+    if grid.size == 0 or grid[0] < 0 or grid[-1] >= 24 * 60:
+        raise ValueError("Grid times must be within the day.")
+    return grid
+
+
+def session_days(start, end, sCalendar: str = "UST") -> np.ndarray:
+    """
+    Business days of the given QuantLib calendar between start and end (inclusive).
+    :param start: First date.
+    :param end: Last date.
+    :param sCalendar: Calendar name understood by lib.qlibdate, eg. "UST".
+    :return: Sorted datetime64[D] array.
+    """
+    from lib.qlibdate import qlIsBusDay
+
+    days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+    keep = [qlIsBusDay(d.date(), sCalendar) for d in days]
+    return days[np.asarray(keep, dtype=bool)].values.astype("datetime64[D]")
+
+
+def assign_grid(
+    timestamps: Union[pd.DatetimeIndex, np.ndarray], grid: np.ndarray, days: np.ndarray = None
+) -> np.ndarray:
+    """
+    Grid timestamp each bar belongs to: the first grid point at or after the bar, on the same
+    day, or the first grid point of the next (session) day.
+    :param timestamps: Bar timestamps.
+    :param grid: Output of grid_minutes.
+    :param days: Optional sorted datetime64[D] session days (see session_days).
+    :return: int64 nanosecond timestamps of the grid point of each bar.
+    """
+    ns = np.asarray(timestamps, dtype="datetime64[ns]").astype(np.int64)
+    day = ns // _NS_PER_DAY
+    minute = (ns - day * _NS_PER_DAY) // _NS_PER_MINUTE
+
+    k = np.searchsorted(grid, minute, side="left")
+    rolled = k == len(grid)
+    day = day + rolled
+    k[rolled] = 0
+
+    if days is not None:
+        session = np.asarray(days, dtype="datetime64[D]").astype(np.int64)
+        pos = np.searchsorted(session, day, side="left")
+        if (pos == len(session)).any():
+            raise ValueError("Bars after the last session day, extend the calendar.")
+        moved = session[pos] != day
+        day = session[pos]
+        # A bar rolled onto a later session day belongs to its first grid point.
+        k[moved] = 0
+
+    return day * _NS_PER_DAY + grid[k] * _NS_PER_MINUTE
+
+
+def _aggregate(keys: np.ndarray, bars: pd.DataFrame) -> pd.DataFrame:
+    # keys are sorted, so each bucket is a contiguous run of bars.
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    out = {
+        "open": bars["open"].values[starts],
+        "high": np.maximum.reduceat(bars["high"].values, starts),
+        "low": np.minimum.reduceat(bars["low"].values, starts),
+        "close": bars["close"].values[ends],
+    }
+    for col in bars.columns:
+        if col not in _OHLC:
+            out[col] = np.add.reduceat(bars[col].values, starts)
+    out["n_bars"] = ends - starts + 1
+    return pd.DataFrame(out, index=pd.DatetimeIndex(keys[starts], name="date"))
+
+
+def resample_ohlc(
+    bars: pd.DataFrame,
+    times: Iterable = UST_TRADING_HOURS,
+    days: np.ndarray = None,
+) -> pd.DataFrame:
+    """
+    Aggregate raw OHLC bars onto the session grid.
+    :param bars: DataFrame with a DatetimeIndex and open/high/low/close columns. Any other
+                 column (eg. volume) is summed.
+    :param times: Grid times, see grid_minutes.
+    :param days: Optional session days, see session_days.
+    :return: DataFrame indexed by grid timestamp with OHLC (plus summed columns) and n_bars.
+    """
+    if not bars.index.is_monotonic_increasing:
+        bars = bars.sort_index(kind="mergesort")
+    keys = assign_grid(bars.index, grid_minutes(times), days)
+    return _aggregate(keys, bars)
+
+
+def read_ohlc_csv(
+    filename: str, chunksize: int = None, date_format: str = OHLC_DATE_FORMAT
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read a GetTechnicals OHLC file (date, open, low, high, close).
+    :param filename: CSV file.
+    :param chunksize: If given, return an iterator of frames of this many rows.
+    :param date_format: Format of the date column.
+    :return: DataFrame (or iterator of DataFrames) indexed by date.
+    """
+
+    def _parse(df: pd.DataFrame) -> pd.DataFrame:
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("date"), format=date_format), name="date")
+        return df
+
+    dtypes = {c: np.float64 for c in _OHLC}
+    if chunksize is None:
+        return _parse(pd.read_csv(filename, dtype=dtypes))
+    return (_parse(chunk) for chunk in pd.read_csv(filename, dtype=dtypes, chunksize=chunksize))
+
+
+def _last_line(filename: str, block: int = 1 << 16) -> bytes:
+    # Last non-empty line of a file, read backwards from the end in blocks.
+    with open(filename, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            lines = tail.rstrip(b"\r\n").split(b"\n")
+            if len(lines) > 1 or pos == 0:
+                return lines[-1]
+    return b""
+
+
+def file_date_range(filename: str, date_format: str = OHLC_DATE_FORMAT) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """
+    First and last timestamps of a time-ordered OHLC file, from its first row and its last
+    line only, so the file is not read.
+    :param filename: CSV file, as read_ohlc_csv.
+    :param date_format: Format of the date column.
+    :return: (first, last) Timestamps.
+    """
+    head = pd.read_csv(filename, nrows=1)
+    tail = pd.read_csv(io.BytesIO(_last_line(filename)), header=None, names=head.columns)
+    return (
+        pd.to_datetime(head["date"].iloc[0], format=date_format),
+        pd.to_datetime(tail["date"].iloc[0], format=date_format),
+    )
+
+
+def resample_chunks(
+    chunks: Iterable[pd.DataFrame], times: Iterable = UST_TRADING_HOURS, days: np.ndarray = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Resample a time-ordered stream of bar chunks with bounded memory. The last, possibly
+    incomplete, grid bar of each chunk is carried over into the next chunk.
+    :param chunks: Iterable of OHLC frames in time order.
+    :param times: Grid times, see grid_minutes.
+    :param days: Optional session days, see session_days.
+    :return: Iterator of resampled frames.
+    """
+    grid = grid_minutes(times)
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if len(chunk) == 0:
+            continue
+        if not chunk.index.is_monotonic_increasing:
+            raise ValueError("Chunks must be in time order.")
+        keys = assign_grid(chunk.index, grid, days)
+        last = np.searchsorted(keys, keys[-1], side="left")
+        carry = chunk.iloc[last:]
+        if last > 0:
+            yield _aggregate(keys[:last], chunk.iloc[:last])
+    if carry is not None and len(carry):
+        yield _aggregate(assign_grid(carry.index, grid, days), carry)
+
+
+def resample_file(
+    filename: str,
+    times: Iterable = UST_TRADING_HOURS,
+    sCalendar: str = None,
+    chunksize: int = 1_000_000,
+    output: str = None,
+    date_format: str = OHLC_DATE_FORMAT,
+) -> Union[pd.DataFrame, None]:
+    """
+    Resample a (multi-year, minute-level) OHLC file in chunks.
+    :param filename: Raw OHLC CSV.
+    :param times: Grid times, see grid_minutes.
+    :param sCalendar: If given (eg. "UST"), roll non-business days onto the next business
+                      day of this calendar.
+    :param chunksize: Rows read per chunk.
+    :param output: If given, append the resampled bars to this CSV instead of returning them,
+                   so memory stays bounded by the chunk size.
+    :param date_format: Format of the date column.
+    :return: Resampled DataFrame, or None when writing to output.
+    """
+    days = None
+    if sCalendar is not None:
+        # First row and last line only, to size the calendar without reading the file.
+        first, last = file_date_range(filename, date_format)
+        days = session_days(first, last + pd.Timedelta(days=10), sCalendar)
+
+    pieces = resample_chunks(read_ohlc_csv(filename, chunksize, date_format), times, days)
+    if output is None:
+        return pd.concat(list(pieces))
+
+    header = True
+    for piece in pieces:
+        piece.to_csv(output, mode="w" if header else "a", header=header)
+        header = False
+    return None
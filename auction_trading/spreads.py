@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Hedged curve spreads built from Treasury futures legs.
+
+Auction_Analysis.ipynb builds spreads such as TU/FV by hand, and calc_steepener /
+calc_flattener turn spread moves into PnL with a fixed multiplier of 10_000. Here every
+2-leg spread and 3-leg butterfly of the given contracts is built in one batch, hedged with
+rolling DV01 or beta (regression) ratios, and returned as a cumulative dollar PnL series:
+
+    pnl_t = sum_i w_i,t-1 * dollar change of leg i at t
+
+The weights are fixed at the previous bar, so there is no look-ahead, and the position is
+rebalanced every bar. A 2-leg spread is long one front contract and short h back contracts
+(so it gains when the curve steepens), a butterfly is long both wings and short one body
+contract. Pass the series to calc_all_trades with multiplier=1 to get dollar PnL:
+
+    >>> spreads = build_spreads(prices, method="dv01")
+    >>> calc_all_trades(spreads.pnl["TU/FV"], fives, (2, 2), multiplier=1)
+"""
+
+import hashlib
+import itertools
+import os
+from typing import Callable, Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from auction_trading.pnl_calcs import calc_all_trades
+from auction_trading.results_store import data_version
+from auction_trading.utils import Number
+
+# Dollars per point and approximate CTD modified duration of each contract.
+CONTRACT_SPECS = {
+    "TU": {"point_value": 2_000, "duration": 1.9},
+    "FV": {"point_value": 1_000, "duration": 4.2},
+    "TY": {"point_value": 1_000, "duration": 6.0},
+    "UXY": {"point_value": 1_000, "duration": 7.5},
+    "US": {"point_value": 1_000, "duration": 12.0},
+    "WN": {"point_value": 1_000, "duration": 19.0},
+}
+CONTRACTS = tuple(CONTRACT_SPECS)
+
+# Built spreads by input version and parameters.
+_cache: Dict[Tuple, "SpreadSet"] = {}
+
+
+class SpreadSet:
+    """
+    Output of build_spreads.
+    :ivar pnl: Cumulative dollar PnL of each spread, columns like "TU/FV" and "TU/FV/TY".
+    :ivar weights: Contracts held of each leg, one DataFrame per spread (already lagged).
+    """
+
+    def __init__(self, pnl: pd.DataFrame, weights: Dict[str, pd.DataFrame]):
+        self.pnl = pnl
+        self.weights = weights
+
+    def __getitem__(self, name: str) -> pd.Series:
+        return self.pnl[name]
+
+
+def contract_dv01(prices: pd.DataFrame, durations: Mapping[str, float] = None) -> pd.DataFrame:
+    """
+    Dollar value of a basis point per contract: price * point value * duration / 10_000.
+    :param prices: Futures prices, one column per contract.
+    :param durations: Optional contract -> duration overrides of CONTRACT_SPECS.
+    """
+    durations = durations or {}
+    scale = np.array(
+        [
+            CONTRACT_SPECS[c]["point_value"] * durations.get(c, CONTRACT_SPECS[c]["duration"])
+            for c in prices.columns
+        ]
+    )
+    return prices * scale / 10_000
+
+
+def _dollar_changes(
+    legs: pd.DataFrame, kind: str, durations: Mapping[str, float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (T, K) dollar change per contract and (T, K) DV01 per contract.
+    if kind == "price":
+        point_value = np.array([CONTRACT_SPECS[c]["point_value"] for c in legs.columns], dtype=float)
+        changes = legs.diff().values * point_value
+        dv01 = contract_dv01(legs, durations).values
+    elif kind == "yield":
+        # Yields in percent. DV01 at par, ie. a price of 100.
+        durations = durations or {}
+        dv01_par = np.array(
+            [
+                CONTRACT_SPECS[c]["point_value"] * durations.get(c, CONTRACT_SPECS[c]["duration"]) / 100
+                for c in legs.columns
+            ]
+        )
+        changes = -legs.diff().values * 100 * dv01_par
+        dv01 = np.broadcast_to(dv01_par, legs.shape).copy()
+    else:
+        raise ValueError(f"Unknown kind {kind!r}, use 'price' or 'yield'.")
+    return changes, dv01
+
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    # Rolling sum along axis 0 for any trailing shape.
+    c = np.cumsum(x, axis=0)
+    out = c.copy()
+    out[window:] = c[window:] - c[:-window]
+    return out
+
+
+def rolling_covariance(
+    changes: np.ndarray, window: int, min_periods: int = None, chunk: int = None
+) -> np.ndarray:
+    """
+    Rolling covariance matrix of all legs at once from rolling sums of x_i and x_i * x_j.
+    The rows are processed in chunks, each with its own cumulative sums and centred on its
+    own mean, so neither the cumulative sums of a long (minute) history nor a large mean
+    relative to the spread of the changes cost precision in the differences.
+    :param changes: (T, K) array, rows with any NaN are skipped.
+    :param window: Number of rows in the window.
+    :param min_periods: Minimum valid rows, NaN before that. Defaults to window // 2.
+    :param chunk: Rows per chunk, defaults to 8 windows.
+    :return: (T, K, K) array.
+    """
+    min_periods = min_periods or max(window // 2, 2)
+    changes = np.asarray(changes, dtype=float)
+    T, K = changes.shape
+    chunk = chunk or 8 * window
+    cov = np.empty((T, K, K))
+    for lo in range(0, T, chunk):
+        hi = min(lo + chunk, T)
+        # The windows ending in [lo, hi) start at most window - 1 rows before lo.
+        start = max(lo - window + 1, 0)
+        block = changes[start:hi]
+        valid = np.isfinite(block).all(axis=1)
+        anchor = block[valid].mean(axis=0) if valid.any() else np.zeros(K)
+        x = np.where(valid[:, None], block - anchor, 0.0)
+        n = _rolling_sum(valid.astype(float), window)
+        s = _rolling_sum(x, window)
+        ss = _rolling_sum(x[:, :, None] * x[:, None, :], window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            c = (ss - s[:, :, None] * s[:, None, :] / n[:, None, None]) / (n[:, None, None] - 1)
+        c[n < min_periods] = np.nan
+        cov[lo:hi] = c[lo - start :]
+    return cov
+
+
+def _combinations(columns: Sequence[str], n_legs: Iterable[int]) -> List[Tuple[int, ...]]:
+    combos = []
+    for k in n_legs:
+        combos.extend(itertools.combinations(range(len(columns)), k))
+    return combos
+
+
+def _hedge_weights(
+    combos: List[Tuple[int, ...]], dv01: np.ndarray, cov: Union[np.ndarray, None], method: str
+) -> np.ndarray:
+    # (T, n_combos, 3) contracts held per leg, unused third leg is 0.
+    T = dv01.shape[0]
+    w = np.zeros((T, len(combos), 3))
+    pairs = np.array([c for c in combos if len(c) == 2], dtype=int).reshape(-1, 2)
+    flies = np.array([c for c in combos if len(c) == 3], dtype=int).reshape(-1, 3)
+    is_pair = np.array([len(c) == 2 for c in combos])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "dv01":
+            f, b = pairs[:, 0], pairs[:, 1]
+            w_pair = np.stack([np.ones((T, len(pairs))), -dv01[:, f] / dv01[:, b]], axis=2)
+            a, m, c = flies[:, 0], flies[:, 1], flies[:, 2]
+            w_fly = np.stack(
+                [0.5 * dv01[:, m] / dv01[:, a], -np.ones((T, len(flies))), 0.5 * dv01[:, m] / dv01[:, c]],
+                axis=2,
+            )
+        elif method == "beta":
+            f, b = pairs[:, 0], pairs[:, 1]
+            beta = cov[:, f, b] / cov[:, b, b]
+            w_pair = np.stack([np.ones((T, len(pairs))), -beta], axis=2)
+            # Body on both wings: solve the 2x2 normal equations for every bar and fly.
+            a, m, c = flies[:, 0], flies[:, 1], flies[:, 2]
+            caa, ccc, cac = cov[:, a, a], cov[:, c, c], cov[:, a, c]
+            cam, ccm = cov[:, a, m], cov[:, c, m]
+            det = caa * ccc - cac**2
+            beta_a = (ccc * cam - cac * ccm) / det
+            beta_c = (caa * ccm - cac * cam) / det
+            w_fly = np.stack([beta_a, -np.ones((T, len(flies))), beta_c], axis=2)
+        else:
+            raise ValueError(f"Unknown method {method!r}, use 'dv01' or 'beta'.")
+
+    w[:, is_pair, :2] = w_pair
+    w[:, ~is_pair, :] = w_fly
+    return w
+
+
+def build_spreads(
+    legs: pd.DataFrame,
+    method: str = "dv01",
+    window: int = 60,
+    n_legs: Iterable[int] = (2, 3),
+    kind: str = "price",
+    durations: Mapping[str, float] = None,
+    cache: bool = True,
+    cache_dir: str = None,
+) -> SpreadSet:
+    """
+    Build every hedged 2-leg spread and 3-leg butterfly of the given contracts.
+    :param legs: Prices (or yields in percent, with kind="yield") indexed by time, one column
+                 per contract from CONTRACTS, ordered front to back. Missing values are
+                 forward filled.
+    :param method: "dv01" for DV01-neutral weights (smoothed over the window), "beta" for
+                   minimum variance weights from a rolling regression of dollar changes.
+    :param window: Rolling window in bars.
+    :param n_legs: Spread sizes to build, 2 and/or 3.
+    :param kind: "price" or "yield".
+    :param durations: Contract -> duration overrides of CONTRACT_SPECS.
+    :param cache: Reuse spreads already built from the same input and parameters.
+    :param cache_dir: If given, also persist built spreads there as pickles.
+    :return: SpreadSet with the cumulative dollar PnL and the weights of each spread.
+    """
+    unknown = [c for c in legs.columns if c not in CONTRACT_SPECS]
+    if unknown:
+        raise ValueError(f"Unknown contracts {unknown}, expected some of {CONTRACTS}.")
+    n_legs = tuple(sorted(set(n_legs)))
+
+    key = (
+        data_version(legs),
+        tuple(map(str, legs.columns)),
+        method,
+        window,
+        n_legs,
+        kind,
+        tuple(sorted((durations or {}).items())),
+    )
+    if cache and key in _cache:
+        return _cache[key]
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"spreads_{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.pkl")
+    if cache and path and os.path.exists(path):
+        _cache[key] = pd.read_pickle(path)
+        return _cache[key]
+
+    legs = legs.ffill()
+    columns = list(legs.columns)
+    combos = _combinations(columns, n_legs)
+    changes, dv01 = _dollar_changes(legs, kind, durations)
+
+    if method == "dv01":
+        # Smooth DV01s over the window, so the hedge does not trade on every tick.
+        dv01 = pd.DataFrame(dv01).rolling(window, min_periods=1).mean().values
+        cov = None
+    else:
+        cov = rolling_covariance(changes, window)
+
+    weights = _hedge_weights(combos, dv01, cov, method)
+    # Hold the previous bar's weights over each bar.
+    held = np.empty_like(weights)
+    held[0] = np.nan
+    held[1:] = weights[:-1]
+
+    idx = np.array([c + (c[0],) * (3 - len(c)) for c in combos], dtype=int)
+    leg_changes = changes[:, idx]
+    bar_pnl = np.nansum(held * leg_changes, axis=2)
+    bar_pnl[~np.isfinite(held).all(axis=2) | ~np.isfinite(leg_changes).all(axis=2)] = 0.0
+
+    names = ["/".join(columns[i] for i in c) for c in combos]
+    pnl = pd.DataFrame(np.cumsum(bar_pnl, axis=0), index=legs.index, columns=names)
+    weight_frames = {
+        name: pd.DataFrame(held[:, j, : len(c)], index=legs.index, columns=[columns[i] for i in c])
+        for j, (name, c) in enumerate(zip(names, combos))
+    }
+    result = SpreadSet(pnl, weight_frames)
+
+    if cache:
+        _cache[key] = result
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            pd.to_pickle(result, path)
+    return result
+
+
+def clear_cache() -> None:
+    """
+    Drop all in-memory spreads.
+    """
+    _cache.clear()
+
+
+def calc_spread_trades(
+    spreads: Union[SpreadSet, pd.DataFrame],
+    auction_dates: Union[Iterable[pd.Timestamp], pd.DataFrame],
+    n: Union[Tuple[Number, Number], Number],
+    trade_rule: Callable = lambda x: ("steepener", "flattener"),
+    names: Iterable[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Run calc_all_trades with multiplier=1 on dollar PnL spreads, so trade PnL is in dollars
+    per front (or body) contract.
+    :param spreads: Output of build_spreads, or its pnl frame.
+    :param names: Spreads to run, defaults to all.
+    :return: Spread name -> trades.
+    """
+    pnl = spreads.pnl if isinstance(spreads, SpreadSet) else spreads
+    names = list(names) if names is not None else list(pnl.columns)
+    return {
+        name: calc_all_trades(pnl[name], auction_dates, n, multiplier=1, trade_rule=trade_rule)
+        for name in names
+    }
@@ -11,6 +11,8 @@ from typing import Union, Tuple, Iterable, Sequence
 import pandas as pd
 from numpy import number
 
+from auction_trading.instrumentation import timer
+
 Number = Union[int, float, number]
 
 
@@ -122,16 +124,18 @@ def calc_n_prior_generator(
         # Iterate through each auction date
         for idx, date in enumerate(auction_dates):
             # Calculate the n days prior to the auction date
-            n_days_prior_data, n_days_after_data = calc_n_prior(
-                spread, date, n, n_prev, n_post, bond_series.loc[date]
-            )
+            with timer("calc_n_prior"):
+                n_days_prior_data, n_days_after_data = calc_n_prior(
+                    spread, date, n, n_prev, n_post, bond_series.loc[date]
+                )
             yield n_days_prior_data, n_days_after_data
 
     else:
         # Iterate through each auction date
         for date in auction_dates:
             # Calculate the n days prior to the auction date
-            n_days_prior_data, n_days_after_data = calc_n_prior(
-                spread, date, n, n_prev, n_post
-            )
+            with timer("calc_n_prior"):
+                n_days_prior_data, n_days_after_data = calc_n_prior(
+                    spread, date, n, n_prev, n_post
+                )
             yield n_days_prior_data, n_days_after_data
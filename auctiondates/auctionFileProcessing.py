@@ -20,6 +20,7 @@ import pandas as pd
 import numpy as np
 ##from lib.pdlib import pdTimeStamp
 from pytz import timezone
+from auction_trading.instrumentation import timed, timer
 
 
  
@@ -39,12 +40,14 @@ def pdTimeStamp (dtDate, iHour=0, iMinute=0, localtz = None):
 ##
 ## https://stackoverflow.com/questions/32768555/find-the-set-of-column-indices-for-non-zero-values-in-each-row-in-pandas-data-f
 ##
+@timed ('loadJPMAuctionTable')
 def loadJPMAuctionTable (sFileName):
 
-    pdAuctionTail = pd.read_csv (sFileName,
-                                 parse_dates = ['Date'],
-                                 index_col=['Date'])\
-        .dropna(how='all').fillna(0)
+    with timer ('auction_read_csv'):
+        pdAuctionTail = pd.read_csv (sFileName,
+                                     parse_dates = ['Date'],
+                                     index_col=['Date'])\
+            .dropna(how='all').fillna(0)
 
     pdAuctionTail.columns = ['2Y Tail', '2Y BC',
                              '3Y Tail', '3Y BC',
@@ -72,14 +75,29 @@ def loadJPMAuctionTable (sFileName):
 
 
 
+@timed ('loadJPMFullAuctionTable')
 def loadJPMFullAuctionTable (sFileName):
 
-    pdAuction = pd.read_csv (sFileName,
-                             parse_dates = ['Date'],
-                             index_col=['Date'])\
-        .dropna(how='all').fillna(0)
+    with timer ('auction_read_csv'):
+        pdAuction = pd.read_csv (sFileName,
+                                 parse_dates = ['Date'],
+                                 index_col=['Date'])\
+            .dropna(how='all').fillna(0)
 
+    pdAuction = _processJPMFullAuctionFrame (pdAuction)
+    _amendFullData (pdAuction)
+    
+    pdAuction = pdAuction.sort_index()
 
+    return pdAuction
+
+
+
+def _processJPMFullAuctionFrame (pdAuction):
+    ##
+    ## Raw JPM columns -> bond_series, num_auctions and the short column names.
+    ## Shared with auctionIngest, which only passes the new or changed rows.
+    ##
     iColNums = [(1 + i * 14) for i in range (0, 7)]
     pdBidCover = pdAuction.iloc[:, iColNums]
     pdBidCover.columns = ['2Y', '3Y', '5Y', '7Y', '10Y', '20Y', '30Y']
@@ -93,9 +111,6 @@ def loadJPMFullAuctionTable (sFileName):
     pdAuction = pdBondSeries.join (pdAuction) 
 
     _changeColNames (pdAuction)
-    _amendFullData (pdAuction)
-    
-    pdAuction = pdAuction.sort_index()
 
     return pdAuction
 
@@ -285,6 +300,7 @@ def pdGetSingleAuction (pdAuctionTail, iTenor = 10):
 
 
 
+@timed ('pdGetOneAuctionResults')
 def pdGetOneAuctionResults (pdAuctionData, iTenor = 10):
     ##
     ## https://stackoverflow.com/questions/17071871/how-do-i-select-rows-from-a-dataframe-based-on-column-values
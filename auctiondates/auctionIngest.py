@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+#!/urs/bin/env python3
+
+"""
+Incremental ingestion of the JPM "UST Auction All Data_YYYYMMDD.csv" drops.
+
+Each drop is a full-history file, but only a handful of its rows are new or revised.
+ingestJPMFullAuctionFile keeps a persistent store of the raw rows (keyed by date, with a
+hash of each line) and of the processed auction table, and only parses the rows whose
+hash changed. Manual fixes (eg. the 7Y auction of 7/27/22 reported on 7/25/22) live in
+auction_corrections.csv and are applied to the changed rows at ingest, instead of on every
+load as _amendFullData does.
+
+    >>> dictStats = ingestJPMFullAuctionFile ("UST Auction All Data_20230313.csv", "auction_store")
+    >>> pdAuctionData = loadAuctionStore ("auction_store")
+"""
+
+import sys, os
+sys.path.append ("..")
+sys.path.append ("../..")
+sys.path.append (os.path.join (os.path.split (sys.argv[0])[0],".."))
+#
+import glob
+import hashlib
+import io
+import logging
+import pandas as pd
+import numpy as np
+from auctiondates.auctionFileProcessing import _processJPMFullAuctionFrame
+from auction_trading.instrumentation import timed, timer
+
+logger = logging.getLogger (__name__)
+
+DEFAULT_CORRECTIONS = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+                                    'auction_corrections.csv')
+
+sTableFile = 'auction_table.pkl'
+sRowsFile = 'auction_rows.pkl'
+
+lsAllTenors = ['2Y', '3Y', '5Y', '7Y', '10Y', '20Y', '30Y']
+
+
+
+def _hashFile (sFileName):
+
+    if sFileName is None or not os.path.exists (sFileName):
+        return ''
+    with open (sFileName, 'rb') as f:
+        return hashlib.sha1 (f.read ()).hexdigest ()
+
+
+
+def _readRawLines (sFileName):
+    ##
+    ## Split a drop into its header and one line per date, without parsing the values.
+    ##
+    with open (sFileName, 'r') as f:
+        lsLines = [sLine.rstrip ('\r\n') for sLine in f]
+
+    sHeader = lsLines[0]
+    lsLines = [sLine for sLine in lsLines[1:] if sLine.strip (', ')]
+    lsDates = [sLine.split (',', 1)[0].strip ('"') for sLine in lsLines]
+
+    pdRows = pd.DataFrame ({'line': lsLines,
+                            'hash': [hashlib.sha1 (sLine.encode ()).hexdigest ()
+                                     for sLine in lsLines]},
+                           index=pd.DatetimeIndex (pd.to_datetime (lsDates), name='Date'))
+    ## Keep the last line of a repeated date, as the table would.
+    pdRows = pdRows[~pdRows.index.duplicated (keep='last')]
+
+    return sHeader, pdRows
+
+
+
+def _parseLines (sHeader, lsLines):
+    ##
+    ## Same parsing as loadJPMFullAuctionTable, on a subset of the lines.
+    ##
+    sText = '\n'.join ([sHeader] + list (lsLines))
+    pdAuction = pd.read_csv (io.StringIO (sText),
+                             parse_dates = ['Date'],
+                             index_col=['Date'])\
+        .dropna(how='all').fillna(0)
+
+    if len (pdAuction) == 0:
+        return None
+
+    return _processJPMFullAuctionFrame (pdAuction)
+
+
+
+def _typeTable (pdAuction):
+    ##
+    ## Fixed dtypes for the store: int num_auctions, float values, list bond_series.
+    ##
+    lsValueCols = [sCol for sCol in pdAuction.columns if sCol not in ('bond_series', 'num_auctions')]
+    pdAuction[lsValueCols] = pdAuction[lsValueCols].astype (np.float64)
+    pdAuction['num_auctions'] = pdAuction['bond_series'].apply (len).astype (np.int64)
+    pdAuction.index = pd.DatetimeIndex (pdAuction.index, name='Date')
+
+    return pdAuction
+
+
+
+def loadCorrections (sFileName=DEFAULT_CORRECTIONS):
+    ##
+    ## Columns: Date, Action, Tenors ("7Y" or "2Y;5Y"), NewDate, Note.
+    ##   move: the Tenors auctions reported on Date took place on NewDate. Applied only if
+    ##         the drop has no auction on NewDate, ie. until JPM fixes the date.
+    ##   drop: remove the Tenors auctions reported on Date.
+    ##
+    lsCols = ['Date', 'Action', 'Tenors', 'NewDate', 'Note']
+    if sFileName is None or not os.path.exists (sFileName):
+        return pd.DataFrame (columns=lsCols)
+
+    pdCorrections = pd.read_csv (sFileName, parse_dates=['Date', 'NewDate'])
+    pdCorrections['Action'] = pdCorrections['Action'].str.strip ().str.lower ()
+    pdCorrections['Tenors'] = pdCorrections['Tenors'].apply (lambda x: [s.strip () for s in str (x).split (';')])
+
+    lsBad = sorted (set (pdCorrections['Action']) - {'move', 'drop'})
+    if lsBad:
+        raise ValueError (f"Unknown correction action(s) {lsBad} in {sFileName}.")
+
+    return pdCorrections
+
+
+
+def _removeTenors (pdData, tsIndex, lsRemove):
+
+    for sTenor in lsRemove:
+        iStartIndex = pdData.columns.get_loc (sTenor + ' Tail')
+        iEndIndex = pdData.columns.get_loc (sTenor + ' AuctionYield')
+        lsCols = pdData.columns[iStartIndex:(iEndIndex + 1)].tolist()
+        pdData.loc[tsIndex, lsCols] = 0.0
+
+    lsValues = [sTenor for sTenor in pdData.at[tsIndex, 'bond_series'] if sTenor not in lsRemove]
+    pdData.at[tsIndex, 'bond_series'] = lsValues
+    pdData.at[tsIndex, 'num_auctions'] = len (lsValues)
+
+    return pdData
+
+
+
+def applyCorrections (pdAuction, pdCorrections):
+    ##
+    ## Apply the corrections table to a processed auction frame, either all rows or the rows
+    ## being ingested (which always include both dates of a correction).
+    ##
+    for _, pdRow in pdCorrections.iterrows ():
+        tsIndex = pdRow['Date']
+        if tsIndex not in pdAuction.index:
+            continue
+        lsTenors = [sTenor for sTenor in pdRow['Tenors'] if sTenor in pdAuction.at[tsIndex, 'bond_series']]
+        if not lsTenors:
+            continue
+
+        if pdRow['Action'] == 'move':
+            tsIndexNew = pdRow['NewDate']
+            if tsIndexNew in pdAuction.index:
+                continue
+            lsOther = [sTenor for sTenor in _loadedTenors (pdAuction) if sTenor not in lsTenors]
+            pdAuction.loc[tsIndexNew, :] = pdAuction.loc[tsIndex, :]
+            pdAuction.at[tsIndexNew, 'bond_series'] = list (pdAuction.at[tsIndex, 'bond_series'])
+            pdAuction = _removeTenors (pdAuction, tsIndexNew, lsOther)
+
+        pdAuction = _removeTenors (pdAuction, tsIndex, lsTenors)
+
+    return pdAuction.sort_index ()
+
+
+
+def _loadedTenors (pdAuction):
+
+    return [sTenor for sTenor in lsAllTenors if (sTenor + ' Tail') in pdAuction.columns]
+
+
+
+def loadAuctionStore (sStoreDir):
+    ##
+    ## Current auction table, same layout as loadJPMFullAuctionTable.
+    ##
+    sPath = os.path.join (sStoreDir, sTableFile)
+    if not os.path.exists (sPath):
+        raise FileNotFoundError (f"No auction store in {sStoreDir}, run ingestJPMFullAuctionFile first.")
+
+    return pd.read_pickle (sPath)
+
+
+
+def _loadRows (sStoreDir):
+
+    sPath = os.path.join (sStoreDir, sRowsFile)
+    if not os.path.exists (sPath):
+        return {'header': None, 'rows': None, 'corrections': None, 'files': []}
+
+    return pd.read_pickle (sPath)
+
+
+
+@timed ('ingestJPMFullAuctionFile')
+def ingestJPMFullAuctionFile (sFileName, sStoreDir, sCorrectionsFile=DEFAULT_CORRECTIONS,
+                              bKeepHistory=True):
+    ##
+    ## Add a drop to the store, parsing only the rows that are new or changed.
+    ## bKeepHistory: keep dates that rolled out of the drop's history window. If False the
+    ##               table matches the latest drop exactly.
+    ##
+    os.makedirs (sStoreDir, exist_ok=True)
+    dictState = _loadRows (sStoreDir)
+
+    with timer ('auction_read_lines'):
+        sHeader, pdRows = _readRawLines (sFileName)
+
+    sCorrectionsHash = _hashFile (sCorrectionsFile)
+    pdCorrections = loadCorrections (sCorrectionsFile)
+
+    pdOldRows = dictState['rows']
+    bFull = (pdOldRows is None or dictState['header'] != sHeader
+             or dictState['corrections'] != sCorrectionsHash)
+    if bFull:
+        ## New store, new columns or new corrections: reprocess everything.
+        pdOldRows = pdRows.iloc[:0]
+        pdTable = None
+    else:
+        pdTable = loadAuctionStore (sStoreDir)
+
+    ##
+    ## New and changed dates, by row hash. Rows missing from the drop are kept (with their
+    ## raw lines) if bKeepHistory.
+    ##
+    pdOldHash = pdOldRows['hash'].reindex (pdRows.index)
+    idxChanged = pdRows.index[pdOldHash.values != pdRows['hash'].values]
+    idxRemoved = pdOldRows.index.difference (pdRows.index)
+
+    if bKeepHistory:
+        pdAllRows = pd.concat ([pdOldRows.loc[idxRemoved], pdRows]).sort_index ()
+        idxRemoved = idxRemoved[:0]
+    else:
+        pdAllRows = pdRows
+
+    ## Corrections touching a changed date need both of their dates reprocessed.
+    setAffected = set (idxChanged) | set (idxRemoved)
+    for _, pdRow in pdCorrections.iterrows ():
+        setDates = {ts for ts in (pdRow['Date'], pdRow['NewDate']) if pd.notna (ts)}
+        if setDates & setAffected:
+            setAffected |= setDates
+    idxAffected = pd.DatetimeIndex (sorted (setAffected), name='Date')
+
+    with timer ('auction_parse_changed'):
+        lsLines = pdAllRows['line'].reindex (idxAffected).dropna ().tolist ()
+        pdNew = _parseLines (sHeader, lsLines) if lsLines else None
+
+    if pdNew is not None:
+        pdNew = applyCorrections (_typeTable (pdNew), pdCorrections)
+        pdNew = _typeTable (pdNew)
+
+    if pdTable is None:
+        pdTable = pdNew
+    else:
+        pdTable = pdTable.drop (pdTable.index.intersection (idxAffected))
+        if pdNew is not None:
+            pdTable = pd.concat ([pdTable, pdNew[pdTable.columns]])
+    pdTable = pdTable.sort_index ()
+
+    pdTable.to_pickle (os.path.join (sStoreDir, sTableFile))
+    dictState = {'header': sHeader, 'rows': pdAllRows, 'corrections': sCorrectionsHash,
+                 'files': dictState['files'] + [os.path.basename (sFileName)]}
+    pd.to_pickle (dictState, os.path.join (sStoreDir, sRowsFile))
+
+    dictStats = {'file': os.path.basename (sFileName),
+                 'full': bFull,
+                 'rows': len (pdRows),
+                 'changed': len (idxChanged),
+                 'removed': len (idxRemoved),
+                 'parsed': len (lsLines),
+                 'auctions': len (pdTable)}
+    logger.info (f"Ingested {dictStats}")
+
+    return dictStats
+
+
+
+def ingestJPMFolder (sFolder, sStoreDir, sPattern='UST Auction All Data_*.csv', **kwargs):
+    ##
+    ## Ingest every drop of a folder, oldest first (the dates are in the file names).
+    ##
+    lsStats = [ingestJPMFullAuctionFile (sFileName, sStoreDir, **kwargs)
+               for sFileName in sorted (glob.glob (os.path.join (sFolder, sPattern)))]
+
+    return pd.DataFrame (lsStats)
+
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig (level=logging.INFO,
+                         format='%(asctime)s %(levelname)-8s %(message)s',
+                         datefmt='%a, %d %b %Y %H:%M:%S')
+
+    sFolder = os.path.dirname (os.path.abspath (__file__))
+    sStoreDir = sys.argv[1] if len (sys.argv) > 1 else os.path.join (sFolder, 'auction_store')
+
+    print (ingestJPMFolder (sFolder, sStoreDir))
+    pdAuctionData = loadAuctionStore (sStoreDir)
+
+    logging.info ("Done")
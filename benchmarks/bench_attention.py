@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Dense vs local (chunked) attention in build_model.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_attention scaling --seq-sizes 64,256,1024,4096 --output attn.json
+    python -m benchmarks.bench_attention backtest --dataset tufv --seq-size 120 --epochs 10
+
+scaling: train step and predict time, and peak memory, against seq_size for each attention
+type, on random windows. Each point runs in its own subprocess so that the peak RSS of one
+point does not hide the next.
+
+backtest: trains both variants on windows of the target column of a
+transformers/transformer_data_*.csv file (first 80% of the windows), then compares test MSE,
+directional accuracy and the encoder_trading.backtest PnL on the remaining 20%.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import ROOT
+
+MODEL_KWARGS = dict(head_size=32, num_heads=2, ff_dim=4, num_transformer_blocks=2, mlp_units=[64])
+
+
+def _variants(window: int, num_global: int) -> Dict[str, Dict]:
+    return {
+        "dense": dict(attention="dense"),
+        "local": dict(attention="local", window=window, num_global=num_global),
+    }
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def scaling_point(
+    variant: str, seq_size: int, batch_size: int, n_features: int, repeat: int, window: int, num_global: int
+) -> Dict:
+    """
+    Time one (variant, seq_size) point in this process.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    from encoder_trading.models import build_model
+
+    keras.utils.set_random_seed(0)
+    x = np.random.standard_normal((batch_size, seq_size, n_features)).astype(np.float32)
+    y = np.random.standard_normal(batch_size).astype(np.float32)
+    model = build_model((seq_size, n_features), **MODEL_KWARGS, **_variants(window, num_global)[variant])
+    model.compile(loss="mean_squared_error", optimizer=keras.optimizers.Adam(learning_rate=1e-4))
+    rss_model = _peak_rss_mb()
+
+    # First call traces the functions.
+    model.train_on_batch(x, y)
+    model.predict_on_batch(x)
+
+    train, predict = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.train_on_batch(x, y)
+        train.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        model.predict_on_batch(x)
+        predict.append(time.perf_counter() - start)
+
+    keys = seq_size if variant == "dense" else 2 * window + num_global
+    return {
+        "variant": variant,
+        "seq_size": seq_size,
+        "batch_size": batch_size,
+        "train_step_s": float(np.median(train)),
+        "predict_s": float(np.median(predict)),
+        "peak_rss_mb": _peak_rss_mb(),
+        "step_rss_mb": _peak_rss_mb() - rss_model,
+        # Attention score entries per block and sample (all heads).
+        "scores": MODEL_KWARGS["num_heads"] * seq_size * keys
+        + (MODEL_KWARGS["num_heads"] * num_global * seq_size if variant == "local" else 0),
+        "params": model.count_params(),
+        "tf": tf.__version__,
+    }
+
+
+def _run_subprocess(args: argparse.Namespace, variant: str, seq_size: int) -> Dict:
+    cmd = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_attention",
+        "scaling",
+        "--single",
+        variant,
+        "--seq-sizes",
+        str(seq_size),
+        "--batch-size",
+        str(args.batch_size),
+        "--features",
+        str(args.features),
+        "--repeat",
+        str(args.repeat),
+        "--window",
+        str(args.window),
+        "--num-global",
+        str(args.num_global),
+    ]
+    env = dict(os.environ, PYTHONPATH=ROOT, TF_CPP_MIN_LOG_LEVEL="2")
+    out = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+    if out.returncode != 0 or not lines:
+        # Typically out of memory for the dense variant at long windows.
+        error = out.stderr.strip().splitlines()[-1:] or [f"exit status {out.returncode}"]
+        return {"variant": variant, "seq_size": seq_size, "error": error[0]}
+    return json.loads(lines[-1])
+
+
+def run_scaling(args: argparse.Namespace):
+    if args.single is not None:
+        seq_size = int(args.seq_sizes)
+        row = scaling_point(
+            args.single, seq_size, args.batch_size, args.features, args.repeat, args.window, args.num_global
+        )
+        print(json.dumps(row))
+        return None
+
+    results = []
+    for seq_size in [int(s) for s in args.seq_sizes.split(",")]:
+        for variant in _variants(args.window, args.num_global):
+            row = _run_subprocess(args, variant, seq_size)
+            results.append(row)
+            if "error" in row:
+                print(f"{variant:<6} seq={seq_size:>6} {row['error']}", flush=True)
+                continue
+            print(
+                f"{variant:<6} seq={seq_size:>6} train={row['train_step_s'] * 1e3:>9.1f}ms "
+                f"predict={row['predict_s'] * 1e3:>9.1f}ms peak={row['peak_rss_mb']:>8.0f}MB "
+                f"step={row['step_rss_mb']:>7.0f}MB scores={row['scores']:>12,}",
+                flush=True,
+            )
+    return results
+
+
+def run_backtest(args: argparse.Namespace):
+    """
+    Train dense and local on the same windows and compare out-of-sample results.
+    """
+    from tensorflow import keras
+
+    from auction_trading.schema import load_transformer_data
+    from encoder_trading.backtest import backtest, perf_summ
+    from encoder_trading.models import build_model
+
+    path = os.path.join(ROOT, "transformers", f"transformer_data_{args.dataset}.csv")
+    df = load_transformer_data(path).dropna(subset=["target"])
+    target = df["target"].values.astype(np.float32)
+    # Same windows as to_sequences(seq_size, df[["target"]]).
+    x = np.lib.stride_tricks.sliding_window_view(target[:-1], args.seq_size)[:, :, None]
+    y = target[args.seq_size :]
+    idx = df.index[args.seq_size :]
+    split = int(len(x) * 0.8)
+
+    results = []
+    for variant, kwargs in _variants(args.window, args.num_global).items():
+        keras.utils.set_random_seed(args.seed)
+        model = build_model(x.shape[1:], **MODEL_KWARGS, **kwargs)
+        model.compile(loss="mean_squared_error", optimizer=keras.optimizers.Adam(learning_rate=1e-4))
+        start = time.perf_counter()
+        model.fit(x[:split], y[:split], batch_size=args.batch_size, epochs=args.epochs, verbose=0)
+        fit_s = time.perf_counter() - start
+        pred = model.predict(x[split:], batch_size=args.batch_size, verbose=0).ravel()
+
+        rets = backtest(pred, y[split:], idx=idx[split:])
+        summary = perf_summ(rets["pct_pnl"], adj=252, title=variant)[variant]
+        row = {
+            "variant": variant,
+            "dataset": args.dataset,
+            "seq_size": args.seq_size,
+            "fit_s": fit_s,
+            "test_mse": float(np.mean((pred - y[split:]) ** 2)),
+            "hit_rate": float(np.mean(np.sign(pred) == np.sign(y[split:]))),
+            "cum_pnl": float(rets["cum_pnl"].iloc[-1]),
+            "sharpe": float(summary["Annualized Sharpe Ratio"]),
+            "max_drawdown": float(summary["Max Drawdown"]),
+        }
+        results.append(row)
+        print(
+            f"{variant:<6} fit={fit_s:>7.1f}s mse={row['test_mse']:.4g} hit={row['hit_rate']:.3f} "
+            f"pnl={row['cum_pnl']:>12,.0f} sharpe={row['sharpe']:.2f} maxdd={row['max_drawdown']:.3f}",
+            flush=True,
+        )
+    return results
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("mode", choices=("scaling", "backtest"))
+    parser.add_argument("--seq-sizes", default="64,256,1024,4096", help="scaling: comma separated.")
+    parser.add_argument("--features", type=int, default=1, help="scaling: features per bar.")
+    parser.add_argument("--repeat", type=int, default=5, help="scaling: timed steps per point.")
+    parser.add_argument("--dataset", default="tufv", help="backtest: transformer_data_<dataset>.csv.")
+    parser.add_argument("--seq-size", type=int, default=120, help="backtest: window length.")
+    parser.add_argument("--epochs", type=int, default=10, help="backtest: training epochs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--window", type=int, default=16, help="Chunk size of the local attention.")
+    parser.add_argument("--num-global", type=int, default=2, help="Global tokens of the local attention.")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file.")
+    parser.add_argument("--single", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    results = run_scaling(args) if args.mode == "scaling" else run_backtest(args)
+    if args.output is not None and results is not None:
+        with open(args.output, "w") as f:
+            json.dump({"mode": args.mode, "cpus": os.cpu_count(), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
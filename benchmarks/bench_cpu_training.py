@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Training throughput of build_model on CPU, current setup vs encoder_trading.cpu_training.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_cpu_training --output cpu_training.json
+    python -m benchmarks.bench_cpu_training --datasets tufv,fvty --epochs 3 --threads 8
+
+Each configuration trains a fresh model (same seed) on windows of the target column of each
+transformers/transformer_data_*.csv file, and reports samples/sec and epoch time. The
+first epoch includes tracing / XLA compilation and is reported separately.
+
+Configurations:
+    baseline    model.compile() defaults and model.fit(x, y), as the notebooks.
+    threads     baseline with the thread pools of configure_cpu.
+    jit         threads + jit_compile=True.
+    jit_fixed   jit + fixed-shape padded batches (fit_cpu).
+    bf16        jit_fixed + mixed_bfloat16, only on CPUs with native bfloat16.
+
+Thread pools can only be set once per process, so every configuration runs in its own
+subprocess.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import ROOT
+
+CONFIGS = ("baseline", "threads", "jit", "jit_fixed", "bf16")
+
+MODEL_KWARGS = dict(head_size=64, num_heads=2, ff_dim=4, num_transformer_blocks=2, mlp_units=[64])
+
+
+def _dataset_path(name: str) -> str:
+    return os.path.join(ROOT, "transformers", f"transformer_data_{name}.csv")
+
+
+def available_datasets() -> List[str]:
+    files = sorted(glob.glob(_dataset_path("*")))
+    return [os.path.basename(f)[len("transformer_data_") : -len(".csv")] for f in files]
+
+
+def load_windows(name: str, seq_size: int, max_samples: int = None):
+    """
+    Windows of the target column, as to_sequences(seq_size, df[["target"]]) (vectorized).
+    """
+    from auction_trading.schema import load_transformer_data
+
+    target = load_transformer_data(_dataset_path(name))["target"].dropna().values.astype(np.float32)
+    x = np.lib.stride_tricks.sliding_window_view(target[:-1], seq_size)[:, :, None]
+    y = target[seq_size:]
+    if max_samples is not None:
+        x, y = x[:max_samples], y[:max_samples]
+    return np.ascontiguousarray(x), y
+
+
+def run_config(
+    config: str, dataset: str, seq_size: int, epochs: int, batch_size: int, threads: int, max_samples: int
+) -> Dict:
+    """
+    Train one configuration in this process and time it.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    from encoder_trading import cpu_training
+    from encoder_trading.models import build_model
+
+    settings = {"policy": "float32"}
+    if config != "baseline":
+        settings = cpu_training.configure_cpu(threads, mixed_precision=config == "bf16")
+    if config == "bf16" and settings["policy"] != "mixed_bfloat16":
+        return {"config": config, "dataset": dataset, "skipped": "no native bfloat16 on this CPU"}
+
+    x, y = load_windows(dataset, seq_size, max_samples)
+    keras.utils.set_random_seed(0)
+    if config in ("baseline", "threads"):
+        model = build_model(x.shape[1:], **MODEL_KWARGS)
+        model.compile(loss="mean_squared_error", optimizer=keras.optimizers.Adam(learning_rate=1e-4))
+    else:
+        model = cpu_training.build_cpu_model(x.shape[1:], mixed_precision=config == "bf16", **MODEL_KWARGS)
+        cpu_training.compile_for_cpu(model, jit_compile=True)
+
+    epoch_times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        if config in ("jit_fixed", "bf16"):
+            cpu_training.fit_cpu(model, x, y, batch_size=batch_size, epochs=1, verbose=0)
+        else:
+            model.fit(x, y, batch_size=batch_size, epochs=1, verbose=0)
+        epoch_times.append(time.perf_counter() - start)
+
+    steady = epoch_times[1:] or epoch_times
+    return {
+        "config": config,
+        "dataset": dataset,
+        "samples": len(x),
+        "first_epoch_s": epoch_times[0],
+        "epoch_s": float(np.median(steady)),
+        "samples_per_s": len(x) / float(np.median(steady)),
+        "final_loss": float(model.evaluate(x, y, batch_size=batch_size, verbose=0)),
+        **settings,
+        "tf": tf.__version__,
+    }
+
+
+def _run_subprocess(config: str, args: argparse.Namespace, dataset: str) -> Dict:
+    cmd = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_cpu_training",
+        "--single",
+        config,
+        "--datasets",
+        dataset,
+        "--seq-size",
+        str(args.seq_size),
+        "--epochs",
+        str(args.epochs),
+        "--batch-size",
+        str(args.batch_size),
+        "--threads",
+        str(args.threads or 0),
+        "--max-samples",
+        str(args.max_samples or 0),
+    ]
+    env = dict(os.environ, PYTHONPATH=ROOT, TF_CPP_MIN_LOG_LEVEL="2")
+    out = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+    if out.returncode != 0 or not lines:
+        return {"config": config, "dataset": dataset, "error": out.stderr.strip().splitlines()[-1:]}
+    return json.loads(lines[-1])
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--datasets", default=None, help="Comma separated, eg. tufv,fvty. Defaults to all.")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="Comma separated configurations.")
+    parser.add_argument("--seq-size", type=int, default=10)
+    parser.add_argument(
+        "--epochs", type=int, default=3, help="Epochs per run, the first includes compilation."
+    )
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads, defaults to all cores.")
+    parser.add_argument("--max-samples", type=int, default=None, help="Cap on windows per dataset.")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file.")
+    parser.add_argument("--single", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    datasets = args.datasets.split(",") if args.datasets else available_datasets()
+    if args.single is not None:
+        # Child process: one configuration, result as one JSON line.
+        row = run_config(
+            args.single,
+            datasets[0],
+            args.seq_size,
+            args.epochs,
+            args.batch_size,
+            args.threads or None,
+            args.max_samples or None,
+        )
+        print(json.dumps(row))
+        return 0
+
+    results = []
+    for dataset in datasets:
+        base = None
+        for config in args.configs.split(","):
+            row = _run_subprocess(config, args, dataset)
+            if config == "baseline" and "samples_per_s" in row:
+                base = row["samples_per_s"]
+            if base and "samples_per_s" in row:
+                row["speedup"] = row["samples_per_s"] / base
+            results.append(row)
+            if "samples_per_s" in row:
+                print(
+                    f"{dataset:<8} {config:<10} samples/s={row['samples_per_s']:>9.0f} "
+                    f"epoch={row['epoch_s']:.2f}s first={row['first_epoch_s']:.2f}s "
+                    f"speedup={row.get('speedup', 1.0):.2f}x loss={row['final_loss']:.4g}",
+                    flush=True,
+                )
+            else:
+                print(f"{dataset:<8} {config:<10} {row.get('skipped') or row.get('error')}", flush=True)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"python": platform.python_version(), "cpus": os.cpu_count(), "results": results}, f, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Offline benchmark suite for the auction and modeling hot paths.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --threshold 0.25
+
+Every benchmark is timed across history scales (1x is the bundled history, 100x is
+100 times as many bars over the same dates) and, where relevant, across auction counts.
+Results, including peak Python memory from tracemalloc, are written as JSON so that runs
+on different commits can be compared. With --baseline, the run exits with status 1 if any
+benchmark is slower than the baseline by more than --threshold.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+
+# A benchmark takes (scale, n_auctions) and returns a zero-argument callable to time.
+Setup = Callable[[int, int], Callable[[], object]]
+
+# Business days in the bundled 2018-2023 history.
+HISTORY_DAYS = 1_300
+
+
+class Benchmark:
+    """
+    A named benchmark. setup is called once per (scale, auctions) point and returns the
+    callable that is timed; setup time is not included in the results.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        setup: Setup,
+        max_scale: int = None,
+        uses_auctions: bool = False,
+    ):
+        self.name = name
+        self.setup = setup
+        self.max_scale = max_scale
+        self.uses_auctions = uses_auctions
+
+    def points(self, scales: Sequence[int], auctions: Sequence[int]) -> List[Tuple[int, int]]:
+        scales = [s for s in scales if self.max_scale is None or s <= self.max_scale]
+        auctions = auctions if self.uses_auctions else [0]
+        return [(s, a) for s in scales for a in auctions]
+
+
+def _synthetic_inputs(scale: int, n_auctions: int) -> Tuple[pd.Series, pd.DataFrame]:
+    spread = synthetic.make_spread(HISTORY_DAYS, bars_per_day=6 * scale)
+    return spread, synthetic.make_auction_table(spread.index, n_auctions)
+
+
+_BUNDLED = {}
+
+
+def _bundled_inputs(scale: int) -> Tuple[pd.Series, pd.DataFrame]:
+    import auctiondates.auctionFileProcessing as afp
+
+    if "auctions" not in _BUNDLED:
+        _BUNDLED["spread"] = synthetic.load_bundled_spread()
+        auctions = afp.pdGetOneAuctionResults(afp.loadJPMFullAuctionTable(synthetic.AUCTION_FILENAME), 5)
+        spread = _BUNDLED["spread"]
+        # Only keep auctions with a populated week on either side.
+        inside = (auctions.index > spread.index[0] + pd.Timedelta(days=7)) & (
+            auctions.index < spread.index[-1] - pd.Timedelta(days=7)
+        )
+        _BUNDLED["auctions"] = auctions[inside]
+    return synthetic.densify_history(_BUNDLED["spread"], scale), _BUNDLED["auctions"]
+
+
+def _setup_calc_all_trades(scale: int, n_auctions: int) -> Callable[[], object]:
+    from auction_trading.pnl_calcs import calc_all_trades
+
+    spread, auctions = _synthetic_inputs(scale, n_auctions)
+    return lambda: calc_all_trades(spread, auctions, (2, 2), trade_rule=lambda x: ("steepener", "flattener"))
+
+
+def _setup_calc_all_trades_bundled(scale: int, n_auctions: int) -> Callable[[], object]:
+    from auction_trading.pnl_calcs import calc_all_trades
+
+    spread, auctions = _bundled_inputs(scale)
+    return lambda: calc_all_trades(spread, auctions, (2, 2), trade_rule=lambda x: ("steepener", "flattener"))
+
+
+def _setup_optimize_entry_time(scale: int, n_auctions: int) -> Callable[[], object]:
+    from auction_trading.pnl_calcs import optimize_entry_time
+
+    spread, auctions = _synthetic_inputs(scale, n_auctions)
+
+    def run():
+        # optimize_entry_time prints its result, keep the benchmark output readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            return optimize_entry_time(spread, auctions, symmetric=False)
+
+    return run
+
+
+def _setup_calc_n_prior_generator(scale: int, n_auctions: int) -> Callable[[], object]:
+    from auction_trading.utils import calc_n_prior_generator
+
+    spread, auctions = _synthetic_inputs(scale, n_auctions)
+    dates = list(auctions.index)
+    bond_series = auctions["bond_series"]
+    return lambda: sum(
+        len(p) + len(a) for p, a in calc_n_prior_generator(spread, dates, 3, None, None, bond_series)
+    )
+
+
+def _setup_load_auction_table(scale: int, n_auctions: int) -> Callable[[], object]:
+    import auctiondates.auctionFileProcessing as afp
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_"), f"auctions_{scale}x.csv")
+    synthetic.tile_auction_csv(path, scale)
+    return lambda: afp.loadJPMFullAuctionTable(path)
+
+
+def _setup_one_auction_results(scale: int, n_auctions: int) -> Callable[[], object]:
+    import auctiondates.auctionFileProcessing as afp
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_"), f"auctions_{scale}x.csv")
+    table = afp.loadJPMFullAuctionTable(synthetic.tile_auction_csv(path, scale))
+    return lambda: [afp.pdGetOneAuctionResults(table, t) for t in (2, 3, 5, 7, 10, 20, 30)]
+
+
+def _setup_qlibdate(scale: int, n_auctions: int) -> Callable[[], object]:
+    from lib import qlibdate
+
+    dates = synthetic.make_dates(1_000 * scale)
+
+    def run():
+        for d in dates:
+            qlibdate.qlIsBusDay(d)
+            nxt = qlibdate.qlAddBusDays(d, 5)
+            qlibdate.qlNumOfBusDays(d, nxt)
+            qlibdate.qlAdjToBusDay(d)
+
+    return run
+
+
+def _setup_to_sequences(scale: int, n_auctions: int) -> Callable[[], object]:
+    from encoder_trading.sequences import to_sequences
+
+    df = synthetic.densify_history(synthetic.load_bundled_features(), scale)
+    return lambda: to_sequences(50, df, 0)
+
+
+def _setup_backtest(scale: int, n_auctions: int) -> Callable[[], object]:
+    from encoder_trading.backtest import backtest
+
+    df = synthetic.densify_history(synthetic.load_bundled_features(), scale)
+    rng = np.random.default_rng(0)
+    pred = rng.normal(size=(len(df), 1))
+    y = df["target"].values
+    idx = list(df.index)
+    return lambda: backtest(pred, y, periods_per_day=6 * scale, idx=idx)
+
+
+BENCHMARKS = [
+    Benchmark("calc_all_trades", _setup_calc_all_trades, uses_auctions=True),
+    Benchmark("calc_all_trades[bundled]", _setup_calc_all_trades_bundled),
+    Benchmark("optimize_entry_time", _setup_optimize_entry_time, max_scale=10, uses_auctions=True),
+    Benchmark("calc_n_prior_generator", _setup_calc_n_prior_generator, uses_auctions=True),
+    Benchmark("loadJPMFullAuctionTable", _setup_load_auction_table),
+    Benchmark("pdGetOneAuctionResults", _setup_one_auction_results),
+    Benchmark("qlibdate", _setup_qlibdate),
+    # to_sequences loops over rows in Python, keep it to 10x.
+    Benchmark("to_sequences", _setup_to_sequences, max_scale=10),
+    Benchmark("backtest", _setup_backtest),
+]
+
+
+def time_callable(func: Callable[[], object], repeat: int = 3) -> Dict[str, float]:
+    """
+    Time func repeat times and measure its peak Python memory in one extra traced run.
+    :param func: Zero-argument callable.
+    :param repeat: Number of timed runs.
+    :return: Dict with min/median wall time in seconds and peak memory in MB.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    # Memory is traced separately since tracemalloc slows down allocation heavy code.
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min_s": float(np.min(times)),
+        "median_s": float(np.median(times)),
+        "peak_mb": peak / 2**20,
+    }
+
+
+def run(
+    benchmarks: Iterable[Benchmark],
+    scales: Sequence[int] = (1, 10, 100),
+    auctions: Sequence[int] = (50, 200),
+    repeat: int = 3,
+) -> List[Dict]:
+    """
+    Run the benchmarks and return one result row per (benchmark, scale, auctions) point.
+    """
+    results = []
+    for bench in benchmarks:
+        for scale, n_auctions in bench.points(scales, auctions):
+            func = bench.setup(scale, n_auctions)
+            row = {"name": bench.name, "scale": scale, "auctions": n_auctions}
+            row.update(time_callable(func, repeat))
+            results.append(row)
+            print(
+                f"{bench.name:<28} scale={scale:<4} auctions={n_auctions:<4} "
+                f"median={row['median_s']:.4f}s peak={row['peak_mb']:.1f}MB",
+                flush=True,
+            )
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=synthetic.ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _key(row: Dict) -> Tuple[str, int, int]:
+    return row["name"], row["scale"], row["auctions"]
+
+
+def compare(current: List[Dict], baseline: List[Dict], threshold: float = 0.25) -> List[Dict]:
+    """
+    Compare two runs and return the points that got slower than the baseline by more than
+    threshold (eg. 0.25 is 25%). Median wall time is compared, points missing from either run
+    are ignored.
+    """
+    base = {_key(row): row for row in baseline}
+    regressions = []
+    for row in current:
+        old = base.get(_key(row))
+        if old is None or old["median_s"] <= 0:
+            continue
+        ratio = row["median_s"] / old["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append({**row, "baseline_median_s": old["median_s"], "ratio": ratio})
+    return regressions
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scales", default="1,10,100", help="Comma separated history scales.")
+    parser.add_argument("--auctions", default="50,200", help="Comma separated auction counts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per point.")
+    parser.add_argument("--only", default=None, help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before flagging.")
+    args = parser.parse_args(argv)
+
+    benchmarks = [b for b in BENCHMARKS if args.only is None or args.only in b.name]
+    results = run(
+        benchmarks,
+        scales=[int(s) for s in args.scales.split(",")],
+        auctions=[int(a) for a in args.auctions.split(",")],
+        repeat=args.repeat,
+    )
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": pd.Timestamp.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for r in regressions:
+            print(
+                f"REGRESSION {r['name']} scale={r['scale']} auctions={r['auctions']}: "
+                f"{r['baseline_median_s']:.4f}s -> {r['median_s']:.4f}s ({r['ratio']:.2f}x)"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+import os
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+# Repository root, so the benchmarks can be run from any directory.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SPREAD_FILENAME = os.path.join(ROOT, "transformers", "transformer_data_tufv.csv")
+FEATURE_FILENAME = os.path.join(ROOT, "data", "qm_data_tufv.csv")
+AUCTION_FILENAME = os.path.join(ROOT, "auctiondates", "UST Auction All Data_20230313.csv")
+
+# Bars of the 2-hour grid used by the qm_data / transformer_data files.
+BAR_HOURS = (5, 7, 9, 11, 13, 15)
+
+
+def make_spread(n_days: int, bars_per_day: int = 6, seed: int = 0, start: str = "2018-01-02") -> pd.Series:
+    """
+    Random-walk spread on a business-day grid between 5am and 3pm. With the default six bars
+    per day this is the 2-hour grid of the qm_data files; larger values give denser history
+    over the same dates, eg. 600 bars per day is 100x the current history.
+    :param n_days: Number of business days to generate.
+    :param bars_per_day: Number of evenly spaced bars in each session.
+    :param seed: Seed for the random number generator.
+    :param start: First business day of the series.
+    :return: Series named "Spread" indexed by bar timestamps.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, periods=n_days)
+    first, last = BAR_HOURS[0] * 60, BAR_HOURS[-1] * 60
+    minutes = np.linspace(first, last, bars_per_day).round().astype("int64")
+    offsets = pd.to_timedelta(minutes, unit="min")
+    index = (days.values[:, None] + offsets.values[None, :]).ravel()
+    values = 1.0 + np.cumsum(rng.normal(0, 5e-4, len(index)))
+    return pd.Series(values, index=pd.DatetimeIndex(index), name="Spread")
+
+
+def make_auction_table(
+    index: pd.DatetimeIndex, n_auctions: int, seed: int = 0, double_share: float = 0.2
+) -> pd.DataFrame:
+    """
+    Synthetic auction schedule with a bond_series column, in the format returned by
+    pdGetOneAuctionResults and consumed by calc_all_trades.
+    :param index: Bar index the auctions have to fall within.
+    :param n_auctions: Number of auctions.
+    :param seed: Seed for the random number generator.
+    :param double_share: Share of auctions with two bond series (eg. 2Y and 5Y).
+    :return: DataFrame indexed by auction date.
+    """
+    rng = np.random.default_rng(seed)
+    # Keep a week of data on either side so every auction window is populated.
+    days = pd.bdate_range(
+        index[0].normalize() + pd.Timedelta(days=7), index[-1].normalize() - pd.Timedelta(days=7)
+    )
+    dates = np.sort(rng.choice(days.values, size=min(n_auctions, len(days)), replace=False))
+    double = rng.random(len(dates)) < double_share
+    bond_series = [["2Y", "5Y"] if d else ["5Y"] for d in double]
+    return pd.DataFrame(
+        {"bond_series": bond_series, "num_auctions": [len(b) for b in bond_series]},
+        index=pd.DatetimeIndex(dates, name="Date"),
+    )
+
+
+def load_bundled_spread() -> pd.Series:
+    """
+    Load the bundled TU/FV close series used in Auction_Analysis.ipynb.
+    :return: Series named "Spread".
+    """
+    tufv = pd.read_csv(SPREAD_FILENAME, index_col=0, parse_dates=[0])
+    return tufv["close"].dropna().rename("Spread")
+
+
+def load_bundled_features() -> pd.DataFrame:
+    """
+    Load the bundled TU/FV feature file, prepared the same way as the Encoder_Trader notebooks
+    (target first, "Sum" and "Date" dropped).
+    :return: DataFrame of features indexed by date.
+    """
+    df = pd.read_csv(FEATURE_FILENAME, sep=",", na_values=["-1"], index_col=False)
+    df["Date"] = pd.to_datetime(df["Date"])
+    df = df.drop("Sum", axis=1).dropna().set_index("Date")
+    col = df.pop("target")
+    df.insert(0, col.name, col)
+    return df
+
+
+def densify_history(frame: Union[pd.Series, pd.DataFrame], factor: int) -> Union[pd.Series, pd.DataFrame]:
+    """
+    Scale a bar history factor times by interleaving copies of it between the existing bars,
+    eg. factor 60 turns the 2-hour bars into 2-minute bars over the same dates. Dates (and so
+    the auction schedule) stay valid, only the number of bars per window grows.
+    :param frame: Series or DataFrame with a sorted DatetimeIndex.
+    :param factor: Number of copies.
+    :return: Frame with factor * len(frame) rows.
+    """
+    if factor == 1:
+        return frame
+    step = pd.Series(frame.index).diff().median() / factor
+    copies = []
+    for k in range(factor):
+        copy = frame.copy()
+        copy.index = frame.index + k * step
+        copies.append(copy)
+    return pd.concat(copies).sort_index(kind="mergesort")
+
+
+def tile_auction_csv(path: str, factor: int, source: str = AUCTION_FILENAME) -> str:
+    """
+    Write a copy of the JPM auction file with factor times the rows, so that
+    loadJPMFullAuctionTable can be timed on larger inputs. Each copy is shifted by whole
+    weeks to stay within the range of pd.Timestamp.
+    :param path: Output filename.
+    :param factor: Number of copies.
+    :param source: JPM auction file to tile.
+    :return: Output filename.
+    """
+    raw = pd.read_csv(source, parse_dates=["Date"]).dropna(subset=["Date"])
+    days = raw["Date"].values.astype("datetime64[D]")
+    if factor == 1:
+        out = raw
+    else:
+        # Whole weeks so the copies keep their weekdays. Copies are placed before and after
+        # the original dates, which stay in place for _amendFullData, and shifts are done in
+        # numpy days since they exceed the range of pd.Timedelta.
+        span = -(-((days.max() - days.min()).astype("int64") + 1) // 7) * 7
+        before = min(factor - 1, (days.min() - np.datetime64("1680-01-01", "D")).astype("int64") // span)
+        copies = []
+        for k in range(-before, factor - before):
+            copy = raw.copy()
+            copy["Date"] = pd.to_datetime(days + k * span)
+            copies.append(copy)
+        out = pd.concat(copies)
+    out = out.assign(Date=out["Date"].dt.strftime("%Y-%m-%d"))
+    out.to_csv(path, index=False, na_rep="N/A")
+    return path
+
+
+def make_dates(n: int, seed: int = 0, start: str = "2000-01-01", end: str = "2040-12-31") -> List:
+    """
+    Random calendar dates for the qlibdate benchmarks.
+    :param n: Number of dates.
+    :param seed: Seed for the random number generator.
+    :return: List of datetime.date.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, end, freq="D")
+    return [d.date() for d in pd.DatetimeIndex(rng.choice(days.values, size=n))]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def backtest(
+    pred: np.ndarray,
+    y_test: np.ndarray,
+    periods_per_day: int = 10,
+    capital: float = 1_000_000,
+    mult: int = 10_000,
+    contracts: int = 1,
+    idx: Sequence = None,
+    transaction_costs: float = 0,
+    cost_model=None,
+    auction_days: Sequence = None,
+) -> pd.DataFrame:
+    """
+    Primary backtesting function. Go long the target when the prediction is positive and
+    short when it is negative, sampling cumulative PnL once per day.
+    :param pred: Model predictions.
+    :param y_test: Realized target values.
+    :param periods_per_day: Number of bars per day, used to sample the PnL.
+    :param capital: Starting capital.
+    :param mult: Multiplier to use for PnL calculation.
+    :param contracts: Number of contracts traded.
+    :param idx: Index (timestamps) aligned with pred.
+    :param transaction_costs: Proportional transaction cost.
+    :param cost_model: Optional auction_trading.costs.CostModel, charged on every change of
+                       position (contracts units of the spread).
+    :param auction_days: Auction dates for the cost model's slippage curve.
+    :return: DataFrame with cumulative PnL, portfolio value and percentage returns.
+    """
+    pred = np.asarray(pred, dtype=float).ravel()
+    tot = np.asarray(y_test, dtype=float).ravel() * mult * contracts
+
+    # Long the target when pred > 0, short when pred < 0 and flat otherwise, with the
+    # proportional cost charged on every bar with a position.
+    side = np.where(pred > 0.0, 1.0, np.where(pred < 0.0, -1.0, 0.0))
+    step = np.where(side != 0, side * tot - transaction_costs * tot, 0.0)
+    if cost_model is not None:
+        step = step - cost_model.position_costs(side * contracts, idx, auction_days)
+    # Daily PnL is sampled on every periods_per_day-th bar.
+    pnls = np.cumsum(step)[::periods_per_day]
+    idx_n = np.asarray(idx)[: len(pred)][::periods_per_day]
+
+    # Calculate portfolio value, and percentage returns.
+    rets = pd.DataFrame(data=pnls, columns=["cum_pnl"], index=idx_n)
+    rets["portfolio"] = rets["cum_pnl"] + capital
+    rets["pct_pnl"] = rets["portfolio"].pct_change()
+    rets = rets.dropna()
+
+    return rets
+
+
+def backtest_members(
+    preds: np.ndarray,
+    y_test: np.ndarray,
+    periods_per_day: int = 10,
+    capital: float = 1_000_000,
+    mult: int = 10_000,
+    contracts: int = 1,
+    idx: Sequence = None,
+    transaction_costs: float = 0,
+    members: Sequence = None,
+) -> pd.DataFrame:
+    """
+    backtest for many prediction columns at once, eg. the members of an ensemble. Column k
+    gives the same numbers as backtest(preds[:, k], ...).
+    :param preds: (n, K) predictions.
+    :param y_test: Realized target values, shape (n,).
+    :param members: Column names, defaults to 0..K-1.
+    :return: DataFrame with (metric, member) columns, metric in cum_pnl, portfolio, pct_pnl.
+    """
+    preds = np.asarray(preds, dtype=float)
+    preds = preds.reshape(len(preds), -1)
+    tot = (np.asarray(y_test, dtype=float).ravel() * mult * contracts)[:, None]
+
+    side = np.where(preds > 0.0, 1.0, np.where(preds < 0.0, -1.0, 0.0))
+    step = np.where(side != 0, side * tot - transaction_costs * tot, 0.0)
+    pnls = np.cumsum(step, axis=0)[::periods_per_day]
+    idx_n = np.asarray(idx)[: len(preds)][::periods_per_day]
+
+    members = list(members) if members is not None else list(range(preds.shape[1]))
+    cum_pnl = pd.DataFrame(pnls, index=idx_n, columns=members)
+    portfolio = cum_pnl + capital
+    rets = pd.concat({"cum_pnl": cum_pnl, "portfolio": portfolio, "pct_pnl": portfolio.pct_change()}, axis=1)
+    return rets.iloc[1:]
+
+
+def perf_summ(data: pd.DataFrame, adj: int = 12, title: str = "Metric") -> pd.DataFrame:
+    """
+    Performance summary. Calculate key ratios, and adjust them.
+    :param data: Periodic returns.
+    :param adj: Number of periods per year used to annualize.
+    :param title: Column title of the summary.
+    :return: Titled DataFrame of performance metrics.
+    """
+    summary = pd.DataFrame(data=data.mean() * adj, index=[title], columns=["Annualized Return"])
+    summary["Annualized Volatility"] = data.std() * np.sqrt(adj)
+    summary["Annualized Sharpe Ratio"] = summary["Annualized Return"] / summary["Annualized Volatility"]
+    summary["Annualized Sortino Ratio"] = summary["Annualized Return"] / (
+        (data[data < 0]).std() * np.sqrt(adj)
+    )
+
+    summary["Skewness"] = data.skew()
+    summary["Kurtosis"] = data.kurtosis()
+    summary["VaR (0.05)"] = data.quantile(0.05)
+    summary["CVaR (0.05)"] = data[data <= data.quantile(0.05)].mean()
+    summary["Min"] = data.min()
+    summary["Max"] = data.max()
+
+    wealth_index = 1000 * (1 + data).cumprod()
+    previous_peaks = wealth_index.cummax()
+    drawdowns = (wealth_index - previous_peaks) / previous_peaks
+
+    summary["Max Drawdown"] = drawdowns.min()
+    summary["Calmar Ratio"] = np.abs(((data.mean() * adj) / drawdowns.min()))
+
+    return summary.T
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+CPU training settings for build_model.
+
+The notebooks wrap fit in tf.device("/device:GPU:0") and fall back to the default CPU setup
+on a bare except. On CPU-only hosts the main levers are:
+
+- Thread pools: one intra-op pool sized to the physical cores, a small inter-op pool.
+- XLA: compile the train / predict step (jit_compile=True), which fuses the attention and
+  feed-forward ops of each encoder block.
+- Fixed shapes: every batch has exactly batch_size rows, so the compiled step is traced once.
+  The last, partial batch is padded with zero-weight rows instead of being dropped.
+- bfloat16 mixed precision, only on CPUs with native bfloat16 (AVX512_BF16 / AMX), where it
+  roughly halves memory traffic. Elsewhere it is emulated and slower.
+
+    >>> configure_cpu()                       # before any other TensorFlow work
+    >>> model = build_cpu_model(x_train.shape[1:], mixed_precision=False, head_size=256, ...)
+    >>> compile_for_cpu(model, optimizer=keras.optimizers.Adam(1e-4))
+    >>> fit_cpu(model, x_train, y_train, batch_size=64, epochs=200)
+    >>> pred = predict_padded(model, x_test, batch_size=64)
+"""
+
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from encoder_trading.models import build_model
+
+
+def bfloat16_supported() -> bool:
+    """
+    True if the CPU has native bfloat16 instructions (Linux only, False elsewhere).
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return any(flag in flags for flag in ("avx512_bf16", "amx_bf16"))
+
+
+def configure_cpu(
+    intra_op_threads: int = None, inter_op_threads: int = 2, mixed_precision: bool = False
+) -> Dict[str, object]:
+    """
+    Set the TensorFlow thread pools and precision policy. Must run before TensorFlow
+    executes its first op, thread pools cannot be changed afterwards.
+    :param intra_op_threads: Threads inside one op (matmuls etc.). Defaults to all cores.
+    :param inter_op_threads: Ops run in parallel.
+    :param mixed_precision: Use the mixed_bfloat16 policy, if the CPU supports bfloat16.
+    :return: Dict of the settings in effect.
+    """
+    intra_op_threads = intra_op_threads or os.cpu_count()
+    applied = True
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        # TensorFlow is already initialized, keep its pools.
+        applied = False
+
+    policy = "mixed_bfloat16" if mixed_precision and bfloat16_supported() else "float32"
+    keras.mixed_precision.set_global_policy(policy)
+    return {
+        "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+        "threads_applied": applied,
+        "policy": policy,
+    }
+
+
+def build_cpu_model(
+    input_shape: Tuple[int, int], mixed_precision: bool = False, **build_kwargs
+) -> keras.Model:
+    """
+    build_model under the mixed_bfloat16 policy (if requested and supported), with the output
+    cast back to float32 so the loss is computed in full precision.
+    """
+    policy = keras.mixed_precision.global_policy()
+    use_bf16 = mixed_precision and bfloat16_supported()
+    if use_bf16:
+        keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    try:
+        model = build_model(input_shape, **build_kwargs)
+    finally:
+        keras.mixed_precision.set_global_policy(policy)
+    if not use_bf16:
+        return model
+    outputs = layers.Activation("linear", dtype="float32")(model.output)
+    return keras.Model(model.input, outputs)
+
+
+def compile_for_cpu(
+    model: keras.Model,
+    loss="mean_squared_error",
+    optimizer=None,
+    jit_compile: bool = True,
+    steps_per_execution: int = 1,
+    **kwargs,
+) -> keras.Model:
+    """
+    model.compile with XLA and optionally several train steps per call.
+    :param jit_compile: Compile the train / predict steps with XLA.
+    :param steps_per_execution: Batches run per tf.function call, amortizes the Python
+                                overhead of small models.
+    """
+    optimizer = optimizer or keras.optimizers.Adam(learning_rate=1e-4)
+    model.compile(
+        loss=loss,
+        optimizer=optimizer,
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution,
+        **kwargs,
+    )
+    return model
+
+
+def pad_to_batches(x: np.ndarray, batch_size: int, y: np.ndarray = None) -> Tuple:
+    """
+    Pad x (and y) to a multiple of batch_size by repeating the last row.
+    :return: Tuple of (x, y or None, sample weights): weight 1 for real rows, 0 for padding.
+    """
+    n = len(x)
+    pad = (-n) % batch_size
+    weights = np.concatenate([np.ones(n, dtype=np.float32), np.zeros(pad, dtype=np.float32)])
+    if pad:
+        x = np.concatenate([x, np.repeat(x[-1:], pad, axis=0)])
+        if y is not None:
+            y = np.concatenate([y, np.repeat(y[-1:], pad, axis=0)])
+    return x, y, weights
+
+
+def fixed_shape_dataset(
+    x: np.ndarray, y: np.ndarray, batch_size: int, shuffle: bool = True, seed: int = 0
+) -> tf.data.Dataset:
+    """
+    tf.data pipeline of (x, y, sample_weight) batches that all have exactly batch_size rows.
+    The real rows are shuffled before the padding is appended, so all padding rows are in
+    the last batch of each epoch.
+    """
+    n = len(x)
+    x, y, w = pad_to_batches(np.asarray(x, dtype=np.float32), batch_size, np.asarray(y, dtype=np.float32))
+    ds = tf.data.Dataset.from_tensor_slices((x[:n], y[:n], w[:n]))
+    if shuffle:
+        ds = ds.shuffle(n, seed=seed, reshuffle_each_iteration=True)
+    if len(x) > n:
+        ds = ds.concatenate(tf.data.Dataset.from_tensor_slices((x[n:], y[n:], w[n:])))
+    return ds.batch(batch_size, drop_remainder=True).prefetch(tf.data.AUTOTUNE)
+
+
+def fit_cpu(
+    model: keras.Model,
+    x: np.ndarray,
+    y: np.ndarray,
+    batch_size: int = 64,
+    validation_data: Tuple[np.ndarray, np.ndarray] = None,
+    shuffle: bool = True,
+    seed: int = 0,
+    **fit_kwargs,
+):
+    """
+    model.fit on fixed-shape batches. Padding rows have zero weight, so they add nothing to
+    the gradients; Keras still averages the loss over the full batch, so the one padded
+    batch per epoch counts for n_real / batch_size of a full one.
+    :return: History.
+    """
+    train = fixed_shape_dataset(x, y, batch_size, shuffle, seed)
+    if validation_data is not None:
+        validation_data = fixed_shape_dataset(
+            validation_data[0], validation_data[1], batch_size, shuffle=False
+        )
+    return model.fit(train, validation_data=validation_data, **fit_kwargs)
+
+
+def predict_padded(model: keras.Model, x: np.ndarray, batch_size: int = 64, **kwargs) -> np.ndarray:
+    """
+    model.predict on fixed-shape batches, with the padding rows removed.
+    """
+    padded, _, _ = pad_to_batches(np.asarray(x, dtype=np.float32), batch_size)
+    return model.predict(padded, batch_size=batch_size, **kwargs)[: len(x)]
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Multi-seed ensembles of build_model.
+
+EnsembleModel stacks K members into one Keras graph with a shared input, so a single fit
+feeds every batch to all members at once and each member still gets its own loss and
+gradients. Members differ by seed and, optionally, by build_model configuration:
+
+    >>> ens = EnsembleModel(x_train.shape[1:], seeds=range(5), head_size=256, num_heads=4,
+    ...                     ff_dim=4, num_transformer_blocks=4, mlp_units=[128])
+    >>> ens.compile(loss="mean_squared_error", optimizer=keras.optimizers.Adam(1e-4))
+    >>> ens.fit(x_train, y_train, epochs=200, batch_size=64)
+    >>> out = ens.predict_summary(x_test)     # mean, median and (n, K) members
+    >>> backtest_members(out["members"], y_test, idx=idx)
+
+With n_outputs > 1 (see encoder_trading.targets) the members keep every output, (n, K,
+n_outputs), eg. backtest_members(out["members"][:, :, 0], ...) for the first horizon.
+
+train_parallel trains members in separate processes instead, with one process per member.
+Members can also get their own windows there, eg. for different seq_size, which cannot
+share a graph:
+
+    >>> xs, ys = zip(*(to_sequences(s, obs) for s in (10, 20, 40)))
+    >>> members, _ = train_parallel(list(xs), list(ys), seeds=range(3), **build_kwargs)
+    >>> preds = predict_members(members, [to_sequences(s, obs_test)[0] for s in (10, 20, 40)])
+"""
+
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from encoder_trading.models import build_model
+
+
+def _stack_members(preds: Sequence[np.ndarray]) -> np.ndarray:
+    # (n, n_outputs) per member -> (n, K, n_outputs), or (n, K) for single-output members.
+    stacked = np.stack([p.reshape(len(p), -1) for p in preds], axis=1)
+    return stacked[:, :, 0] if stacked.shape[2] == 1 else stacked
+
+
+def _member_kwargs(seeds: Iterable[int], configs: Sequence[Mapping], build_kwargs: Mapping) -> List[Dict]:
+    seeds = None if seeds is None else list(seeds)
+    if configs is None:
+        configs = [{}] * len(seeds)
+    configs = list(configs)
+    if seeds is None:
+        seeds = list(range(len(configs)))
+    if len(seeds) != len(configs):
+        raise ValueError("Need one seed per config.")
+    return [dict(build_kwargs, **config, seed=seed) for seed, config in zip(seeds, configs)]
+
+
+def build_member(input_shape: Tuple[int, int], seed: int, **build_kwargs) -> keras.Model:
+    """
+    build_model with all weights initialized from the given seed. The Python and numpy
+    random states of the caller are restored afterwards; the TensorFlow global seed stays
+    set to seed, as after keras.utils.set_random_seed.
+    """
+    py_state, np_state = random.getstate(), np.random.get_state()
+    try:
+        keras.utils.set_random_seed(seed)
+        return build_model(input_shape, **build_kwargs)
+    finally:
+        random.setstate(py_state)
+        np.random.set_state(np_state)
+
+
+class EnsembleModel:
+    """
+    K build_model members stacked into one multi-output Keras model.
+    """
+
+    def __init__(
+        self,
+        input_shape: Tuple[int, int],
+        seeds: Iterable[int] = (0, 1, 2, 3, 4),
+        configs: Sequence[Mapping] = None,
+        **build_kwargs,
+    ):
+        """
+        :param input_shape: (seq_size, features) of one window.
+        :param seeds: One seed per member.
+        :param configs: Optional per-member overrides of build_kwargs, eg. [{"ff_dim": 4},
+                        {"ff_dim": 8}]. Defaults to the same configuration for all members.
+        :param build_kwargs: build_model arguments shared by all members.
+        """
+        self.member_kwargs = _member_kwargs(seeds, configs, build_kwargs)
+        self.seeds = [kw["seed"] for kw in self.member_kwargs]
+
+        inputs = keras.Input(shape=input_shape)
+        self.members = []
+        outputs = []
+        for k, kwargs in enumerate(self.member_kwargs):
+            kwargs = dict(kwargs)
+            member = build_member(input_shape, kwargs.pop("seed"), **kwargs)
+            member._name = f"member_{k}"
+            self.members.append(member)
+            outputs.append(member(inputs))
+        self.model = keras.Model(inputs, outputs)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def compile(self, loss="mean_squared_error", optimizer=None, **kwargs) -> None:
+        """
+        Compile with the same loss for every member. The total loss is the sum of the member
+        losses, so each member's gradients are the same as when trained alone.
+        """
+        optimizer = optimizer or keras.optimizers.Adam(learning_rate=1e-4)
+        self.model.compile(loss=[loss] * len(self), optimizer=optimizer, **kwargs)
+
+    def fit(self, x, y, validation_data=None, **kwargs):
+        """
+        model.fit with the targets fed to every member.
+
+        NOTE: Callbacks such as EarlyStopping see the summed loss, so members stop together.
+        """
+        if validation_data is not None:
+            x_val, y_val = validation_data[:2]
+            validation_data = (x_val, [y_val] * len(self))
+        return self.model.fit(x, [y] * len(self), validation_data=validation_data, **kwargs)
+
+    def predict(self, x, **kwargs) -> np.ndarray:
+        """
+        :return: (n, K) member predictions, or (n, K, n_outputs) for multi-output members.
+        """
+        preds = self.model.predict(x, **kwargs)
+        if len(self) == 1:
+            preds = [preds]
+        return _stack_members([np.asarray(p) for p in preds])
+
+    def predict_summary(self, x, **kwargs) -> Dict[str, np.ndarray]:
+        """
+        :return: Dict with the "mean" and "median" prediction, shape (n,) or (n, n_outputs),
+                 and the "members" predictions, as predict.
+        """
+        members = self.predict(x, **kwargs)
+        return {"mean": members.mean(axis=1), "median": np.median(members, axis=1), "members": members}
+
+    def save_weights(self, path: str) -> None:
+        self.model.save_weights(path)
+
+    def load_weights(self, path: str) -> None:
+        self.model.load_weights(path)
+
+
+def _train_member(
+    args: Tuple[Tuple[int, int], Dict, np.ndarray, np.ndarray, Dict, Dict, int]
+) -> Tuple[List[np.ndarray], Dict]:
+    input_shape, kwargs, x, y, compile_kwargs, fit_kwargs, threads = args
+    kwargs = dict(kwargs)
+    # Small intra-op thread pools, so members do not fight over cores.
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    model = build_member(input_shape, kwargs.pop("seed"), **kwargs)
+    compile_kwargs = dict(compile_kwargs)
+    compile_kwargs.setdefault("loss", "mean_squared_error")
+    compile_kwargs.setdefault("optimizer", "adam")
+    model.compile(**compile_kwargs)
+    history = model.fit(x, y, verbose=0, **fit_kwargs)
+    return model.get_weights(), history.history
+
+
+def _per_member(values, n: int, name: str) -> List:
+    # One array shared by all members, or a list with one array per member.
+    if isinstance(values, (list, tuple)):
+        if len(values) != n:
+            raise ValueError(f"Need one {name} per member, got {len(values)} for {n} members.")
+        return list(values)
+    return [values] * n
+
+
+def train_parallel(
+    x_train: Union[np.ndarray, Sequence[np.ndarray]],
+    y_train: Union[np.ndarray, Sequence[np.ndarray]],
+    seeds: Iterable[int] = (0, 1, 2, 3, 4),
+    configs: Sequence[Mapping] = None,
+    n_jobs: int = None,
+    compile_kwargs: Mapping = None,
+    fit_kwargs: Mapping = None,
+    threads_per_job: int = 1,
+    **build_kwargs,
+) -> Tuple[List[keras.Model], List[Dict]]:
+    """
+    Train members in separate processes and rebuild them in this one.
+    :param x_train: Training windows, or a list with the windows of each member (eg. for
+                    different seq_size).
+    :param y_train: Training targets, or a list with the targets of each member.
+    :param seeds: One seed per member.
+    :param configs: Optional per-member overrides of build_kwargs.
+    :param n_jobs: Worker processes, defaults to the number of members.
+    :param compile_kwargs: model.compile arguments. The optimizer must be given by name
+                           (eg. "adam"), since optimizer objects do not cross processes.
+    :param fit_kwargs: model.fit arguments, eg. epochs and batch_size. Callbacks must be
+                       picklable.
+    :param threads_per_job: TensorFlow intra-op threads per process.
+    :param build_kwargs: build_model arguments shared by all members.
+    :return: Tuple of (trained members, training histories).
+    """
+    member_kwargs = _member_kwargs(seeds, configs, build_kwargs)
+    xs = _per_member(x_train, len(member_kwargs), "x_train")
+    ys = _per_member(y_train, len(member_kwargs), "y_train")
+    jobs = [
+        (
+            x.shape[1:],
+            kw,
+            x,
+            y,
+            dict(compile_kwargs or {}),
+            dict(fit_kwargs or {}),
+            threads_per_job,
+        )
+        for kw, x, y in zip(member_kwargs, xs, ys)
+    ]
+
+    # TensorFlow is not fork safe once initialized.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_jobs or len(jobs), mp_context=ctx) as pool:
+        outputs = list(pool.map(_train_member, jobs))
+
+    members, histories = [], []
+    for job, kw, (weights, history) in zip(jobs, member_kwargs, outputs):
+        kw = dict(kw)
+        seed = kw.pop("seed")
+        model = build_member(job[0], seed, **kw)
+        model.set_weights(weights)
+        members.append(model)
+        histories.append(history)
+    return members, histories
+
+
+def predict_members(
+    members: Sequence[keras.Model], x: Union[np.ndarray, Sequence[np.ndarray]], **kwargs
+) -> np.ndarray:
+    """
+    Predictions of separately trained members, eg. from train_parallel, as one (n, K) array,
+    or (n, K, n_outputs) for multi-output members. With one x for all members, they are
+    stacked into one graph, so x goes through a single predict call.
+    :param x: Windows, or a list with the windows of each member. to_sequences windows of
+              different seq_size over the same bars end on the same bars, so the
+              predictions are aligned on their last rows and n is the shortest length.
+    """
+    if isinstance(x, (list, tuple)):
+        xs = _per_member(x, len(members), "x")
+        n = min(len(xi) for xi in xs)
+        preds = [np.asarray(m.predict(xi[len(xi) - n :], **kwargs)) for m, xi in zip(members, xs)]
+        return _stack_members(preds)
+
+    inputs = keras.Input(shape=x.shape[1:])
+    outputs = [layers.Reshape((1, -1))(m(inputs)) for m in members]
+    stacked = keras.Model(inputs, layers.Concatenate(axis=1)(outputs) if len(outputs) > 1 else outputs[0])
+    preds = stacked.predict(x, **kwargs)
+    return preds[:, :, 0] if preds.shape[2] == 1 else preds
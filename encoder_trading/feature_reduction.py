@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Incremental PCA for expanding-window feature reduction.
+
+ExpandingTransformer.ipynb fits PCA on the whole feature matrix (so the test period leaks
+into the components) and a walk-forward version has to refit from scratch at every step.
+ExpandingPCA updates an sklearn IncrementalPCA with only the new rows, and projects new
+bars with one (features x components) product:
+
+    >>> pca = ExpandingPCA(n_components=2)
+    >>> for end, comps in pca.walk_forward(X, start=6_000, step=10):
+    ...     ...   # comps: bars end..end+step projected on the basis fitted up to end
+
+The fitted state is saved per data version, so a later run on the same (or an extended)
+history resumes from where the last one stopped instead of decomposing it again.
+"""
+
+import hashlib
+import os
+from typing import Iterator, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import IncrementalPCA
+
+from auction_trading.results_store import data_version
+
+# Fitted IncrementalPCA attributes saved with the state.
+_STATE = (
+    "components_",
+    "mean_",
+    "var_",
+    "singular_values_",
+    "explained_variance_",
+    "explained_variance_ratio_",
+    "noise_variance_",
+)
+
+
+class ExpandingPCA:
+    """
+    IncrementalPCA over a growing history.
+    """
+
+    def __init__(self, n_components: int = 2, columns: Sequence[str] = None):
+        """
+        :param n_components: Number of components.
+        :param columns: Feature columns to use when given DataFrames. Defaults to all.
+        """
+        self.n_components = n_components
+        self.columns = list(columns) if columns is not None else None
+        self.pca = IncrementalPCA(n_components=n_components)
+        self.n_seen = 0
+        self.version = None
+        # Rows held back until there are enough for a partial_fit batch.
+        self._pending = None
+
+    def _values(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            if self.columns is None:
+                self.columns = list(X.columns)
+            X = X[self.columns]
+        return np.asarray(X, dtype=np.float64)
+
+    @property
+    def fitted(self) -> bool:
+        return hasattr(self.pca, "components_")
+
+    @property
+    def n_rows(self) -> int:
+        """
+        Rows added so far: fitted (n_seen) plus those still buffered for the next batch.
+        """
+        return self.n_seen + (len(self._pending) if self._pending is not None else 0)
+
+    def update(self, X: Union[pd.DataFrame, np.ndarray]) -> "ExpandingPCA":
+        """
+        Add rows to the fit. Rows are buffered until there are at least n_components of them,
+        the minimum IncrementalPCA accepts per batch.
+        :param X: New rows, in time order, without NaNs.
+        """
+        X = self._values(X)
+        if self._pending is not None:
+            X = np.concatenate([self._pending, X])
+            self._pending = None
+        if len(X) < self.n_components:
+            self._pending = X if len(X) else None
+            return self
+        self.pca.partial_fit(X)
+        self.n_seen += len(X)
+        return self
+
+    def transform(self, X: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """
+        Project rows on the current components, (X - mean) @ components.T.
+        """
+        if not self.fitted:
+            raise ValueError("ExpandingPCA has not been fitted yet.")
+        return (self._values(X) - self.pca.mean_) @ self.pca.components_.T
+
+    def walk_forward(
+        self, X: Union[pd.DataFrame, np.ndarray], start: int, step: int = 1
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Fit on X[:start], then for each step project the next step rows and add them to the
+        fit. Rows already added (eg. after resume) are not refitted.
+        :param X: Full feature history.
+        :param start: Rows in the first fit. Raised to n_components, the fewest rows a
+                      basis can be fitted on.
+        :param step: Rows projected per step.
+        :return: Iterator of (row, components of rows row..row+step).
+        """
+        start = max(start, self.n_components)
+        if self.n_rows < start:
+            self.update(
+                X[self.n_rows : start] if not isinstance(X, pd.DataFrame) else X.iloc[self.n_rows : start]
+            )
+        rows = self._values(X)
+        for i in range(max(start, self.n_rows), len(rows), step):
+            block = rows[i : i + step]
+            yield i, self.transform(block)
+            self.update(block)
+
+    def fit_transform_expanding(
+        self, X: Union[pd.DataFrame, np.ndarray], start: int, step: int = 1
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Out-of-sample components for rows start.. of X, each projected on the basis fitted on
+        the rows before its step, as one frame.
+        """
+        steps = list(self.walk_forward(X, start, step))
+        # walk_forward may start later than asked, see its start.
+        start = steps[0][0] if steps else len(X)
+        out = np.concatenate([comps for _, comps in steps] or [np.empty((0, self.n_components))])
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame(
+                out,
+                index=X.index[start : start + len(out)],
+                columns=[f"PCA{k + 1}" for k in range(out.shape[1])],
+            )
+        return out
+
+    # -- Persistence -----------------------------------------------------------------------
+
+    def save(self, path: str, X: Union[pd.DataFrame, np.ndarray] = None) -> None:
+        """
+        Save the fitted state.
+        :param path: .npz file.
+        :param X: History the state was fitted on; its first n_rows rows (fitted and
+                  buffered) are hashed so that resume can check the state belongs to the
+                  same data.
+        """
+        if X is not None:
+            self.version = _prefix_version(X, self.n_rows)
+        state = {name: getattr(self.pca, name) for name in _STATE if hasattr(self.pca, name)}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(
+            path,
+            n_components=self.n_components,
+            n_seen=self.n_seen,
+            n_samples_seen_=getattr(self.pca, "n_samples_seen_", 0),
+            columns=np.array(self.columns or [], dtype=str),
+            version=np.array(self.version or ""),
+            pending=self._pending if self._pending is not None else np.empty((0, 0)),
+            **state,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ExpandingPCA":
+        """
+        Load a state written by save.
+        """
+        with np.load(path) as f:
+            columns = [str(c) for c in f["columns"]] or None
+            obj = cls(int(f["n_components"]), columns)
+            obj.n_seen = int(f["n_seen"])
+            obj.version = str(f["version"]) or None
+            if "pending" in f and len(f["pending"]):
+                obj._pending = f["pending"]
+            if "components_" in f:
+                for name in _STATE:
+                    value = f[name]
+                    setattr(obj.pca, name, value if value.ndim else value.item())
+                obj.pca.n_samples_seen_ = int(f["n_samples_seen_"])
+                obj.pca.n_components_ = obj.pca.components_.shape[0]
+                obj.pca.n_features_in_ = obj.pca.components_.shape[1]
+        return obj
+
+
+def _prefix_version(X: Union[pd.DataFrame, np.ndarray], n: int) -> str:
+    prefix = X.iloc[:n] if isinstance(X, pd.DataFrame) else pd.DataFrame(np.asarray(X)[:n])
+    return data_version(prefix)
+
+
+def cached_pca(
+    X: Union[pd.DataFrame, np.ndarray],
+    cache_dir: str,
+    name: str,
+    n_components: int = 2,
+    columns: Sequence[str] = None,
+    upto: int = None,
+) -> ExpandingPCA:
+    """
+    ExpandingPCA fitted on X[:upto], resumed from the cache when the cached state was fitted
+    on a prefix of the same data, then saved back.
+    :param X: Feature history.
+    :param cache_dir: Directory of saved states.
+    :param name: Cache name, eg. the contract ("tufv").
+    :param n_components: Number of components.
+    :param columns: Feature columns.
+    :param upto: Rows to fit, defaults to all.
+    :return: Fitted ExpandingPCA.
+    """
+    upto = len(X) if upto is None else upto
+    if columns is None and isinstance(X, pd.DataFrame):
+        columns = list(X.columns)
+    # States fitted on different feature columns are cached separately.
+    features = hashlib.sha1(repr([str(c) for c in columns or []]).encode()).hexdigest()[:8]
+    path = os.path.join(cache_dir, f"pca_{name}_{n_components}_{features}.npz")
+    pca = None
+    if os.path.exists(path):
+        cached = ExpandingPCA.load(path)
+        if (
+            cached.n_rows <= upto
+            and cached.columns == ([str(c) for c in columns] if columns is not None else None)
+            and cached.version == _prefix_version(X, cached.n_rows)
+        ):
+            pca = cached
+    if pca is None:
+        pca = ExpandingPCA(n_components, columns)
+    if pca.n_rows < upto:
+        pca.update(X.iloc[pca.n_rows : upto] if isinstance(X, pd.DataFrame) else X[pca.n_rows : upto])
+    pca.save(path, X)
+    return pca
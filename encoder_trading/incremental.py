@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Sliding-window inference for models from build_model.
+
+Consecutive to_sequences windows share all but one timestep. The first encoder block starts
+with a LayerNormalization and the query/key/value projections of its MultiHeadAttention,
+which act on each timestep separately, so for a given bar they are the same in every window
+that contains it. IncrementalEncoder computes them once per bar and caches them. Each window
+then only runs the attention itself, from the cached projections, and the rest of the model.
+
+Everything after the first attention layer (residual, feed-forward Conv1Ds and later blocks)
+depends on the whole window through the attention output, so it cannot be reused between
+windows and is recomputed. Predictions match model.predict up to float32 rounding (~1e-7),
+since the projections are computed in different batch shapes.
+
+The scoring runs in tf.functions traced once for the window length, and the cache lives in
+numpy buffers that grow by doubling. In live use, extend(bar) only stores the bar and
+predict_last projects it and scores the last window in a single traced call, so the work
+per bar does not grow with the history.
+
+    >>> enc = IncrementalEncoder(model)
+    >>> enc.extend(features)          # (bars, features), eg. obs.iloc[:, 0:].values
+    >>> preds = enc.predict()         # same as model.predict(to_sequences(...)[0])
+    >>> enc.extend(new_bar)           # live: one new bar
+    >>> enc.predict_last()
+"""
+
+from typing import Union
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+
+class IncrementalEncoder:
+    """
+    Caches the per-bar projections of the first attention block of a build_model model.
+    """
+
+    def __init__(self, model: keras.Model, batch_size: int = 256):
+        """
+        :param model: Model from build_model (or any functional model whose first
+                      MultiHeadAttention is fed by a LayerNormalization of the input).
+        :param batch_size: Windows per batch in predict.
+        """
+        attention = [l for l in model.layers if isinstance(l, keras.layers.MultiHeadAttention)]
+        if not attention:
+            raise ValueError("Model has no MultiHeadAttention layer.")
+        self.mha = attention[0]
+        norm = self.mha._inbound_nodes[0].inbound_layers
+        norm = norm[0] if isinstance(norm, (list, tuple)) else norm
+        if not isinstance(norm, keras.layers.LayerNormalization):
+            raise ValueError("The first attention layer must be fed by a LayerNormalization.")
+        self.norm = norm
+        self.model = model
+        self.seq_size = model.input_shape[1]
+        self.batch_size = batch_size
+
+        # The rest of the model, from the raw window and the first attention output.
+        self.tail = keras.Model([model.input, self.mha.output], model.output)
+
+        # Traced once each, with the window length fixed and the bar and batch counts free,
+        # so neither a new bar nor a growing cache retraces them.
+        n_features = model.input_shape[2]
+        rows = tf.TensorSpec((None, n_features), tf.float32)
+        cache = tf.TensorSpec((None, None, None), tf.float32)
+        idx = tf.TensorSpec((None, self.seq_size), tf.int64)
+        self._project = tf.function(self._project_rows, input_signature=[rows])
+        self._score = tf.function(self._windows, input_signature=[cache, cache, cache, rows, idx])
+        self._live = tf.function(self._last_window, input_signature=[rows, cache, cache, cache, rows])
+
+        # Bars are stored in buffers that grow by doubling, so extend() by one bar does
+        # not copy the whole cache.
+        self._n = 0
+        self._features = np.empty((0, n_features), dtype=np.float32)
+        self._q = self._k = self._v = None
+        # Live bars not projected yet: predict_last projects them in the same call.
+        self._pending = 0
+
+    @property
+    def features(self) -> np.ndarray:
+        """
+        (bars, features) of the cached bars.
+        """
+        return self._features[: self._n]
+
+    def reset(self) -> None:
+        """
+        Drop all cached bars.
+        """
+        self._n = self._pending = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _project_rows(self, rows):
+        x = self.norm(rows[None, :, :], training=False)
+        return self.mha._query_dense(x)[0], self.mha._key_dense(x)[0], self.mha._value_dense(x)[0]
+
+    def _reserve(self, n: int) -> None:
+        if n <= len(self._features) and self._q is not None:
+            return
+        capacity = max(n, 2 * len(self._features), self.seq_size)
+
+        def grow(buf: np.ndarray) -> np.ndarray:
+            out = np.empty((capacity,) + buf.shape[1:], dtype=np.float32)
+            out[: self._n] = buf[: self._n]
+            return out
+
+        self._features = grow(self._features)
+        if self._q is not None:
+            self._q, self._k, self._v = grow(self._q), grow(self._k), grow(self._v)
+
+    def _store(self, lo: int, q: np.ndarray, k: np.ndarray, v: np.ndarray) -> None:
+        if self._q is None:
+            shape = (len(self._features),) + q.shape[1:]
+            self._q, self._k, self._v = (np.empty(shape, dtype=np.float32) for _ in range(3))
+        end = lo + len(q)
+        self._q[lo:end], self._k[lo:end], self._v[lo:end] = q, k, v
+
+    def _flush(self) -> None:
+        # Project the pending live bars.
+        if self._pending:
+            lo = self._n - self._pending
+            q, k, v = (t.numpy() for t in self._project(tf.constant(self._features[lo : self._n])))
+            self._store(lo, q, k, v)
+            self._pending = 0
+
+    def extend(self, rows: Union[np.ndarray, list]) -> None:
+        """
+        Append bars and project only the new ones. Fewer than seq_size bars (eg. one live
+        bar) are projected lazily, by the next predict_last or predict.
+        :param rows: (bars, features) array, or a single (features,) bar.
+        """
+        rows = np.asarray(rows, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        self._reserve(self._n + len(rows))
+        self._features[self._n : self._n + len(rows)] = rows
+        self._n += len(rows)
+        self._pending += len(rows)
+        if self._pending >= self.seq_size or self._q is None:
+            self._flush()
+
+    def _windows(self, q, k, v, features, idx):
+        # Attention of each window from the cached projections, then the rest of the model.
+        attn, _ = self.mha._compute_attention(
+            tf.gather(q, idx), tf.gather(k, idx), tf.gather(v, idx), None, False
+        )
+        attn = self.mha._output_dense(attn)
+        return self.tail([tf.gather(features, idx), attn], training=False)
+
+    def _last_window(self, rows, q, k, v, features):
+        # Project the pending rows and score the window of the cached bars followed by them.
+        q_new, k_new, v_new = self._project_rows(rows)
+        q, k, v = tf.concat([q, q_new], 0), tf.concat([k, k_new], 0), tf.concat([v, v_new], 0)
+        idx = tf.range(self.seq_size, dtype=tf.int64)[None, :]
+        return self._windows(q, k, v, tf.concat([features, rows], 0), idx), q_new, k_new, v_new
+
+    def _predict_starts(self, starts: np.ndarray, lo: int = 0) -> np.ndarray:
+        # Only bars lo.. are converted to tensors; starts are relative to the full cache.
+        self._flush()
+        n = self._n
+        q, k, v, features = (tf.constant(a[lo:n]) for a in (self._q, self._k, self._v, self._features))
+        offsets = np.arange(self.seq_size, dtype=np.int64)
+        preds = []
+        for b in range(0, len(starts), self.batch_size):
+            idx = tf.constant(starts[b : b + self.batch_size, None] - lo + offsets)
+            preds.append(self._score(q, k, v, features, idx).numpy())
+        if not preds:
+            return np.empty((0,) + self.model.output_shape[1:], dtype=np.float32)
+        return np.concatenate(preds)
+
+    def predict(self, start: int = 0, stop: int = None, include_last: bool = False) -> np.ndarray:
+        """
+        Predictions for the windows starting at bars start..stop-1, in to_sequences order.
+        :param start: First window.
+        :param stop: End of the windows, defaults to the last window with a target, as in
+                     to_sequences (len - seq_size).
+        :param include_last: Also score the final window, which has no target yet.
+        :return: Array shaped like model.predict output.
+        """
+        last = len(self) - self.seq_size + (1 if include_last else 0)
+        stop = last if stop is None else min(stop, last)
+        if stop <= start:
+            return self._predict_starts(np.empty(0, dtype=np.int64))
+        return self._predict_starts(np.arange(start, stop, dtype=np.int64), lo=start)
+
+    def predict_last(self) -> np.ndarray:
+        """
+        Prediction for the latest full window, eg. after extend() with a live bar. Only that
+        window's seq_size bars go to the traced scoring function.
+        """
+        if len(self) < self.seq_size:
+            raise ValueError(f"Need {self.seq_size} bars, have {len(self)}.")
+        start = len(self) - self.seq_size
+        if not self._pending:
+            return self._predict_starts(np.array([start], dtype=np.int64), lo=start)[0]
+
+        # One traced call projects the new bars and scores the window.
+        mid = self._n - self._pending
+        pred, q, k, v = self._live(
+            tf.constant(self._features[mid : self._n]),
+            tf.constant(self._q[start:mid]),
+            tf.constant(self._k[start:mid]),
+            tf.constant(self._v[start:mid]),
+            tf.constant(self._features[start:mid]),
+        )
+        self._store(mid, q.numpy(), k.numpy(), v.numpy())
+        self._pending = 0
+        return pred.numpy()[0]
+
+    def trim(self, keep: int = None) -> None:
+        """
+        Drop old bars from the cache, keeping the last keep bars (default one window), to
+        bound memory in live use. Window numbering restarts at the first kept bar.
+        """
+        keep = self.seq_size if keep is None else max(keep, self.seq_size)
+        self._flush()
+        if len(self) > keep:
+            lo = self._n - keep
+            self._features = self._features[lo : self._n].copy()
+            self._q, self._k, self._v = (a[lo : self._n].copy() for a in (self._q, self._k, self._v))
+            self._n = keep
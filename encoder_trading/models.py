@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+from typing import Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+
+@keras.utils.register_keras_serializable(package="encoder_trading")
+class LocalAttention(layers.Layer):
+    """
+    Chunked self-attention with optional global summary tokens, linear in seq_size.
+
+    The window is split into chunks of `window` bars (the last chunk is padded). Each bar
+    attends to the bars of its own chunk, of the previous chunk and to num_global learned
+    summary tokens; the summary tokens first attend to the whole window. Attention scores are
+    (seq_size, 2 * window + num_global) instead of (seq_size, seq_size) for the dense block,
+    plus (num_global, seq_size) for the summary tokens.
+    """
+
+    def __init__(
+        self, head_size: int, num_heads: int, window: int, num_global: int = 0, dropout: float = 0, **kwargs
+    ):
+        """
+        :param head_size: Key dimension of each attention head.
+        :param num_heads: Number of attention heads.
+        :param window: Bars per chunk.
+        :param num_global: Number of global summary tokens, 0 for purely local attention.
+        :param dropout: Dropout rate on the attention weights.
+        """
+        super().__init__(**kwargs)
+        self.head_size = head_size
+        self.num_heads = num_heads
+        self.window = window
+        self.num_global = num_global
+        self.dropout = dropout
+
+    def build(self, input_shape):
+        seq_size, n_features = int(input_shape[1]), int(input_shape[2])
+        w, g = self.window, self.num_global
+        self.seq_size = seq_size
+        self.n_chunks = -(-seq_size // w)
+
+        # Valid keys of each chunk: previous chunk, own chunk, then the summary tokens. The
+        # sequence is padded with one chunk in front (lookback of the first chunk) and up to
+        # a full chunk at the end.
+        valid = np.zeros((self.n_chunks + 1) * w, dtype=bool)
+        valid[w : w + seq_size] = True
+        chunks = valid.reshape(self.n_chunks + 1, w)
+        keys = np.concatenate([chunks[:-1], chunks[1:], np.ones((self.n_chunks, g), dtype=bool)], axis=1)
+        self.key_mask = np.repeat(keys[:, None, :], w, axis=1)
+
+        self.local_attention = layers.MultiHeadAttention(
+            key_dim=self.head_size, num_heads=self.num_heads, dropout=self.dropout, dtype=self.dtype_policy
+        )
+        if g:
+            self.global_tokens = self.add_weight(
+                name="global_tokens", shape=(g, n_features), initializer="random_normal", trainable=True
+            )
+            self.global_attention = layers.MultiHeadAttention(
+                key_dim=self.head_size,
+                num_heads=self.num_heads,
+                dropout=self.dropout,
+                dtype=self.dtype_policy,
+            )
+        super().build(input_shape)
+
+    def call(self, inputs, training=None):
+        w, n, g = self.window, self.n_chunks, self.num_global
+        n_features = inputs.shape[-1]
+        batch = tf.shape(inputs)[0]
+
+        padded = tf.pad(inputs, [[0, 0], [w, n * w - self.seq_size], [0, 0]])
+        chunks = tf.reshape(padded, (batch, n + 1, w, n_features))
+        query = chunks[:, 1:]
+        keys = tf.concat([chunks[:, :-1], chunks[:, 1:]], axis=2)
+
+        if g:
+            tokens = tf.cast(self.global_tokens, inputs.dtype)
+            tokens = tf.broadcast_to(tokens[None], (batch, g, n_features))
+            tokens = self.global_attention(tokens, inputs, training=training)
+            keys = tf.concat([keys, tf.broadcast_to(tokens[:, None], (batch, n, g, n_features))], axis=2)
+
+        mask = tf.broadcast_to(tf.constant(self.key_mask)[None], (batch, n, w, 2 * w + g))
+        out = self.local_attention(
+            tf.reshape(query, (batch * n, w, n_features)),
+            tf.reshape(keys, (batch * n, 2 * w + g, n_features)),
+            attention_mask=tf.reshape(mask, (batch * n, w, 2 * w + g)),
+            training=training,
+        )
+        return tf.reshape(out, (batch, n * w, n_features))[:, : self.seq_size]
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            head_size=self.head_size,
+            num_heads=self.num_heads,
+            window=self.window,
+            num_global=self.num_global,
+            dropout=self.dropout,
+        )
+        return config
+
+
+def transformer_encoder(
+    inputs,
+    head_size: int,
+    num_heads: int,
+    ff_dim: int,
+    dropout: float = 0,
+    attention: str = "dense",
+    window: int = 16,
+    num_global: int = 0,
+):
+    """
+    Single pre-norm transformer encoder block, as used in the Encoder_Trader notebooks.
+    :param inputs: Tensor of shape (batch, seq_size, features).
+    :param head_size: Key dimension of each attention head.
+    :param num_heads: Number of attention heads.
+    :param ff_dim: Number of filters in the pointwise feed-forward layer.
+    :param dropout: Dropout rate.
+    :param attention: "dense" for full MultiHeadAttention, "local" for LocalAttention.
+    :param window: Chunk size of the local attention.
+    :param num_global: Global summary tokens of the local attention.
+    :return: Tensor with the same shape as inputs.
+    """
+    # Normalization and Attention
+    x = layers.LayerNormalization(epsilon=1e-6)(inputs)
+    if attention == "dense":
+        x = layers.MultiHeadAttention(key_dim=head_size, num_heads=num_heads, dropout=dropout)(x, x)
+    elif attention == "local":
+        x = LocalAttention(head_size, num_heads, window, num_global, dropout)(x)
+    else:
+        raise ValueError(f"Unknown attention {attention!r}, expected 'dense' or 'local'.")
+    x = layers.Dropout(dropout)(x)
+    res = x + inputs
+
+    # Feed Forward Part
+    x = layers.LayerNormalization(epsilon=1e-6)(res)
+    x = layers.Conv1D(filters=ff_dim, kernel_size=1, activation="relu")(x)
+    x = layers.Dropout(dropout)(x)
+    x = layers.Conv1D(filters=inputs.shape[-1], kernel_size=1)(x)
+    return x + res
+
+
+def build_model(
+    input_shape: Tuple[int, int],
+    head_size: int,
+    num_heads: int,
+    ff_dim: int,
+    num_transformer_blocks: int,
+    mlp_units: Sequence[int],
+    dropout: float = 0,
+    mlp_dropout: float = 0,
+    attention: str = "dense",
+    window: int = 16,
+    num_global: int = 0,
+    n_outputs: int = 1,
+) -> keras.Model:
+    """
+    Build the encoder-only regression model used by the Encoder_Trader notebooks.
+    :param input_shape: (seq_size, features) shape of a single input window.
+    :param head_size: Key dimension of each attention head.
+    :param num_heads: Number of attention heads.
+    :param ff_dim: Number of filters in the pointwise feed-forward layer.
+    :param num_transformer_blocks: Number of stacked encoder blocks.
+    :param mlp_units: Hidden units of the MLP head.
+    :param dropout: Dropout rate inside the encoder blocks.
+    :param mlp_dropout: Dropout rate inside the MLP head.
+    :param attention: "dense" (full attention, cost quadratic in seq_size) or "local"
+                      (LocalAttention, linear in seq_size, for long windows).
+    :param window: Chunk size of the local attention.
+    :param num_global: Global summary tokens of the local attention.
+    :param n_outputs: Linear outputs of the head, eg. one per horizon of
+                      encoder_trading.targets.make_targets.
+    :return: Uncompiled Keras model with n_outputs linear outputs.
+    """
+    inputs = keras.Input(shape=input_shape)
+    x = inputs
+    if keras.mixed_precision.global_policy().compute_dtype != inputs.dtype:
+        # Mixed precision: cast once so the residual adds see a single dtype.
+        x = layers.Activation("linear")(inputs)
+    for _ in range(num_transformer_blocks):
+        x = transformer_encoder(x, head_size, num_heads, ff_dim, dropout, attention, window, num_global)
+
+    x = layers.GlobalAveragePooling1D(data_format="channels_first")(x)
+    for dim in mlp_units:
+        x = layers.Dense(dim, activation="relu")(x)
+        x = layers.Dropout(mlp_dropout)(x)
+    outputs = layers.Dense(n_outputs)(x)
+    return keras.Model(inputs, outputs)
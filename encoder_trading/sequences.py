@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def to_sequences(seq_size: int, obs: pd.DataFrame, target_col_idx: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Key function to turn a list of features into a list of sequences that can then be fed
+    into a transformer.
+    :param seq_size: Number of periods in each input window.
+    :param obs: DataFrame of features, with the target in column target_col_idx.
+    :param target_col_idx: Index of the target column. Columns from this index onwards are
+                           used as features.
+    :return: Tuple of (windows, targets) with shapes (n, seq_size, features) and (n,).
+    """
+    x = []
+    y = []
+    for i in range(len(obs) - seq_size):
+        window = obs.iloc[i : (i + seq_size), target_col_idx:].values
+        after_window = obs.iloc[i + seq_size, target_col_idx]
+        window = [[x] for x in window]
+        x.append(window)
+        y.append(after_window)
+
+    x_train = np.array(x)
+    y_train = np.array(y)
+    x_train = x_train.reshape((x_train.shape[0], x_train.shape[1], x_train.shape[3]))
+
+    return x_train, y_train
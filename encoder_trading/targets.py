@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Multi-horizon targets for the encoder models.
+
+GetTechnicals builds one target, fut = close.shift(-1) - close. make_targets builds the
+1..H bar forward changes close[t + h] - close[t] ("fut_h") and their signs ("dir_h") for one
+or many tickers in a single pass over a (bars, tickers, H + 1) sliding-window view of the
+closes. fut_1 is the notebook's fut.
+
+A target is NaN when bar t + h is past the end of the data, when either close is NaN, or
+when t and t + h are in different segments. Segments are given by session labels (eg. the
+trading day, for intraday-only targets) and/or split wherever two consecutive bars are more
+than max_gap apart (missing data, weekends).
+
+    >>> targets = make_targets(closes, horizons=5, max_gap=pd.Timedelta("4h"))
+    >>> y = sequence_targets(targets["ty"].filter(like="fut_"), seq_size=10)
+    >>> # Without sessions / max_gap, the same targets as the notebook windows of the same
+    >>> # bars, whose obs has fut in column 0:
+    >>> y1 = sequence_targets(make_targets(closes["ty"])["fut_1"], seq_size=10)
+    >>> assert np.allclose(y1[:, 0], to_sequences(10, obs)[1], equal_nan=True)
+    >>> model = build_model(x.shape[1:], ..., n_outputs=y.shape[1])
+    >>> model.compile(loss=masked_mse, optimizer=keras.optimizers.Adam(1e-4))
+"""
+
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+
+def _horizons(horizons: Union[int, Sequence[int]]) -> np.ndarray:
+    horizons = np.arange(1, horizons + 1) if np.isscalar(horizons) else np.asarray(horizons, dtype=np.int64)
+    if horizons.size == 0 or horizons.min() < 1:
+        raise ValueError("Horizons must be positive bar counts.")
+    return np.unique(horizons)
+
+
+def segment_ids(index: pd.Index, sessions: Sequence = None, max_gap: pd.Timedelta = None) -> np.ndarray:
+    """
+    Segment number of every bar: a new segment starts when the session label changes or when
+    the gap to the previous bar exceeds max_gap.
+    :param index: DatetimeIndex of the bars, sorted.
+    :param sessions: Optional session label per bar, eg. index.normalize().
+    :param max_gap: Optional largest gap between two bars of the same segment.
+    :return: int64 array of segment numbers, non-decreasing.
+    """
+    new = np.zeros(len(index), dtype=bool)
+    if sessions is not None:
+        sessions = np.asarray(sessions)
+        if len(sessions) != len(index):
+            raise ValueError("sessions must have one label per bar.")
+        new[1:] |= sessions[1:] != sessions[:-1]
+    if max_gap is not None:
+        ns = np.asarray(pd.DatetimeIndex(index).asi8)
+        new[1:] |= np.diff(ns) > pd.Timedelta(max_gap).value
+    return np.cumsum(new)
+
+
+def forward_returns(
+    close: Union[pd.Series, pd.DataFrame],
+    horizons: Union[int, Sequence[int]] = 5,
+    sessions: Sequence = None,
+    max_gap: pd.Timedelta = None,
+) -> pd.DataFrame:
+    """
+    Forward changes close[t + h] - close[t] for every horizon h.
+    :param close: Closes, a Series or a DataFrame with one column per ticker, on a shared
+                  sorted DatetimeIndex.
+    :param horizons: H for horizons 1..H, or an explicit list of horizons.
+    :param sessions: Session label per bar, targets do not cross sessions.
+    :param max_gap: Targets do not cross gaps between bars longer than this.
+    :return: DataFrame of fut_h columns; for a DataFrame input the columns are
+             (ticker, fut_h).
+    """
+    horizons = _horizons(horizons)
+    frame = close.to_frame() if isinstance(close, pd.Series) else close
+    values = frame.to_numpy(dtype=np.float64)
+    n_bars, h_max = len(values), int(horizons[-1])
+
+    # (bars, tickers, h_max + 1) view: window t holds the closes of bars t..t + h_max.
+    padded = np.concatenate([values, np.full((h_max, values.shape[1]), np.nan)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, h_max + 1, axis=0)
+    fwd = windows[:, :, horizons] - windows[:, :, :1]
+
+    if sessions is not None or max_gap is not None:
+        seg = segment_ids(frame.index, sessions, max_gap)
+        seg = np.concatenate([seg, np.full(h_max, -1)])
+        seg_windows = np.lib.stride_tricks.sliding_window_view(seg, h_max + 1)
+        crosses = seg_windows[:, horizons] != seg_windows[:, :1]
+        fwd = np.where(crosses[:, None, :], np.nan, fwd)
+
+    names = [f"fut_{h}" for h in horizons]
+    if isinstance(close, pd.Series):
+        return pd.DataFrame(fwd[:, 0, :], index=close.index, columns=names)
+    columns = pd.MultiIndex.from_product([frame.columns, names])
+    return pd.DataFrame(fwd.reshape(n_bars, -1), index=frame.index, columns=columns)
+
+
+def direction_labels(returns: pd.DataFrame, threshold: float = 0.0) -> pd.DataFrame:
+    """
+    Direction of forward returns: 1 up, -1 down, 0 within +/- threshold, NaN where the
+    return is NaN. Columns fut_h are renamed dir_h.
+    """
+    values = returns.to_numpy(dtype=np.float64)
+    labels = np.where(values > threshold, 1.0, np.where(values < -threshold, -1.0, 0.0))
+    labels[np.isnan(values)] = np.nan
+
+    def rename(name: str) -> str:
+        return name.replace("fut_", "dir_", 1)
+
+    if isinstance(returns.columns, pd.MultiIndex):
+        columns = pd.MultiIndex.from_tuples([(t, rename(c)) for t, c in returns.columns])
+    else:
+        columns = [rename(c) for c in returns.columns]
+    return pd.DataFrame(labels, index=returns.index, columns=columns)
+
+
+def make_targets(
+    close: Union[pd.Series, pd.DataFrame],
+    horizons: Union[int, Sequence[int]] = 5,
+    sessions: Sequence = None,
+    max_gap: pd.Timedelta = None,
+    threshold: float = 0.0,
+) -> pd.DataFrame:
+    """
+    Forward returns (fut_h) and direction labels (dir_h) for all tickers and horizons.
+    :param threshold: Dead band of the direction labels, in price units.
+    :return: DataFrame with the fut_h then the dir_h columns (per ticker for a DataFrame
+             input, as (ticker, name) columns).
+    """
+    fwd = forward_returns(close, horizons, sessions, max_gap)
+    out = pd.concat([fwd, direction_labels(fwd, threshold)], axis=1)
+    if isinstance(out.columns, pd.MultiIndex):
+        out = out[list(dict.fromkeys(out.columns.get_level_values(0)))]
+    return out
+
+
+def sequence_targets(targets: Union[pd.DataFrame, np.ndarray], seq_size: int) -> np.ndarray:
+    """
+    Targets aligned with the to_sequences(seq_size, ...) windows of the same bars: window i
+    covers bars i..i + seq_size - 1 and its target is that of bar i + seq_size, as the y of
+    to_sequences (obs.iloc[i + seq_size, target_col_idx]). The targets of bars inside the
+    window are never used, since with fut in obs they are also features of the window.
+    :param targets: (bars, outputs) targets from make_targets / forward_returns.
+    :param seq_size: Window length used with to_sequences.
+    :return: (bars - seq_size, outputs) float32 array, NaN where a target is masked.
+    """
+    values = np.asarray(targets, dtype=np.float32)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values[seq_size:]
+
+
+def masked_mse(y_true: tf.Tensor, y_pred: tf.Tensor) -> tf.Tensor:
+    """
+    Mean squared error over the non-NaN targets of each sample, so windows near the end of
+    the data or a session gap still train the horizons that are available. Samples with no
+    valid target contribute 0.
+    """
+    y_true = tf.cast(y_true, y_pred.dtype)
+    valid = tf.math.logical_not(tf.math.is_nan(y_true))
+    sq = tf.where(valid, tf.square(tf.where(valid, y_true, 0.0) - y_pred), 0.0)
+    n_valid = tf.reduce_sum(tf.cast(valid, y_pred.dtype), axis=-1)
+    return tf.math.divide_no_nan(tf.reduce_sum(sq, axis=-1), n_valid)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+from typing import List, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from auction_trading.instrumentation import count, profile_job, timer
+
+
+def run_stepped_inc(
+    model,
+    x_test: np.ndarray,
+    y_test: np.ndarray,
+    step_size: int,
+    stop_at: int = None,
+    callbacks: List[keras.callbacks.Callback] = None,
+    **model_kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Incrementally retrain the model and make predictions. Each step predicts the next
+    step_size windows and then fits the model on them.
+
+    NOTE: Only use this function on models that do not reset parameters upon being .fit(),
+          eg. Tensorflow/Pytorch models. For sklearn and XGBoost, the parameters are reset
+          when the model is retrained, so use run_stepped_retrain instead.
+
+    :param model: Trained model.
+    :param x_test: Test windows.
+    :param y_test: Test targets.
+    :param step_size: Number of windows per step.
+    :param stop_at: Stop after this many windows. Defaults to all of them.
+    :param callbacks: Callbacks for model.fit. Defaults to early stopping.
+    :param model_kwargs: Keyword arguments for model.fit.
+    :return: Tuple of (predictions, targets).
+    """
+    if callbacks is None:
+        callbacks = [keras.callbacks.EarlyStopping(patience=10, restore_best_weights=True)]
+
+    stop_at = len(x_test) if stop_at is None else stop_at
+    x_test = x_test[:stop_at]
+    y_test = y_test[:stop_at]
+    preds = []
+
+    with profile_job("run_stepped_inc"):
+        for i in range(0, stop_at, step_size):
+            # Check if we reached end of data.
+            if i + step_size >= stop_at:
+                x_step = x_test[i:]
+                y_step = y_test[i:]
+            else:
+                x_step = x_test[i : i + step_size]
+                y_step = y_test[i : i + step_size]
+
+            # Predict the data.
+            with timer("model.predict"):
+                pred = model.predict(x_step)
+
+            # Append to output list.
+            try:
+                preds += pred[:, 0].tolist()
+            except:
+                preds += pred.tolist()
+
+            # Re-fit the model.
+            with timer("model.fit"):
+                try:
+                    with tf.device("/device:GPU:0"):
+                        model.fit(x_step, y_step, callbacks=callbacks, **model_kwargs)
+                except:
+                    model.fit(x_step, y_step)
+            count("walk_forward_steps")
+
+    # At the end, return x/y
+    preds_np = np.array(preds)
+    return preds_np, y_test[:stop_at]
+
+
+def run_stepped_retrain(
+    model,
+    x_all: np.ndarray,
+    y_all: np.ndarray,
+    step_size: int,
+    start_at: Union[int, float] = 0.8,
+    **model_kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrain the entire model and make predictions. Because we have to retrain the entire
+    model, a baseline training/test split is given as start_at, either a row number or a
+    fraction between 0 and 1.
+
+    NOTE: Use this function for Sklearn and XGBoost models. It will work on Tensorflow models
+          but will increase runtime drastically to no real benefit in terms of predictions,
+          and, in fact will likely lead to overfitting.
+
+    :param model: Untrained model with fit/predict.
+    :param x_all: All windows (or feature rows).
+    :param y_all: All targets.
+    :param step_size: Number of rows per step.
+    :param start_at: Initial training size, as a row number or fraction.
+    :param model_kwargs: Keyword arguments for model.fit.
+    :return: Tuple of (predictions, targets) for the test period.
+    """
+    start_at = int(len(x_all) * start_at) if start_at % 1 != 0 else int(start_at)
+
+    # Define initial train/test split.
+    x_train = x_all[:start_at]
+    y_train = y_all[:start_at]
+    x_test = x_all[start_at:]
+    y_test = y_all[start_at:]
+
+    preds = []
+    stop = len(x_test)
+
+    with profile_job("run_stepped_retrain"):
+        # Fit the model on training data.
+        with timer("model.fit"):
+            model.fit(x_train, y_train)
+
+        for i in range(0, stop, step_size):
+            # Iterate through data, and slice the test data accordingly.
+            if i + step_size >= stop:
+                x_step = x_test[i:]
+            else:
+                x_step = x_test[i : i + step_size]
+
+            # Incremental training.
+            x_step_train = x_test[: i + step_size]
+            y_step_train = y_test[: i + step_size]
+
+            # Prediction.
+            with timer("model.predict"):
+                pred = model.predict(x_step)
+
+            # Try/catch to deal with different classes of models producing
+            # different output formats.
+            try:
+                preds += pred[:, 0].tolist()
+            except:
+                preds += pred.tolist()
+
+            # Re-train entire model. Again, try to run on GPU incase
+            # it's possible, but otherwise default to CPU.
+            with timer("model.fit"):
+                try:
+                    with tf.device("/device:GPU:0"):
+                        model.fit(x_step_train, y_step_train, **model_kwargs)
+                except:
+                    model.fit(x_step_train, y_step_train)
+            count("walk_forward_steps")
+
+    return np.array(preds), y_test
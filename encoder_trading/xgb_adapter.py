@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ------------------------------------
+# ----Project Lab: Manteio Capital----
+# Authors: Tobias Rodriguez del Pozo
+#          Sean Lin
+# Date: 2022-03-16
+# ------------------------------------
+
+"""
+Walk-forward XGBoost on one quantized matrix.
+
+run_stepped_retrain refits XGBRegressor on the whole history at every step, which rebuilds
+the quantile sketch and the quantized matrix each time. XGBWalkForward quantizes the full
+feature history once, as a QuantileDMatrix whose bin edges come from the initial training
+rows only (ref=), so no future data leaks into the bins. Each expanding window is then
+selected with sample weights (0 for rows after the window end), and each step either
+retrains from scratch or continues boosting the previous step's booster with a few more
+trees:
+
+    >>> wf = XGBWalkForward(params={"max_depth": 6, "eta": 0.1}, num_boost_round=200,
+    ...                     continue_rounds=10)
+    >>> preds, y_test = wf.run(x_all, y_all, step_size=10, start_at=0.8)
+
+NOTE: Unlike run_stepped_retrain, which refits on the test rows seen so far only, every step
+      here trains on all rows up to the end of the step (initial training rows included).
+"""
+
+import os
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import xgboost as xgb
+
+from auction_trading.instrumentation import count, profile_job, timer
+
+# XGBRFRegressor equivalent, for random forests on the same matrix.
+RF_PARAMS = {
+    "learning_rate": 1.0,
+    "subsample": 0.8,
+    "colsample_bynode": 0.8,
+    "num_parallel_tree": 100,
+    "reg_lambda": 1e-5,
+}
+
+
+class XGBWalkForward:
+    """
+    Expanding-window XGBoost training and prediction on a cached QuantileDMatrix.
+    """
+
+    def __init__(
+        self,
+        params: Dict = None,
+        num_boost_round: int = 100,
+        continue_rounds: int = None,
+        nthread: int = None,
+        max_bin: int = 256,
+    ):
+        """
+        :param params: Booster parameters, eg. {"max_depth": 6, "eta": 0.3}. Use RF_PARAMS
+                       with num_boost_round=1 for a random forest.
+        :param num_boost_round: Trees of the initial fit, and of every refit from scratch.
+        :param continue_rounds: If given, each step adds this many trees to the previous
+                                booster instead of refitting from scratch.
+        :param nthread: Threads, defaults to all cores of the host.
+        :param max_bin: Histogram bins per feature.
+        """
+        self.nthread = nthread or os.cpu_count()
+        self.params = {"objective": "reg:squarederror", **(params or {})}
+        self.params.update(tree_method="hist", max_bin=max_bin, nthread=self.nthread)
+        self.num_boost_round = num_boost_round
+        self.continue_rounds = continue_rounds
+        self.max_bin = max_bin
+        self.dtrain = None
+        self.booster = None
+        self._n = 0
+
+    def build(self, x_all: np.ndarray, y_all: np.ndarray, ref_rows: int) -> xgb.QuantileDMatrix:
+        """
+        Quantize the full history once, with bin edges from the first ref_rows rows.
+        :param x_all: (rows, features), windows are flattened.
+        :param y_all: Targets.
+        :param ref_rows: Rows used for the quantile sketch, ie. the initial training set.
+        """
+        x_all = _as_2d(x_all)
+        with timer("xgb.quantize"):
+            ref = xgb.QuantileDMatrix(
+                x_all[:ref_rows], y_all[:ref_rows], max_bin=self.max_bin, nthread=self.nthread
+            )
+            self.dtrain = xgb.QuantileDMatrix(
+                x_all, y_all, ref=ref, max_bin=self.max_bin, nthread=self.nthread
+            )
+        self._n = len(x_all)
+        return self.dtrain
+
+    def fit_upto(self, end: int) -> xgb.Booster:
+        """
+        Train on rows [0, end) of the cached matrix.
+        """
+        weights = np.zeros(self._n, dtype=np.float32)
+        weights[:end] = 1.0
+        self.dtrain.set_weight(weights)
+        with timer("xgb.train"):
+            if self.booster is not None and self.continue_rounds:
+                self.booster = xgb.train(
+                    self.params, self.dtrain, num_boost_round=self.continue_rounds, xgb_model=self.booster
+                )
+            else:
+                self.booster = xgb.train(self.params, self.dtrain, num_boost_round=self.num_boost_round)
+        return self.booster
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """
+        Predict raw rows with the current booster.
+        """
+        with timer("xgb.predict"):
+            return self.booster.inplace_predict(_as_2d(x))
+
+    def run(
+        self,
+        x_all: np.ndarray,
+        y_all: np.ndarray,
+        step_size: int,
+        start_at: Union[int, float] = 0.8,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Walk forward: fit on the first start_at rows, then predict step_size rows at a time,
+        extending the training window over each step after predicting it.
+        :param x_all: All windows (or feature rows).
+        :param y_all: All targets.
+        :param step_size: Rows per step.
+        :param start_at: Initial training size, as a row number or fraction.
+        :return: Tuple of (predictions, targets) for the test period, as run_stepped_retrain.
+        """
+        start_at = int(len(x_all) * start_at) if start_at % 1 != 0 else int(start_at)
+        x_all = _as_2d(x_all)
+        y_all = np.asarray(y_all, dtype=np.float32).ravel()
+
+        self.booster = None
+        preds = []
+        with profile_job("xgb_walk_forward"):
+            self.build(x_all, y_all, start_at)
+            self.fit_upto(start_at)
+            for i in range(start_at, len(x_all), step_size):
+                end = min(i + step_size, len(x_all))
+                preds.append(self.predict(x_all[i:end]))
+                if end < len(x_all):
+                    self.fit_upto(end)
+                count("walk_forward_steps")
+        return np.concatenate(preds), y_all[start_at:]
+
+
+def _as_2d(x: np.ndarray) -> np.ndarray:
+    # to_sequences windows (n, seq_size, features) are flattened to one row per window.
+    x = np.asarray(x, dtype=np.float32)
+    return x.reshape(len(x), -1) if x.ndim != 2 else x